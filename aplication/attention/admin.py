@@ -8,6 +8,9 @@ from aplication.attention.models import (
     CostoAtencionDetalle,
     ExamenSolicitado,
     Pago,
+    CuentaPaciente,
+    IngresoDiario,
+    CorreoPendiente,
 )
 
 # Admin para HorarioAtencion
@@ -66,3 +69,25 @@ class PagoAdmin(admin.ModelAdmin):
     list_display = ('paciente', 'costo_atencion', 'monto', 'metodo_pago', 'pagado', 'fecha_pago')
     search_fields = ('paciente__nombre', 'costo_atencion__atencion__paciente__nombre')
     list_filter = ('metodo_pago', 'pagado', 'fecha_pago')
+
+# Admin para CuentaPaciente (solo lectura, se mantiene desde las señales)
+@admin.register(CuentaPaciente)
+class CuentaPacienteAdmin(admin.ModelAdmin):
+    list_display = ('paciente', 'total_cargos', 'total_pagado', 'saldo', 'actualizado')
+    search_fields = ('paciente__nombres', 'paciente__apellidos')
+    readonly_fields = [field.name for field in CuentaPaciente._meta.fields]
+
+# Admin para IngresoDiario (solo lectura, se mantiene desde las señales)
+@admin.register(IngresoDiario)
+class IngresoDiarioAdmin(admin.ModelAdmin):
+    list_display = ('fecha', 'metodo_pago', 'total', 'cantidad', 'actualizado')
+    list_filter = ('metodo_pago', 'fecha')
+    readonly_fields = [field.name for field in IngresoDiario._meta.fields]
+
+# Admin para CorreoPendiente (bandeja de salida de correos)
+@admin.register(CorreoPendiente)
+class CorreoPendienteAdmin(admin.ModelAdmin):
+    list_display = ('asunto', 'destinatario', 'estado', 'intentos', 'proximo_intento', 'enviado')
+    list_filter = ('estado',)
+    search_fields = ('destinatario', 'asunto')
+    readonly_fields = ('creado', 'enviado', 'error')
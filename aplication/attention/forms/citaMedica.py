@@ -2,6 +2,7 @@ from django.forms import ModelForm, ValidationError
 from django import forms
 from django.utils.timezone import now
 from aplication.attention.models import CitaMedica
+from aplication.attention.instance.disponibilidad_citas import DisponibilidadCitas, minutos
 
 # Definición de la clase CitaMedicaForm que hereda de ModelForm
 class CitaMedicaForm(ModelForm):
@@ -52,4 +53,19 @@ class CitaMedicaForm(ModelForm):
         if not hora_cita:
             raise ValidationError("Debe ingresar una hora para la cita.")
         
-        return hora_cita
\ No newline at end of file
+        return hora_cita
+
+    # La cita debe quedar dentro del horario de atención y no cruzarse con otra
+    # (solo si hay horarios de atención registrados; las citas canceladas no se validan)
+    def clean(self):
+        cleaned_data = super().clean()
+        fecha = cleaned_data.get("fecha")
+        hora_cita = cleaned_data.get("hora_cita")
+        if fecha and hora_cita and cleaned_data.get("estado") != 'C':
+            disponibilidad = DisponibilidadCitas()
+            if disponibilidad.horarios:
+                if not disponibilidad.en_horario(fecha, minutos(hora_cita)):
+                    self.add_error("hora_cita", "La hora está fuera del horario de atención.")
+                elif not disponibilidad.esta_disponible(fecha, hora_cita, self.instance.pk):
+                    self.add_error("hora_cita", "Ya existe una cita en ese horario.")
+        return cleaned_data
@@ -0,0 +1,99 @@
+import datetime
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.utils import timezone
+from aplication.attention.models import CorreoPendiente
+
+
+class BandejaCorreo:
+    # segundos que un worker se reserva un lote antes de que otro pueda tomarlo
+    TIEMPO_RESERVA = 5 * 60
+
+    @staticmethod
+    # guarda el correo en la transacción actual y, cuando se confirma, avisa al worker;
+    # si la transacción se revierte el correo desaparece con ella
+    def encolar(asunto, mensaje, destinatario):
+        if not destinatario:
+            return None
+        correo = CorreoPendiente.objects.create(asunto=asunto, mensaje=mensaje, destinatario=destinatario)
+        from aplication.attention.tasks import enviar_correos
+        transaction.on_commit(enviar_correos.delay, robust=True)
+        return correo
+
+    @staticmethod
+    # igual que encolar para varios correos (asunto, mensaje, destinatario) con un solo INSERT
+    # y un solo aviso al worker
+    def encolar_lote(correos):
+        correos = CorreoPendiente.objects.bulk_create([
+            CorreoPendiente(asunto=asunto, mensaje=mensaje, destinatario=destinatario)
+            for asunto, mensaje, destinatario in correos if destinatario
+        ])
+        if correos:
+            from aplication.attention.tasks import enviar_correos
+            transaction.on_commit(enviar_correos.delay, robust=True)
+        return correos
+
+    @staticmethod
+    # reserva hasta `limite` correos vencidos; con skip_locked varios workers no toman los mismos
+    def reservar(limite):
+        ahora = timezone.now()
+        with transaction.atomic():
+            ids = list(
+                CorreoPendiente.objects.select_for_update(skip_locked=True)
+                .filter(estado='P', proximo_intento__lte=ahora)
+                .order_by('proximo_intento', 'id')
+                .values_list('id', flat=True)[:limite]
+            )
+            CorreoPendiente.objects.filter(id__in=ids).update(
+                proximo_intento=ahora + datetime.timedelta(seconds=BandejaCorreo.TIEMPO_RESERVA)
+            )
+        return list(CorreoPendiente.objects.filter(id__in=ids).order_by('id'))
+
+    @staticmethod
+    # espera antes del siguiente intento: base, 2*base, 4*base... (segundos)
+    def get_espera(intentos):
+        return settings.EMAIL_OUTBOX_RETRY_SECONDS * 2 ** (intentos - 1)
+
+    @staticmethod
+    # envía un lote reutilizando una sola conexión SMTP; devuelve (enviados, fallidos)
+    def enviar_lote(limite=None):
+        correos = BandejaCorreo.reservar(limite or settings.EMAIL_OUTBOX_BATCH_SIZE)
+        if not correos:
+            return 0, 0
+        enviados = fallidos = 0
+        conexion = get_connection(fail_silently=False)
+        try:
+            conexion.open()
+            for correo in correos:
+                mensaje = EmailMessage(correo.asunto, correo.mensaje, None, [correo.destinatario], connection=conexion)
+                try:
+                    mensaje.send()
+                except Exception as ex:
+                    BandejaCorreo.registrar_fallo(correo, ex)
+                    fallidos += 1
+                else:
+                    correo.estado = 'E'
+                    correo.enviado = timezone.now()
+                    correo.intentos += 1
+                    correo.error = ''
+                    correo.save(update_fields=['estado', 'enviado', 'intentos', 'error'])
+                    enviados += 1
+        except Exception as ex:
+            # no se pudo abrir la conexión: todo el lote se reintenta más tarde
+            for correo in correos[enviados + fallidos:]:
+                BandejaCorreo.registrar_fallo(correo, ex)
+                fallidos += 1
+        finally:
+            conexion.close()
+        return enviados, fallidos
+
+    @staticmethod
+    def registrar_fallo(correo, error):
+        correo.intentos += 1
+        correo.error = str(error)
+        if correo.intentos >= settings.EMAIL_OUTBOX_MAX_ATTEMPTS:
+            correo.estado = 'F'
+        else:
+            correo.proximo_intento = timezone.now() + datetime.timedelta(seconds=BandejaCorreo.get_espera(correo.intentos))
+        correo.save(update_fields=['estado', 'intentos', 'error', 'proximo_intento'])
@@ -0,0 +1,145 @@
+import datetime
+import hashlib
+import secrets
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Max
+from django.utils import timezone
+from aplication.attention.instance.disponibilidad_citas import DisponibilidadCitas
+from aplication.attention.models import CitaMedica, SuscripcionCalendario
+from doctor.utils import get_version_datos
+
+# estado de la cita -> STATUS del evento (las canceladas se envían para que el cliente las quite)
+ESTADOS_ICS = {'P': 'CONFIRMED', 'R': 'CONFIRMED', 'C': 'CANCELLED'}
+
+
+# texto escapado según RFC 5545
+def escapar(texto):
+    return str(texto).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,').replace('\n', '\\n')
+
+
+# formato UTC de iCalendar (AAAAMMDDTHHMMSSZ)
+def fecha_utc(momento):
+    return momento.astimezone(datetime.timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+
+# las líneas de más de 75 octetos se parten y continúan con un espacio
+def linea(texto):
+    datos = texto.encode('utf-8')
+    partes = []
+    while len(datos) > 75:
+        corte = 75 if not partes else 74
+        # no cortar en medio de un carácter UTF-8
+        while (datos[corte] & 0xC0) == 0x80:
+            corte -= 1
+        partes.append(datos[:corte].decode('utf-8'))
+        datos = datos[corte:]
+    partes.append(datos.decode('utf-8'))
+    return '\r\n '.join(partes) + '\r\n'
+
+
+class CalendarioCitas:
+    # El calendario se arma por días. Cada día tiene una firma (última modificación y
+    # número de citas) que se obtiene para todo el rango en una sola consulta agrupada;
+    # el texto de cada día se guarda en caché con su firma, así solo se regeneran los
+    # días que cambiaron y el ETag sale de las firmas sin leer ninguna cita.
+
+    def __init__(self, hoy=None):
+        hoy = hoy or timezone.localdate()
+        self.desde = hoy - datetime.timedelta(days=settings.ICS_FEED_PAST_DAYS)
+        self.hasta = hoy + datetime.timedelta(days=settings.ICS_FEED_FUTURE_DAYS)
+        self.duracion = DisponibilidadCitas.get_duracion()
+        # el resumen lleva el nombre del paciente: si cambian los pacientes se regenera todo
+        self.version = f"{get_version_datos('pacientes')}_{self.duracion}"
+        self.firmas = self.get_firmas()
+
+    @staticmethod
+    # token del usuario para la URL del calendario (los clientes de calendario no envían
+    # la sesión); es aleatorio y se guarda en SuscripcionCalendario, se crea la primera vez
+    def get_token(user):
+        suscripcion, _ = SuscripcionCalendario.objects.get_or_create(
+            usuario=user, defaults={'token': secrets.token_urlsafe(32)}
+        )
+        return suscripcion.token
+
+    @staticmethod
+    # genera un token nuevo: la dirección anterior deja de funcionar (por ejemplo, si se filtró)
+    def renovar_token(user):
+        token = secrets.token_urlsafe(32)
+        SuscripcionCalendario.objects.update_or_create(usuario=user, defaults={'token': token})
+        return token
+
+    @staticmethod
+    # usuario activo dueño del token, o None si el token no existe o fue renovado
+    def get_usuario(token):
+        suscripcion = SuscripcionCalendario.objects.select_related('usuario').filter(
+            token=token, usuario__is_active=True
+        ).first()
+        return suscripcion.usuario if suscripcion else None
+
+    # fecha -> (última modificación, citas) de los días del rango que tienen citas
+    def get_firmas(self):
+        filas = CitaMedica.objects.filter(fecha__gte=self.desde, fecha__lte=self.hasta).values('fecha').annotate(
+            ultima=Max('actualizado'), total=Count('id')
+        ).order_by('fecha')
+        return {fila['fecha']: (fila['ultima'], fila['total']) for fila in filas}
+
+    def get_ultima_modificacion(self):
+        return max((ultima for ultima, _ in self.firmas.values()), default=None)
+
+    def get_etag(self):
+        partes = [self.desde.isoformat(), self.hasta.isoformat(), self.version]
+        partes += [f"{fecha.isoformat()}:{ultima.timestamp()}:{total}" for fecha, (ultima, total) in self.firmas.items()]
+        return '"{}"'.format(hashlib.sha256('|'.join(partes).encode()).hexdigest()[:32])
+
+    def get_clave(self, fecha):
+        ultima, total = self.firmas[fecha]
+        return f"calendario_citas_{fecha.isoformat()}_{ultima.timestamp()}_{total}_{self.version}"
+
+    def get_evento(self, cita):
+        inicio = timezone.make_aware(datetime.datetime.combine(cita.fecha, cita.hora_cita))
+        fin = inicio + datetime.timedelta(minutes=self.duracion)
+        lineas = [
+            'BEGIN:VEVENT',
+            f'UID:cita-{cita.pk}@sistema-medico',
+            f'DTSTAMP:{fecha_utc(cita.actualizado)}',
+            f'LAST-MODIFIED:{fecha_utc(cita.actualizado)}',
+            f'DTSTART:{fecha_utc(inicio)}',
+            f'DTEND:{fecha_utc(fin)}',
+            f'SUMMARY:{escapar(f"Cita: {cita.paciente.nombre_completo}")}',
+            f'DESCRIPTION:{escapar(f"Estado: {cita.get_estado_display()}")}',
+            f'STATUS:{ESTADOS_ICS.get(cita.estado, "TENTATIVE")}',
+            'END:VEVENT',
+        ]
+        return ''.join(linea(texto) for texto in lineas)
+
+    # texto de cada día: los que están en caché se toman de ella y el resto se genera
+    # con una sola consulta y se guarda para la próxima petición
+    def get_dias(self):
+        claves = {self.get_clave(fecha): fecha for fecha in self.firmas}
+        dias = {claves[clave]: texto for clave, texto in cache.get_many(claves.keys()).items()}
+        faltantes = [fecha for fecha in self.firmas if fecha not in dias]
+        if faltantes:
+            nuevos = {fecha: [] for fecha in faltantes}
+            citas = CitaMedica.objects.filter(fecha__in=faltantes).select_related('paciente').order_by('fecha', 'hora_cita', 'id')
+            for cita in citas.iterator(chunk_size=500):
+                nuevos[cita.fecha].append(self.get_evento(cita))
+            nuevos = {fecha: ''.join(eventos) for fecha, eventos in nuevos.items()}
+            cache.set_many({self.get_clave(fecha): texto for fecha, texto in nuevos.items()}, settings.ICS_FEED_CACHE_TTL)
+            dias.update(nuevos)
+        return dias
+
+    # partes del archivo .ics en orden, para enviarlas con una respuesta por partes
+    def generar(self):
+        yield ''.join(linea(texto) for texto in [
+            'BEGIN:VCALENDAR',
+            'VERSION:2.0',
+            'PRODID:-//Sistema Medico//Citas//ES',
+            'CALSCALE:GREGORIAN',
+            'METHOD:PUBLISH',
+            'X-WR-CALNAME:Citas médicas',
+        ])
+        dias = self.get_dias()
+        for fecha in sorted(dias):
+            yield dias[fecha]
+        yield linea('END:VCALENDAR')
@@ -0,0 +1,71 @@
+import hashlib
+from io import BytesIO
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.template.loader import get_template
+
+
+class ComprobantePago:
+    PLANTILLA = 'attention/pago/comprobante.html'
+    CARPETA = 'comprobantes'
+
+    @staticmethod
+    # huella del código de la plantilla: al cambiar la plantilla cambian todas las rutas
+    # (la plantilla ya compilada la guarda el cargador de Django, aquí solo se calcula el hash)
+    def get_version_plantilla():
+        return hashlib.sha256(get_template(ComprobantePago.PLANTILLA).template.source.encode()).hexdigest()
+
+    @staticmethod
+    # contexto con el que se dibuja el comprobante
+    def get_contexto(pago):
+        return {
+            'pago': pago,
+            'total_pagado': pago.monto,
+        }
+
+    @staticmethod
+    # huella de todo lo que aparece en el comprobante; el archivo se guarda con este nombre,
+    # así un pago que no cambia siempre apunta al mismo PDF
+    def get_huella(pago):
+        datos = [
+            ComprobantePago.get_version_plantilla(),
+            pago.pk,
+            pago.paciente,
+            pago.fecha_pago.isoformat() if pago.fecha_pago else '',
+            pago.monto,
+            pago.metodo_pago,
+            pago.pagado,
+            pago.costo_atencion.total,
+        ]
+        return hashlib.sha256('|'.join(str(dato) for dato in datos).encode()).hexdigest()
+
+    @staticmethod
+    def get_nombre(huella):
+        return f"{ComprobantePago.CARPETA}/{huella}.pdf"
+
+    @staticmethod
+    def get_nombre_descarga(pago):
+        return f"comprobante_pago_{pago.pk}.pdf"
+
+    @staticmethod
+    def renderizar_html(pago):
+        return get_template(ComprobantePago.PLANTILLA).render(ComprobantePago.get_contexto(pago))
+
+    @staticmethod
+    def renderizar_pdf(html):
+        # weasyprint necesita librerías del sistema: solo se carga cuando hay que dibujar un PDF
+        from weasyprint import HTML
+        pdf = BytesIO()
+        HTML(string=html).write_pdf(pdf)
+        return pdf.getvalue()
+
+    @staticmethod
+    # devuelve el nombre del PDF del pago en el almacenamiento; solo lo dibuja si aún no existe
+    def obtener(pago, huella=None):
+        nombre = ComprobantePago.get_nombre(huella or ComprobantePago.get_huella(pago))
+        if not default_storage.exists(nombre):
+            pdf = ComprobantePago.renderizar_pdf(ComprobantePago.renderizar_html(pago))
+            # otro proceso pudo guardarlo mientras se dibujaba: el contenido es el mismo
+            if not default_storage.exists(nombre):
+                default_storage.save(nombre, ContentFile(pdf))
+        return nombre
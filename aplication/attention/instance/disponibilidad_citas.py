@@ -0,0 +1,94 @@
+import bisect
+import datetime
+from django.utils import timezone
+from aplication.attention.models import CitaMedica, HorarioAtencion
+from aplication.core.models import Doctor
+from doctor.const import DIA_SEMANA_CHOICES
+
+# clave de HorarioAtencion.dia_semana para cada date.weekday() (0 = lunes)
+DIAS = [dia for dia, _ in DIA_SEMANA_CHOICES]
+DURACION_DEFECTO = 30
+
+
+def minutos(hora):
+    return hora.hour * 60 + hora.minute
+
+
+def hora(minutos):
+    return datetime.time(minutos // 60, minutos % 60)
+
+
+class DisponibilidadCitas:
+    # Los horarios se manejan en minutos desde la medianoche. Cada cita ocupa
+    # [hora_cita, hora_cita + duración); las horas ocupadas de cada día se guardan
+    # ordenadas y los choques se buscan con bisect.
+
+    def __init__(self, duracion=None):
+        self.duracion = duracion or DisponibilidadCitas.get_duracion()
+        self.horarios = DisponibilidadCitas.get_horarios()
+
+    @staticmethod
+    # duración de la cita del doctor activo (Doctor.duracion_cita)
+    def get_duracion():
+        duracion = Doctor.objects.filter(activo=True).order_by('id').values_list('duracion_cita', flat=True).first()
+        return duracion if duracion and duracion > 0 else DURACION_DEFECTO
+
+    @staticmethod
+    # día -> tramos de atención [(inicio, fin)] sin el intervalo de descanso, en una consulta
+    def get_horarios():
+        horarios = {}
+        for horario in HorarioAtencion.objects.filter(activo=True):
+            inicio, fin = minutos(horario.hora_inicio), minutos(horario.hora_fin)
+            desde, hasta = minutos(horario.Intervalo_desde), minutos(horario.Intervalo_hasta)
+            tramos = [(inicio, min(desde, fin)), (max(hasta, inicio), fin)] if desde < hasta else [(inicio, fin)]
+            horarios[horario.dia_semana] = [(a, b) for a, b in tramos if a < b]
+        return horarios
+
+    @staticmethod
+    # fecha -> inicios ocupados ordenados de las citas no canceladas del rango, en una consulta
+    def get_ocupadas(desde, hasta, excluir=None):
+        citas = CitaMedica.objects.filter(fecha__gte=desde, fecha__lte=hasta).exclude(estado='C')
+        if excluir:
+            citas = citas.exclude(pk=excluir)
+        ocupadas = {}
+        # ordenadas por el índice (fecha, hora_cita): cada lista queda ya ordenada
+        for fecha, hora_cita in citas.order_by('fecha', 'hora_cita').values_list('fecha', 'hora_cita'):
+            ocupadas.setdefault(fecha, []).append(minutos(hora_cita))
+        return ocupadas
+
+    # True si [inicio, inicio + duración) no se cruza con ninguna cita ocupada:
+    # la primera ocupada posterior a inicio - duración debe empezar después del fin
+    def libre(self, ocupadas, inicio):
+        i = bisect.bisect_right(ocupadas, inicio - self.duracion)
+        return i == len(ocupadas) or ocupadas[i] >= inicio + self.duracion
+
+    # True si [inicio, inicio + duración) cabe en un tramo de atención del día
+    def en_horario(self, fecha, inicio):
+        return any(a <= inicio and inicio + self.duracion <= b for a, b in self.horarios.get(DIAS[fecha.weekday()], []))
+
+    # horas libres de cada día del rango; los días sin horario de atención devuelven una lista vacía
+    def calcular(self, desde, hasta, excluir=None):
+        ocupadas = DisponibilidadCitas.get_ocupadas(desde, hasta, excluir)
+        ahora = timezone.localtime()
+        dias = []
+        fecha = desde
+        while fecha <= hasta:
+            # en el día de hoy no se ofrecen horas pasadas
+            minimo = minutos(ahora) + 1 if fecha == ahora.date() else 0
+            ocupadas_dia = ocupadas.get(fecha, [])
+            libres = []
+            if fecha >= ahora.date():
+                for a, b in self.horarios.get(DIAS[fecha.weekday()], []):
+                    for inicio in range(a, b - self.duracion + 1, self.duracion):
+                        if inicio >= minimo and self.libre(ocupadas_dia, inicio):
+                            libres.append(hora(inicio).strftime('%H:%M'))
+            dias.append({'fecha': fecha.isoformat(), 'dia': DIAS[fecha.weekday()], 'horas': libres})
+            fecha += datetime.timedelta(days=1)
+        return dias
+
+    # la hora pedida está dentro del horario de atención y no se cruza con otra cita
+    def esta_disponible(self, fecha, hora_cita, excluir=None):
+        inicio = minutos(hora_cita)
+        if not self.en_horario(fecha, inicio):
+            return False
+        return self.libre(DisponibilidadCitas.get_ocupadas(fecha, fecha, excluir).get(fecha, []), inicio)
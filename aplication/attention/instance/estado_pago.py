@@ -0,0 +1,36 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
+from aplication.core.models import Paciente
+from aplication.attention.models import Atencion, Pago
+
+
+class EstadoPago:
+    CLAVE = 'estado_pago_{}'
+
+    @staticmethod
+    def get_clave(paciente_id):
+        return EstadoPago.CLAVE.format(paciente_id)
+
+    @staticmethod
+    # estado de pago de varios pacientes: lo que está en caché se responde desde ahí
+    # y el resto se resuelve con una sola consulta EXISTS; los pacientes inexistentes no aparecen
+    def consultar(paciente_ids):
+        claves = {EstadoPago.get_clave(pk): pk for pk in paciente_ids}
+        en_cache = cache.get_many(claves.keys())
+        estados = {claves[clave]: estado for clave, estado in en_cache.items()}
+
+        faltantes = [pk for pk in paciente_ids if pk not in estados]
+        if faltantes:
+            filas = Paciente.objects.filter(pk__in=faltantes).annotate(
+                tiene_atencion=Exists(Atencion.objects.filter(paciente=OuterRef('pk'))),
+                ha_pagado=Exists(Pago.objects.filter(paciente=OuterRef('pk'), pagado=True)),
+            ).values('pk', 'tiene_atencion', 'ha_pagado')
+            nuevos = {fila.pop('pk'): fila for fila in filas}
+            cache.set_many({EstadoPago.get_clave(pk): estado for pk, estado in nuevos.items()}, settings.PAYMENT_STATUS_CACHE_TTL)
+            estados.update(nuevos)
+        return estados
+
+    @staticmethod
+    def invalidar(paciente_ids):
+        cache.delete_many([EstadoPago.get_clave(pk) for pk in paciente_ids if pk is not None])
@@ -0,0 +1,136 @@
+import os
+import threading
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from aplication.attention.models import Pago
+from aplication.attention.instance.comprobante_pago import ComprobantePago
+
+
+# Buffer de solo escritura: zipfile escribe en él y el generador vacía lo acumulado
+# después de cada archivo, así el ZIP nunca está completo en memoria
+class _BufferZip:
+    def __init__(self):
+        self.partes = []
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        return len(datos)
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self.partes)
+        self.partes = []
+        return datos
+
+
+class ExportacionComprobantes:
+    CLAVE_PROGRESO = 'exportacion_comprobantes_{}'
+    TIEMPO_PROGRESO = 60 * 60
+
+    _pool = None
+    _candado = threading.Lock()
+
+    def __init__(self, fecha_inicio=None, fecha_fin=None, metodo_pago=None, token=None):
+        self.fecha_inicio = fecha_inicio
+        self.fecha_fin = fecha_fin
+        self.metodo_pago = metodo_pago
+        self.token = token
+        self.procesos = settings.RECEIPT_EXPORT_WORKERS or os.cpu_count() or 1
+        # comprobantes que se dibujan juntos en el pool antes de escribirlos al ZIP
+        self.tamano_lote = self.procesos * 4
+
+    @classmethod
+    # pool de procesos compartido por todas las exportaciones del proceso: las exportaciones
+    # simultáneas se reparten los mismos procesos en lugar de lanzar un pool cada una
+    def get_pool(cls):
+        if cls._pool is None:
+            with cls._candado:
+                if cls._pool is None:
+                    cls._pool = ProcessPoolExecutor(max_workers=settings.RECEIPT_EXPORT_WORKERS or os.cpu_count() or 1)
+        return cls._pool
+
+    def get_queryset(self):
+        # solo pagos confirmados: los de PayPal existen sin pagar hasta que la pasarela los confirma
+        pagos = Pago.objects.filter(pagado=True).select_related('paciente', 'costo_atencion').order_by('fecha_pago', 'pk')
+        if self.fecha_inicio:
+            pagos = pagos.filter(fecha_pago__date__gte=self.fecha_inicio)
+        if self.fecha_fin:
+            pagos = pagos.filter(fecha_pago__date__lte=self.fecha_fin)
+        if self.metodo_pago:
+            pagos = pagos.filter(metodo_pago=self.metodo_pago)
+        return pagos
+
+    def get_nombre_archivo(self):
+        partes = ['comprobantes']
+        if self.fecha_inicio:
+            partes.append(self.fecha_inicio.isoformat())
+        if self.fecha_fin:
+            partes.append(self.fecha_fin.isoformat())
+        if self.metodo_pago:
+            partes.append(self.metodo_pago.lower())
+        return '_'.join(partes) + '.zip'
+
+    @staticmethod
+    def get_progreso(token):
+        return cache.get(ExportacionComprobantes.CLAVE_PROGRESO.format(token))
+
+    def guardar_progreso(self, total, procesados, terminado=False):
+        if self.token:
+            cache.set(
+                self.CLAVE_PROGRESO.format(self.token),
+                {'total': total, 'procesados': procesados, 'terminado': terminado},
+                self.TIEMPO_PROGRESO
+            )
+
+    def lotes(self, pagos):
+        lote = []
+        for pago in pagos.iterator(chunk_size=self.tamano_lote):
+            lote.append(pago)
+            if len(lote) == self.tamano_lote:
+                yield lote
+                lote = []
+        if lote:
+            yield lote
+
+    # PDFs de un lote: los ya guardados se leen del almacenamiento y el resto
+    # se dibuja en el pool (el HTML se prepara aquí, el proceso hijo solo ejecuta WeasyPrint)
+    def pdfs_lote(self, lote):
+        nombres = [ComprobantePago.get_nombre(ComprobantePago.get_huella(pago)) for pago in lote]
+        pendientes = {
+            i: self.get_pool().submit(ComprobantePago.renderizar_pdf, ComprobantePago.renderizar_html(pago))
+            for i, (pago, nombre) in enumerate(zip(lote, nombres))
+            if not default_storage.exists(nombre)
+        }
+        for i, (pago, nombre) in enumerate(zip(lote, nombres)):
+            if i in pendientes:
+                pdf = pendientes[i].result()
+                if not default_storage.exists(nombre):
+                    default_storage.save(nombre, ContentFile(pdf))
+            else:
+                with default_storage.open(nombre, 'rb') as archivo:
+                    pdf = archivo.read()
+            yield pago, pdf
+
+    # genera el ZIP por partes para StreamingHttpResponse
+    def generar_zip(self):
+        pagos = self.get_queryset()
+        total = pagos.count()
+        procesados = 0
+        self.guardar_progreso(total, procesados)
+
+        buffer = _BufferZip()
+        with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_STORED) as archivo_zip:
+            for lote in self.lotes(pagos):
+                for pago, pdf in self.pdfs_lote(lote):
+                    archivo_zip.writestr(ComprobantePago.get_nombre_descarga(pago), pdf)
+                    yield buffer.vaciar()
+                procesados += len(lote)
+                self.guardar_progreso(total, procesados)
+        self.guardar_progreso(total, procesados, terminado=True)
+        yield buffer.vaciar()
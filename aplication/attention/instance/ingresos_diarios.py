@@ -0,0 +1,54 @@
+import datetime
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from aplication.attention.models import IngresoDiario, Pago
+
+
+class IngresosDiarios:
+    @staticmethod
+    # limites [inicio, fin) del día en la zona horaria actual; filtrar por rango sobre
+    # fecha_pago usa el índice (pagado, fecha_pago), a diferencia de fecha_pago__date
+    def get_rango(fecha_inicio, fecha_fin=None):
+        fecha_fin = fecha_fin or fecha_inicio
+        zona = timezone.get_current_timezone()
+        inicio = timezone.make_aware(datetime.datetime.combine(fecha_inicio, datetime.time.min), zona)
+        fin = timezone.make_aware(datetime.datetime.combine(fecha_fin + datetime.timedelta(days=1), datetime.time.min), zona)
+        return inicio, fin
+
+    @staticmethod
+    # día y método al que pertenece un pago (None si no está confirmado)
+    def get_clave(pago):
+        if not pago.pagado or pago.fecha_pago is None:
+            return None
+        return timezone.localdate(pago.fecha_pago), pago.metodo_pago
+
+    @staticmethod
+    # recalcula los ingresos de los pares (fecha, metodo_pago) indicados
+    def actualizar(claves):
+        with transaction.atomic():
+            for fecha, metodo_pago in sorted(clave for clave in claves if clave):
+                inicio, fin = IngresosDiarios.get_rango(fecha)
+                resumen = Pago.objects.filter(
+                    pagado=True, fecha_pago__gte=inicio, fecha_pago__lt=fin, metodo_pago=metodo_pago
+                ).aggregate(total=Sum('monto'), cantidad=Count('id'))
+                IngresoDiario.objects.update_or_create(
+                    fecha=fecha, metodo_pago=metodo_pago,
+                    defaults={'total': resumen['total'] or 0, 'cantidad': resumen['cantidad']}
+                )
+
+    @staticmethod
+    # reconstruye los días del rango con una sola consulta agrupada
+    def reconstruir(fecha_inicio, fecha_fin):
+        inicio, fin = IngresosDiarios.get_rango(fecha_inicio, fecha_fin)
+        filas = Pago.objects.filter(pagado=True, fecha_pago__gte=inicio, fecha_pago__lt=fin).annotate(
+            dia=TruncDate('fecha_pago')
+        ).order_by().values('dia', 'metodo_pago').annotate(total=Sum('monto'), cantidad=Count('id'))
+        with transaction.atomic():
+            IngresoDiario.objects.filter(fecha__gte=fecha_inicio, fecha__lte=fecha_fin).delete()
+            ingresos = IngresoDiario.objects.bulk_create([
+                IngresoDiario(fecha=fila['dia'], metodo_pago=fila['metodo_pago'], total=fila['total'], cantidad=fila['cantidad'])
+                for fila in filas
+            ])
+        return len(ingresos)
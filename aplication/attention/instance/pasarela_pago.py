@@ -0,0 +1,177 @@
+import threading
+import time
+from abc import ABC, abstractmethod
+import uuid
+from urllib.parse import urlencode
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from django.conf import settings
+from django.core.cache import cache
+
+
+class ErrorPasarela(Exception):
+    pass
+
+
+class PasarelaPago(ABC):
+    @abstractmethod
+    # crea el cobro en la pasarela y devuelve (payment_id, url de aprobación)
+    def crear_pago(self, pago, return_url, cancel_url):
+        pass
+
+    @abstractmethod
+    # confirma un cobro aprobado por el pagador; devuelve True si quedó pagado
+    def ejecutar_pago(self, payment_id, payer_id):
+        pass
+
+    @staticmethod
+    # clave de idempotencia: reintentar la misma operación sobre el mismo pago
+    # nunca genera un segundo cobro en la pasarela
+    def get_clave_idempotencia(operacion, *partes):
+        return '-'.join(['pago', operacion] + [str(parte) for parte in partes])
+
+    @staticmethod
+    # cuerpo del cobro tal como lo espera la API de pagos de PayPal
+    def get_datos_pago(pago, return_url, cancel_url):
+        total = f"{pago.monto:.2f}"
+        return {
+            "intent": "sale",
+            "payer": {"payment_method": "paypal"},
+            "redirect_urls": {"return_url": return_url, "cancel_url": cancel_url},
+            "transactions": [{
+                "item_list": {"items": [{
+                    "name": "Pago Médico",
+                    "sku": "001",
+                    "price": total,
+                    "currency": "USD",
+                    "quantity": 1
+                }]},
+                "amount": {"total": total, "currency": "USD"},
+                "description": "Pago de servicios médicos",
+                "invoice_number": str(pago.pk),
+            }]
+        }
+
+
+class PasarelaPayPal(PasarelaPago):
+    URLS = {
+        'sandbox': 'https://api.sandbox.paypal.com',
+        'live': 'https://api.paypal.com',
+    }
+    CLAVE_TOKEN = 'paypal_access_token'
+
+    _sesion = None
+    _candado = threading.Lock()
+
+    def __init__(self):
+        self.url_base = self.URLS.get(settings.PAYPAL_MODE, self.URLS['sandbox'])
+        self.timeout = (settings.PAYMENT_GATEWAY_CONNECT_TIMEOUT, settings.PAYMENT_GATEWAY_READ_TIMEOUT)
+
+    @classmethod
+    # sesión HTTP compartida por el proceso: reutiliza las conexiones TLS con PayPal.
+    # Los POST se reintentan porque todos llevan clave de idempotencia.
+    def get_sesion(cls):
+        if cls._sesion is None:
+            with cls._candado:
+                if cls._sesion is None:
+                    reintentos = Retry(
+                        total=2, backoff_factor=0.5,
+                        status_forcelist=(502, 503, 504),
+                        allowed_methods=frozenset(['GET', 'POST'])
+                    )
+                    sesion = requests.Session()
+                    sesion.mount('https://', HTTPAdapter(pool_connections=4, pool_maxsize=20, max_retries=reintentos))
+                    cls._sesion = sesion
+        return cls._sesion
+
+    # token OAuth compartido en la caché hasta poco antes de que expire
+    def get_token(self):
+        token = cache.get(self.CLAVE_TOKEN)
+        if token:
+            return token
+        datos = self.enviar(
+            'post', '/v1/oauth2/token',
+            auth=(settings.PAYPAL_CLIENT_ID, settings.PAYPAL_SECRET),
+            data={'grant_type': 'client_credentials'},
+        )
+        cache.set(self.CLAVE_TOKEN, datos['access_token'], max(int(datos.get('expires_in', 0)) - 60, 0))
+        return datos['access_token']
+
+    def enviar(self, metodo, ruta, clave_idempotencia=None, **kwargs):
+        headers = kwargs.pop('headers', {})
+        if 'auth' not in kwargs:
+            headers['Authorization'] = f"Bearer {self.get_token()}"
+        if clave_idempotencia:
+            headers['PayPal-Request-Id'] = clave_idempotencia
+        try:
+            respuesta = self.get_sesion().request(
+                metodo, self.url_base + ruta, headers=headers, timeout=self.timeout, **kwargs
+            )
+        except requests.RequestException as e:
+            raise ErrorPasarela(f"No se pudo contactar con PayPal: {e}") from e
+        if respuesta.status_code == 401:
+            cache.delete(self.CLAVE_TOKEN)
+        if respuesta.status_code >= 400:
+            try:
+                mensaje = respuesta.json().get('message') or respuesta.text
+            except ValueError:
+                mensaje = respuesta.text
+            raise ErrorPasarela(mensaje or f"PayPal respondió {respuesta.status_code}")
+        return respuesta.json()
+
+    def crear_pago(self, pago, return_url, cancel_url):
+        datos = self.enviar(
+            'post', '/v1/payments/payment',
+            clave_idempotencia=self.get_clave_idempotencia('crear', pago.pk, f"{pago.monto:.2f}"),
+            json=self.get_datos_pago(pago, return_url, cancel_url),
+        )
+        approval_url = next((link['href'] for link in datos.get('links', []) if link.get('rel') == 'approval_url'), None)
+        if not approval_url:
+            raise ErrorPasarela("PayPal no devolvió la URL de aprobación.")
+        return datos['id'], approval_url
+
+    def ejecutar_pago(self, payment_id, payer_id):
+        datos = self.enviar(
+            'post', f'/v1/payments/payment/{payment_id}/execute',
+            clave_idempotencia=self.get_clave_idempotencia('ejecutar', payment_id),
+            json={'payer_id': payer_id},
+        )
+        return datos.get('state') == 'approved'
+
+
+# Pasarela que simula PayPal sin salir a la red: aprueba todos los cobros y redirige
+# directamente a la URL de retorno. Sirve para desarrollo y pruebas de carga sin conexión.
+class PasarelaLocal(PasarelaPago):
+    PAYER_ID = 'LOCAL-PAYER'
+
+    def __init__(self):
+        self.latencia = settings.PAYMENT_GATEWAY_LOCAL_LATENCY
+
+    def simular_latencia(self):
+        if self.latencia:
+            time.sleep(self.latencia)
+
+    def crear_pago(self, pago, return_url, cancel_url):
+        self.simular_latencia()
+        payment_id = f"LOCAL-{pago.pk}-{uuid.uuid4().hex[:12]}"
+        separador = '&' if '?' in return_url else '?'
+        return payment_id, f"{return_url}{separador}{urlencode({'paymentId': payment_id, 'PayerID': self.PAYER_ID})}"
+
+    def ejecutar_pago(self, payment_id, payer_id):
+        self.simular_latencia()
+        return payment_id.startswith('LOCAL-')
+
+
+PASARELAS = {
+    'paypal': PasarelaPayPal,
+    'local': PasarelaLocal,
+}
+
+
+# pasarela configurada en settings.PAYMENT_GATEWAY
+def get_pasarela():
+    try:
+        return PASARELAS[settings.PAYMENT_GATEWAY]()
+    except KeyError:
+        raise ErrorPasarela(f"Pasarela de pago desconocida: {settings.PAYMENT_GATEWAY}")
@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from aplication.attention.instance.bandeja_correo import BandejaCorreo
+from aplication.attention.models import CitaMedica
+
+
+class RecordatoriosCitas:
+    ASUNTO = 'Recordatorio de cita médica'
+
+    @staticmethod
+    # citas programadas del día indicado cuyo paciente tiene correo y aún sin recordatorio
+    def get_pendientes(fecha):
+        return CitaMedica.objects.select_related('paciente').filter(
+            fecha=fecha, estado='P', recordatorio_enviado__isnull=True,
+            paciente__email__isnull=False,
+        ).exclude(paciente__email='').order_by('hora_cita', 'id')
+
+    @staticmethod
+    def get_mensaje(cita):
+        mensaje = (
+            f'Estimado(a) {cita.paciente.nombre_completo},\n\n'
+            f'Le recordamos que tiene una cita médica el {cita.fecha.strftime("%d/%m/%Y")} '
+            f'a las {cita.hora_cita.strftime("%H:%M")}.\n\n'
+            'Atentamente,\nClínica SaludSync'
+        )
+        return RecordatoriosCitas.ASUNTO, mensaje, cita.paciente.email
+
+    @staticmethod
+    # encola los recordatorios en la bandeja de salida por lotes. Cada lote se reserva con
+    # select_for_update(skip_locked) y se marca como enviado en la misma transacción en la
+    # que se encolan sus correos: dos ejecuciones simultáneas no toman las mismas citas y
+    # un fallo de SMTP no repite correos (los reintentos los hace BandejaCorreo)
+    def enviar(fecha, tamano_lote=None, simular=False):
+        tamano_lote = tamano_lote or settings.EMAIL_OUTBOX_BATCH_SIZE
+        citas = RecordatoriosCitas.get_pendientes(fecha)
+        if simular:
+            return citas.count()
+
+        encolados = 0
+        while True:
+            with transaction.atomic():
+                # siempre el primer lote libre: los ya marcados dejan de cumplir el filtro
+                lote = list(citas.select_for_update(skip_locked=True, of=('self',))[:tamano_lote])
+                if not lote:
+                    break
+                CitaMedica.objects.filter(pk__in=[cita.pk for cita in lote]).update(recordatorio_enviado=timezone.now())
+                BandejaCorreo.encolar_lote([RecordatoriosCitas.get_mensaje(cita) for cita in lote])
+            encolados += len(lote)
+        return encolados
@@ -0,0 +1,192 @@
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Count, DecimalField, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from aplication.core.models import Paciente
+from aplication.attention.models import (
+    Atencion,
+    CostosAtencion,
+    CuentaPaciente,
+    DetalleAtencion,
+    ExamenSolicitado,
+    Pago,
+    ServiciosAdicionales
+)
+
+DINERO = DecimalField(max_digits=12, decimal_places=2)
+CERO = Decimal('0.00')
+
+
+# subconsulta escalar que agrega una expresion de las filas de un paciente
+def _agregado_por_paciente(queryset, campo_paciente, agregado, output_field, vacio):
+    subconsulta = (
+        queryset.filter(**{campo_paciente: OuterRef('pk')})
+        .order_by()
+        .values(campo_paciente)
+        .annotate(total=agregado)
+        .values('total')
+    )
+    return Coalesce(Subquery(subconsulta, output_field=output_field), Value(vacio), output_field=output_field)
+
+
+def _suma_por_paciente(queryset, campo_paciente, expresion):
+    return _agregado_por_paciente(
+        queryset, campo_paciente, Sum(expresion, output_field=DINERO), DINERO, CERO
+    )
+
+
+# callback de on_commit que acumula los pacientes tocados en una transaccion
+class _CuentasPendientes:
+    def __init__(self):
+        self.paciente_ids = set()
+        self.ejecutado = False
+
+    def __call__(self):
+        self.ejecutado = True
+        SaldoPaciente.actualizar_cuentas(self.paciente_ids)
+
+
+class SaldoPaciente:
+    # componentes del saldo en el orden en que se presentan al cajero
+    COMPONENTES = ('costos_atencion', 'servicios_adicionales', 'examenes', 'medicinas')
+
+    @staticmethod
+    # expresiones de cada componente del saldo, listas para anotar sobre Paciente
+    # (con prefijo para no chocar con relaciones inversas como Paciente.examenes)
+    def get_anotaciones():
+        return {
+            # solo la consulta: CostosAtencion.total ya incluye los demas componentes
+            'saldo_costos_atencion': _suma_por_paciente(
+                CostosAtencion.objects.filter(activo=True), 'atencion__paciente', F('costo_consulta')
+            ),
+            'saldo_servicios_adicionales': _suma_por_paciente(
+                ServiciosAdicionales.objects.all(), 'costo_atencion__atencion__paciente', F('costo_servicio')
+            ),
+            'saldo_examenes': _suma_por_paciente(
+                ExamenSolicitado.objects.all(), 'atencion__paciente', F('costo')
+            ),
+            'saldo_medicinas': _suma_por_paciente(
+                DetalleAtencion.objects.all(), 'atencion__paciente', F('subtotal')
+            ),
+        }
+
+    @staticmethod
+    # anotaciones completas de la cuenta: componentes, pagos confirmados y atenciones
+    def get_anotaciones_cuenta():
+        anotaciones = SaldoPaciente.get_anotaciones()
+        anotaciones['saldo_total_pagado'] = _suma_por_paciente(
+            Pago.objects.filter(pagado=True), 'paciente', F('monto')
+        )
+        anotaciones['saldo_atenciones'] = _agregado_por_paciente(
+            Atencion.objects.all(), 'paciente', Count('id'), IntegerField(), 0
+        )
+        return anotaciones
+
+    @staticmethod
+    # convierte una fila anotada con get_anotaciones en el diccionario del saldo
+    def desde_fila(fila):
+        saldo = {c: fila.get(f'saldo_{c}', CERO) for c in SaldoPaciente.COMPONENTES}
+        saldo['total_general'] = sum(saldo.values(), CERO)
+        return saldo
+
+    @staticmethod
+    # convierte una CuentaPaciente en el mismo diccionario que devuelve calcular
+    def desde_cuenta(cuenta):
+        saldo = {c: getattr(cuenta, c) for c in SaldoPaciente.COMPONENTES}
+        saldo['total_general'] = cuenta.total_cargos
+        saldo['tiene_atencion'] = cuenta.atenciones > 0
+        return saldo
+
+    @staticmethod
+    # calcula el saldo de un paciente desde las tablas origen en una sola consulta
+    def calcular(paciente_id):
+        anotaciones = SaldoPaciente.get_anotaciones_cuenta()
+        fila = Paciente.objects.filter(pk=paciente_id).annotate(
+            **anotaciones
+        ).values(*anotaciones).first() or {}
+
+        saldo = SaldoPaciente.desde_fila(fila)
+        saldo['tiene_atencion'] = fila.get('saldo_atenciones', 0) > 0
+        return saldo
+
+    @staticmethod
+    # obtiene el saldo desde el libro de cuentas (lectura por clave primaria);
+    # si el paciente aun no tiene cuenta se calcula desde las tablas origen
+    def obtener(paciente_id):
+        cuenta = CuentaPaciente.objects.filter(pk=paciente_id).first()
+        if cuenta is None:
+            return SaldoPaciente.calcular(paciente_id)
+        return SaldoPaciente.desde_cuenta(cuenta)
+
+    @staticmethod
+    # texto con el desglose de costos que se muestra en el formulario de pago
+    def get_detalle(saldo):
+        detalles = f"Costos Atención: ${saldo['costos_atencion']:.2f}\n"
+        detalles += f"Servicios Adicionales: ${saldo['servicios_adicionales']:.2f}\n"
+        detalles += f"Exámenes: ${saldo['examenes']:.2f}\n"
+        detalles += f"Medicinas: ${saldo['medicinas']:.2f}\n\n"
+        detalles += f"Total General: ${saldo['total_general']:.2f}"
+        return detalles
+
+    @staticmethod
+    # valores de CuentaPaciente para una fila anotada con get_anotaciones_cuenta
+    def get_valores_cuenta(fila):
+        saldo = SaldoPaciente.desde_fila(fila)
+        total_pagado = fila.get('saldo_total_pagado', CERO)
+        valores = {c: saldo[c] for c in SaldoPaciente.COMPONENTES}
+        valores.update(
+            atenciones=fila.get('saldo_atenciones', 0),
+            total_cargos=saldo['total_general'],
+            total_pagado=total_pagado,
+            saldo=saldo['total_general'] - total_pagado,
+        )
+        return valores
+
+    @staticmethod
+    # actualiza la cuenta de los pacientes indicados dentro de la transaccion actual;
+    # la fila se bloquea antes de recalcular para que dos escrituras concurrentes
+    # sobre el mismo paciente se apliquen en orden y ninguna se pierda
+    def actualizar_cuentas(paciente_ids):
+        paciente_ids = sorted({pk for pk in paciente_ids if pk is not None})
+        if not paciente_ids:
+            return
+        with transaction.atomic():
+            CuentaPaciente.objects.bulk_create(
+                [CuentaPaciente(paciente_id=pk) for pk in
+                 Paciente.objects.filter(pk__in=paciente_ids).values_list('pk', flat=True)],
+                ignore_conflicts=True
+            )
+            list(CuentaPaciente.objects.select_for_update().filter(pk__in=paciente_ids).order_by('pk').values_list('pk'))
+            anotaciones = SaldoPaciente.get_anotaciones_cuenta()
+            filas = Paciente.objects.filter(pk__in=paciente_ids).annotate(**anotaciones).values('pk', *anotaciones)
+            for fila in filas:
+                CuentaPaciente.objects.filter(pk=fila['pk']).update(
+                    actualizado=timezone.now(), **SaldoPaciente.get_valores_cuenta(fila)
+                )
+
+    @staticmethod
+    # agenda la actualizacion de las cuentas para cuando se confirme la transaccion:
+    # todas las filas guardadas en la misma transaccion comparten un solo callback y
+    # cada paciente se recalcula una vez; fuera de una transaccion se actualiza enseguida
+    def programar_actualizacion(paciente_ids):
+        paciente_ids = {pk for pk in paciente_ids if pk is not None}
+        if not paciente_ids:
+            return
+        conexion = transaction.get_connection()
+        for _, callback, _ in conexion.run_on_commit:
+            if isinstance(callback, _CuentasPendientes) and not callback.ejecutado:
+                callback.paciente_ids |= paciente_ids
+                return
+        pendientes = _CuentasPendientes()
+        pendientes.paciente_ids |= paciente_ids
+        transaction.on_commit(pendientes, robust=True)
+
+    @staticmethod
+    # calcula las cuentas de todos los pacientes desde las tablas origen, por lotes,
+    # sin guardarlas; rebuild_ledger las compara o las escribe
+    def calcular_cuentas(batch_size=1000):
+        anotaciones = SaldoPaciente.get_anotaciones_cuenta()
+        filas = Paciente.objects.order_by('pk').annotate(**anotaciones).values('pk', *anotaciones)
+        for fila in filas.iterator(chunk_size=batch_size):
+            yield CuentaPaciente(paciente_id=fila['pk'], **SaldoPaciente.get_valores_cuenta(fila))
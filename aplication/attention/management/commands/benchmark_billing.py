@@ -0,0 +1,240 @@
+import datetime
+import json
+import platform
+import random
+import tempfile
+import time
+import tracemalloc
+from decimal import Decimal
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+from aplication.core.models import Medicamento, Paciente, TipoMedicamento, TipoSangre
+from aplication.attention.models import (
+    Atencion,
+    CostosAtencion,
+    DetalleAtencion,
+    ExamenSolicitado,
+    Pago,
+    ServiciosAdicionales
+)
+from aplication.attention.instance.saldo_paciente import SaldoPaciente
+from aplication.security.models import User
+
+
+class _Rollback(Exception):
+    pass
+
+
+def percentil(valores, p):
+    ordenados = sorted(valores)
+    if not ordenados:
+        return 0
+    indice = max(0, min(len(ordenados) - 1, round(p / 100 * len(ordenados) + 0.5) - 1))
+    return ordenados[indice]
+
+
+class Command(BaseCommand):
+    help = (
+        "Mide el flujo de facturación (saldo, pago en efectivo, comprobante) sobre una clínica sintética. "
+        "Los datos se crean en una transacción que se revierte al terminar."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--patients', type=int, default=200, help="Pacientes sintéticos.")
+        parser.add_argument('--attentions', type=int, default=3, help="Atenciones por paciente.")
+        parser.add_argument('--medicines', type=int, default=4, help="Medicamentos recetados por atención.")
+        parser.add_argument('--iterations', type=int, default=50, help="Peticiones medidas por endpoint.")
+        parser.add_argument('--memory-samples', type=int, default=5, help="Peticiones medidas con tracemalloc por endpoint.")
+        parser.add_argument('--seed', type=int, default=1, help="Semilla de los datos aleatorios.")
+        parser.add_argument('--output', default='benchmark_billing.json', help="Archivo JSON con los resultados.")
+        parser.add_argument('--baseline', help="Resultados JSON anteriores con los que comparar.")
+        parser.add_argument('--tolerance', type=float, default=0.2, help="Aumento relativo de p95 o memoria tolerado frente a la línea base.")
+        parser.add_argument('--fail-on-regression', action='store_true', help="Termina con error si hay regresiones.")
+
+    def handle(self, *args, **options):
+        if options['iterations'] + options['memory_samples'] > options['patients']:
+            raise CommandError("--iterations + --memory-samples no puede superar a --patients (cada pago en efectivo usa un paciente distinto).")
+
+        random.seed(options['seed'])
+        setup_test_environment()
+        try:
+            with tempfile.TemporaryDirectory() as media_root, override_settings(MEDIA_ROOT=media_root):
+                try:
+                    with transaction.atomic():
+                        resultados = self.medir(options)
+                        raise _Rollback
+                except _Rollback:
+                    pass
+        finally:
+            teardown_test_environment()
+
+        informe = {
+            'fecha': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'base_datos': connection.vendor,
+            'parametros': {k: options[k] for k in ('patients', 'attentions', 'medicines', 'iterations', 'seed')},
+            'resultados': resultados,
+        }
+        with open(options['output'], 'w') as archivo:
+            json.dump(informe, archivo, indent=2)
+
+        self.mostrar(resultados)
+        self.stdout.write(f"Resultados guardados en {options['output']}")
+
+        if options['baseline']:
+            regresiones = self.comparar(resultados, options['baseline'], options['tolerance'])
+            if regresiones and options['fail_on_regression']:
+                raise CommandError(f"{regresiones} regresiones frente a {options['baseline']}.")
+
+    # clínica sintética: pacientes con atenciones, costos, servicios, exámenes y medicamentos
+    def sembrar(self, options):
+        tipo_sangre = TipoSangre.objects.create(tipo='O+', descripcion='Benchmark')
+        tipo_medicamento = TipoMedicamento.objects.create(nombre='Benchmark')
+        medicamentos = Medicamento.objects.bulk_create([
+            Medicamento(tipo=tipo_medicamento, nombre=f'Benchmark {i}', cantidad=1000, precio=Decimal(random.randint(100, 5000)) / 100)
+            for i in range(50)
+        ])
+        pacientes = Paciente.objects.bulk_create([
+            Paciente(
+                nombres=f'Paciente {i}', apellidos='Benchmark', cedula=f'{i:010d}',
+                fecha_nacimiento=datetime.date(1950, 1, 1) + datetime.timedelta(days=random.randint(0, 25000)),
+                telefono='0999999999', sexo=random.choice('MF'), estado_civil='S',
+                direccion='Benchmark', tipo_sangre=tipo_sangre
+            )
+            for i in range(options['patients'])
+        ])
+        atenciones = Atencion.objects.bulk_create([
+            Atencion(paciente=paciente, motivo_consulta='Benchmark', sintomas='Benchmark', tratamiento='Benchmark')
+            for paciente in pacientes for _ in range(options['attentions'])
+        ])
+        costos = CostosAtencion.objects.bulk_create([CostosAtencion(atencion=atencion) for atencion in atenciones])
+        ServiciosAdicionales.objects.bulk_create([
+            ServiciosAdicionales(nombre_servicio='Benchmark', costo_servicio=Decimal('5.00'), costo_atencion=costo)
+            for costo in costos
+        ])
+        ExamenSolicitado.objects.bulk_create([
+            ExamenSolicitado(nombre_examen='Benchmark', paciente=atencion.paciente, atencion=atencion, costo=Decimal('7.00'), estado='S')
+            for atencion in atenciones
+        ])
+        detalles = []
+        for atencion in atenciones:
+            for medicamento in random.sample(medicamentos, min(options['medicines'], len(medicamentos))):
+                cantidad = random.randint(1, 5)
+                detalles.append(DetalleAtencion(
+                    atencion=atencion, medicamento=medicamento, cantidad=cantidad, prescripcion='Benchmark',
+                    precio_unitario=medicamento.precio, subtotal=medicamento.precio * cantidad
+                ))
+        DetalleAtencion.objects.bulk_create(detalles, batch_size=1000)
+        SaldoPaciente.actualizar_cuentas([paciente.pk for paciente in pacientes])
+        return pacientes
+
+    # ejecuta una petición y devuelve (segundos, consultas)
+    @staticmethod
+    def ejecutar(peticion):
+        with CaptureQueriesContext(connection) as consultas:
+            inicio = time.perf_counter()
+            respuesta = peticion()
+            if getattr(respuesta, 'streaming', False):
+                b''.join(respuesta.streaming_content)
+            duracion = time.perf_counter() - inicio
+        if respuesta.status_code >= 400:
+            raise CommandError(f"La petición respondió {respuesta.status_code}.")
+        return duracion, len(consultas)
+
+    def medir_endpoint(self, peticiones, muestras_memoria):
+        duraciones = []
+        consultas = []
+        for peticion in peticiones[muestras_memoria:]:
+            duracion, cantidad = self.ejecutar(peticion)
+            duraciones.append(duracion * 1000)
+            consultas.append(cantidad)
+
+        # la memoria se mide aparte: tracemalloc distorsiona los tiempos
+        picos = []
+        for peticion in peticiones[:muestras_memoria]:
+            tracemalloc.start()
+            try:
+                self.ejecutar(peticion)
+                picos.append(tracemalloc.get_traced_memory()[1] / 1024)
+            finally:
+                tracemalloc.stop()
+
+        return {
+            'n': len(duraciones),
+            'media_ms': round(sum(duraciones) / len(duraciones), 3) if duraciones else 0,
+            'p50_ms': round(percentil(duraciones, 50), 3),
+            'p95_ms': round(percentil(duraciones, 95), 3),
+            'p99_ms': round(percentil(duraciones, 99), 3),
+            'consultas_max': max(consultas, default=0),
+            'consultas_media': round(sum(consultas) / len(consultas), 2) if consultas else 0,
+            'memoria_pico_kb': round(max(picos, default=0), 1),
+        }
+
+    def medir(self, options):
+        pacientes = self.sembrar(options)
+        usuario = User.objects.create_superuser(
+            username='benchmark', email='benchmark@example.com', password=None, first_name='Benchmark', last_name='Benchmark'
+        )
+        client = Client()
+        client.force_login(usuario)
+
+        n = options['iterations']
+        memoria = min(options['memory_samples'], n)
+        muestra = pacientes[:n + memoria]
+        resultados = {}
+
+        url_saldo = reverse('attention:obtener_costos_completos_paciente')
+        resultados['saldo_paciente'] = self.medir_endpoint(
+            [lambda p=p: client.get(url_saldo, {'paciente_id': p.pk}) for p in muestra], memoria
+        )
+
+        url_pago = reverse('attention:pago_create')
+        resultados['pago_efectivo'] = self.medir_endpoint(
+            [lambda p=p: client.post(url_pago, {'paciente': p.pk, 'metodo_pago': 'Efectivo'}) for p in muestra], memoria
+        )
+
+        # los comprobantes se dibujan la primera vez y después se sirven desde el almacenamiento
+        pagos = list(Pago.objects.order_by('pk').values_list('pk', flat=True))
+        if not pagos:
+            raise CommandError("No se registró ningún pago en efectivo.")
+        resultados['comprobante_primera_descarga'] = self.medir_endpoint(
+            [lambda pk=pk: client.get(reverse('attention:pago_comprobante', args=[pk])) for pk in pagos], memoria
+        )
+        resultados['comprobante_almacenado'] = self.medir_endpoint(
+            [lambda pk=pk: client.get(reverse('attention:pago_comprobante', args=[pk])) for pk in pagos], memoria
+        )
+        return resultados
+
+    def mostrar(self, resultados):
+        self.stdout.write(f"{'endpoint':32} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'consultas':>10} {'memoria KB':>11}")
+        for nombre, r in resultados.items():
+            self.stdout.write(
+                f"{nombre:32} {r['p50_ms']:>9} {r['p95_ms']:>9} {r['p99_ms']:>9} {r['consultas_max']:>10} {r['memoria_pico_kb']:>11}"
+            )
+
+    def comparar(self, resultados, ruta_base, tolerancia):
+        with open(ruta_base) as archivo:
+            base = json.load(archivo)['resultados']
+        regresiones = 0
+        for nombre, actual in resultados.items():
+            anterior = base.get(nombre)
+            if not anterior:
+                continue
+            problemas = []
+            if anterior['p95_ms'] and actual['p95_ms'] > anterior['p95_ms'] * (1 + tolerancia):
+                problemas.append(f"p95 {anterior['p95_ms']} -> {actual['p95_ms']} ms")
+            if actual['consultas_max'] > anterior['consultas_max']:
+                problemas.append(f"consultas {anterior['consultas_max']} -> {actual['consultas_max']}")
+            if anterior['memoria_pico_kb'] and actual['memoria_pico_kb'] > anterior['memoria_pico_kb'] * (1 + tolerancia):
+                problemas.append(f"memoria {anterior['memoria_pico_kb']} -> {actual['memoria_pico_kb']} KB")
+            if problemas:
+                regresiones += 1
+                self.stdout.write(self.style.ERROR(f"REGRESIÓN {nombre}: {', '.join(problemas)}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(f"{nombre}: sin regresiones"))
+        return regresiones
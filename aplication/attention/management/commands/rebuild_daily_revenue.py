@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max, Min
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from aplication.attention.models import Pago
+from aplication.attention.instance.ingresos_diarios import IngresosDiarios
+
+
+class Command(BaseCommand):
+    help = "Reconstruye los ingresos diarios (IngresoDiario) desde los pagos confirmados."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help="Primer día a reconstruir (AAAA-MM-DD). Por defecto el primer pago.")
+        parser.add_argument('--end', help="Último día a reconstruir (AAAA-MM-DD). Por defecto el último pago.")
+
+    def handle(self, *args, **options):
+        limites = Pago.objects.filter(pagado=True).aggregate(primero=Min('fecha_pago'), ultimo=Max('fecha_pago'))
+        fechas = {}
+        for opcion, limite in (('start', 'primero'), ('end', 'ultimo')):
+            if options[opcion]:
+                fechas[opcion] = parse_date(options[opcion])
+                if fechas[opcion] is None:
+                    raise CommandError(f"--{opcion} debe tener el formato AAAA-MM-DD.")
+            elif limites[limite]:
+                fechas[opcion] = timezone.localdate(limites[limite])
+            else:
+                fechas[opcion] = timezone.localdate()
+
+        if fechas['start'] > fechas['end']:
+            raise CommandError("--start no puede ser posterior a --end.")
+
+        filas = IngresosDiarios.reconstruir(fechas['start'], fechas['end'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Ingresos diarios reconstruidos del {fechas['start']} al {fechas['end']}: {filas} registros."
+        ))
@@ -0,0 +1,75 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from aplication.attention.models import CuentaPaciente
+from aplication.attention.instance.saldo_paciente import SaldoPaciente
+
+CAMPOS_CUENTA = SaldoPaciente.COMPONENTES + ('atenciones', 'total_cargos', 'total_pagado', 'saldo')
+
+
+class Command(BaseCommand):
+    help = "Reconstruye (o verifica con --verify) el libro de cuentas de los pacientes desde las tablas de facturación."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--verify', action='store_true', help="Solo compara el libro con las tablas origen, sin modificarlo.")
+        parser.add_argument('--batch-size', type=int, default=1000, help="Pacientes procesados por lote.")
+
+    def handle(self, *args, **options):
+        if options['verify']:
+            return self.verificar(options['batch_size'])
+        self.reconstruir(options['batch_size'])
+
+    def reconstruir(self, batch_size):
+        total = 0
+        lote = []
+        with transaction.atomic():
+            for cuenta in SaldoPaciente.calcular_cuentas(batch_size):
+                lote.append(cuenta)
+                if len(lote) >= batch_size:
+                    total += self._guardar(lote)
+                    lote = []
+            total += self._guardar(lote)
+        self.stdout.write(self.style.SUCCESS(f"Libro de cuentas reconstruido: {total} pacientes."))
+
+    @staticmethod
+    def _guardar(lote):
+        CuentaPaciente.objects.bulk_create(
+            lote,
+            update_conflicts=True,
+            unique_fields=['paciente'],
+            update_fields=list(CAMPOS_CUENTA) + ['actualizado'],
+        )
+        return len(lote)
+
+    def verificar(self, batch_size):
+        diferencias = 0
+        revisados = 0
+        lote = []
+        for esperada in SaldoPaciente.calcular_cuentas(batch_size):
+            lote.append(esperada)
+            if len(lote) >= batch_size:
+                diferencias += self._comparar(lote)
+                revisados += len(lote)
+                lote = []
+        diferencias += self._comparar(lote)
+        revisados += len(lote)
+        if diferencias:
+            raise CommandError(f"{diferencias} diferencias encontradas en {revisados} pacientes.")
+        self.stdout.write(self.style.SUCCESS(f"Libro de cuentas verificado: {revisados} pacientes sin diferencias."))
+
+    def _comparar(self, lote):
+        diferencias = 0
+        actuales = CuentaPaciente.objects.in_bulk([c.paciente_id for c in lote])
+        for esperada in lote:
+            actual = actuales.get(esperada.paciente_id)
+            if actual is None:
+                diferencias += 1
+                self.stdout.write(f"Paciente {esperada.paciente_id}: sin cuenta en el libro.")
+                continue
+            for campo in CAMPOS_CUENTA:
+                if getattr(actual, campo) != getattr(esperada, campo):
+                    diferencias += 1
+                    self.stdout.write(
+                        f"Paciente {esperada.paciente_id}: {campo} libro={getattr(actual, campo)} "
+                        f"calculado={getattr(esperada, campo)}"
+                    )
+        return diferencias
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Max, Min
+from django.utils.dateparse import parse_date
+from aplication.attention.models import CostosAtencion
+
+
+class Command(BaseCommand):
+    help = "Recalcula CostosAtencion.total con SQL por conjuntos, por rangos de id (con --dry-run solo informa las diferencias)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help="Fecha de atención inicial (AAAA-MM-DD).")
+        parser.add_argument('--end', help="Fecha de atención final (AAAA-MM-DD), incluida.")
+        parser.add_argument('--dry-run', action='store_true', help="Muestra los totales que cambiarían sin guardarlos.")
+        parser.add_argument('--batch-size', type=int, default=5000, help="Costos de atención por lote (rango de id).")
+        parser.add_argument('--limit', type=int, default=20, help="Diferencias que se listan en --dry-run.")
+
+    def handle(self, *args, **options):
+        costos = CostosAtencion.objects.order_by()
+        for opcion, lookup in (('start', 'atencion__fecha_atencion__date__gte'), ('end', 'atencion__fecha_atencion__date__lte')):
+            if options[opcion]:
+                fecha = parse_date(options[opcion])
+                if fecha is None:
+                    raise CommandError(f"--{opcion} debe tener el formato AAAA-MM-DD.")
+                costos = costos.filter(**{lookup: fecha})
+
+        limites = costos.aggregate(minimo=Min('pk'), maximo=Max('pk'))
+        if limites['minimo'] is None:
+            self.stdout.write("No hay costos de atención en el rango indicado.")
+            return
+
+        total = CostosAtencion.get_expresion_total()
+        diferencias = 0
+        listadas = 0
+        batch_size = options['batch_size']
+        for inicio in range(limites['minimo'], limites['maximo'] + 1, batch_size):
+            # solo las filas cuyo total guardado no coincide con el calculado
+            lote = costos.filter(pk__gte=inicio, pk__lt=inicio + batch_size).annotate(nuevo_total=total).exclude(total=F('nuevo_total'))
+            if options['dry_run']:
+                for fila in lote.values('pk', 'total', 'nuevo_total').order_by('pk'):
+                    diferencias += 1
+                    if listadas < options['limit']:
+                        listadas += 1
+                        self.stdout.write(f"CostosAtencion {fila['pk']}: total={fila['total']} calculado={fila['nuevo_total']}")
+            else:
+                with transaction.atomic():
+                    diferencias += CostosAtencion.objects.filter(pk__in=lote.values('pk')).update(total=total)
+
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"{diferencias} totales cambiarían (no se guardó nada)."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"{diferencias} totales recalculados."))
@@ -0,0 +1,28 @@
+import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from aplication.attention.instance.recordatorios_citas import RecordatoriosCitas
+
+
+class Command(BaseCommand):
+    help = "Encola en la bandeja de salida el recordatorio a los pacientes con cita programada (por defecto mañana). Las citas ya recordadas se omiten."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help="Fecha de las citas (AAAA-MM-DD). Por defecto mañana.")
+        parser.add_argument('--batch-size', type=int, help="Citas reservadas y encoladas por transacción (por defecto EMAIL_OUTBOX_BATCH_SIZE).")
+        parser.add_argument('--dry-run', action='store_true', help="Solo cuenta los recordatorios pendientes.")
+
+    def handle(self, *args, **options):
+        if options['date']:
+            fecha = parse_date(options['date'])
+            if fecha is None:
+                raise CommandError("--date debe tener el formato AAAA-MM-DD.")
+        else:
+            fecha = timezone.localdate() + datetime.timedelta(days=1)
+
+        total = RecordatoriosCitas.enviar(fecha, options['batch_size'], simular=options['dry_run'])
+        if options['dry_run']:
+            self.stdout.write(f"Recordatorios pendientes para el {fecha}: {total}.")
+            return
+        self.stdout.write(self.style.SUCCESS(f"Recordatorios encolados para el {fecha}: {total}."))
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from aplication.attention.instance.bandeja_correo import BandejaCorreo
+
+
+class Command(BaseCommand):
+    help = "Envía los correos pendientes de la bandeja de salida (CorreoPendiente) que ya deben enviarse."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help="Correos por conexión SMTP (por defecto EMAIL_OUTBOX_BATCH_SIZE).")
+
+    def handle(self, *args, **options):
+        enviados = fallidos = 0
+        while True:
+            lote_enviados, lote_fallidos = BandejaCorreo.enviar_lote(options['batch_size'])
+            if not lote_enviados and not lote_fallidos:
+                break
+            enviados += lote_enviados
+            fallidos += lote_fallidos
+        self.stdout.write(self.style.SUCCESS(f"Correos enviados: {enviados}. Fallidos (se reintentarán o quedan como fallidos): {fallidos}."))
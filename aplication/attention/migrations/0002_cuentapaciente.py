@@ -0,0 +1,34 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attention', '0001_initial'),
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CuentaPaciente',
+            fields=[
+                ('paciente', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='cuenta', serialize=False, to='core.paciente', verbose_name='Paciente')),
+                ('atenciones', models.PositiveIntegerField(default=0, verbose_name='Atenciones')),
+                ('costos_atencion', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Costos de Atención')),
+                ('servicios_adicionales', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Servicios Adicionales')),
+                ('examenes', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Exámenes')),
+                ('medicinas', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Medicinas')),
+                ('total_cargos', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Total Cargos')),
+                ('total_pagado', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Total Pagado')),
+                ('saldo', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Saldo Pendiente')),
+                ('actualizado', models.DateTimeField(auto_now=True, verbose_name='Actualizado')),
+            ],
+            options={
+                'verbose_name': 'Cuenta de Paciente',
+                'verbose_name_plural': 'Cuentas de Pacientes',
+            },
+        ),
+    ]
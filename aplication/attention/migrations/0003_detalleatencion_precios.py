@@ -0,0 +1,36 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:20
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery
+
+
+# Toma el precio actual del catálogo como precio histórico de las líneas existentes
+def congelar_precios(apps, schema_editor):
+    DetalleAtencion = apps.get_model('attention', 'DetalleAtencion')
+    Medicamento = apps.get_model('core', 'Medicamento')
+    DetalleAtencion.objects.filter(precio_unitario__isnull=True).update(
+        precio_unitario=Subquery(Medicamento.objects.filter(pk=OuterRef('medicamento_id')).values('precio')[:1])
+    )
+    DetalleAtencion.objects.update(subtotal=F('precio_unitario') * F('cantidad'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attention', '0002_cuentapaciente'),
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='detalleatencion',
+            name='precio_unitario',
+            field=models.DecimalField(blank=True, decimal_places=2, editable=False, max_digits=10, null=True, verbose_name='Precio Unitario'),
+        ),
+        migrations.AddField(
+            model_name='detalleatencion',
+            name='subtotal',
+            field=models.DecimalField(decimal_places=2, default=0, editable=False, max_digits=12, verbose_name='Subtotal'),
+        ),
+        migrations.RunPython(congelar_precios, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attention', '0003_detalleatencion_precios'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pago',
+            name='payment_id',
+            field=models.CharField(blank=True, editable=False, max_length=100, null=True, unique=True, verbose_name='ID de Pago en Pasarela'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:25
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+# Carga los ingresos diarios de los pagos confirmados existentes
+def cargar_ingresos(apps, schema_editor):
+    Pago = apps.get_model('attention', 'Pago')
+    IngresoDiario = apps.get_model('attention', 'IngresoDiario')
+    filas = Pago.objects.filter(pagado=True).annotate(dia=TruncDate('fecha_pago')).order_by().values(
+        'dia', 'metodo_pago').annotate(total=Sum('monto'), cantidad=Count('id'))
+    IngresoDiario.objects.bulk_create([
+        IngresoDiario(fecha=fila['dia'], metodo_pago=fila['metodo_pago'], total=fila['total'], cantidad=fila['cantidad'])
+        for fila in filas
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attention', '0004_pago_payment_id'),
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IngresoDiario',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fecha', models.DateField(verbose_name='Fecha')),
+                ('metodo_pago', models.CharField(max_length=50, verbose_name='Método de Pago')),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Total')),
+                ('cantidad', models.PositiveIntegerField(default=0, verbose_name='Cantidad de Pagos')),
+                ('actualizado', models.DateTimeField(auto_now=True, verbose_name='Actualizado')),
+            ],
+            options={
+                'verbose_name': 'Ingreso Diario',
+                'verbose_name_plural': 'Ingresos Diarios',
+                'ordering': ['-fecha', 'metodo_pago'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='pago',
+            index=models.Index(fields=['pagado', 'fecha_pago'], name='pago_pagado_fecha_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='ingresodiario',
+            constraint=models.UniqueConstraint(fields=('fecha', 'metodo_pago'), name='ingreso_diario_fecha_metodo_unico'),
+        ),
+        migrations.RunPython(cargar_ingresos, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attention', '0006_correopendiente'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='citamedica',
+            name='recordatorio_enviado',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='Recordatorio Enviado'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:44
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+# El índice único no se puede crear si ya hay citas activas repetidas; se avisa cuáles
+# son para cancelarlas o moverlas a mano en lugar de tocar los datos de los pacientes
+def verificar_citas_repetidas(apps, schema_editor):
+    CitaMedica = apps.get_model('attention', 'CitaMedica')
+    repetidas = list(
+        CitaMedica.objects.exclude(estado='C').values('fecha', 'hora_cita')
+        .annotate(total=Count('id')).filter(total__gt=1).order_by('fecha', 'hora_cita')[:20]
+    )
+    if repetidas:
+        detalle = ', '.join(f"{fila['fecha']} {fila['hora_cita']} ({fila['total']})" for fila in repetidas)
+        raise RuntimeError(f"Hay citas activas con la misma fecha y hora: {detalle}. Cancele o reprograme las repetidas y vuelva a migrar.")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attention', '0007_citamedica_recordatorio_enviado'),
+        ('core', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.RunPython(verificar_citas_repetidas, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='citamedica',
+            constraint=models.UniqueConstraint(condition=models.Q(('estado', 'C'), _negated=True), fields=('fecha', 'hora_cita'), name='cita_fecha_hora_unica', violation_error_message='Ya existe una cita en ese horario.'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attention', '0008_citamedica_cita_fecha_hora_unica'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='citamedica',
+            name='actualizado',
+            field=models.DateTimeField(auto_now=True, verbose_name='Actualizado'),
+        ),
+    ]
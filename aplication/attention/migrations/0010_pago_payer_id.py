@@ -0,0 +1,18 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('attention', '0009_citamedica_actualizado'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='pago',
+            name='payer_id',
+            field=models.CharField(blank=True, editable=False, max_length=100, null=True, verbose_name='ID del Pagador'),
+        ),
+    ]
@@ -1,5 +1,8 @@
+from django.conf import settings
 from django.db import models, IntegrityError
-from django.db.models import Sum
+from django.utils import timezone
+from django.db.models import ExpressionWrapper, F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from decimal import Decimal
 from aplication.core.models import Paciente, Diagnostico, Medicamento, Doctor
 from doctor.const import CITA_CHOICES, DIA_SEMANA_CHOICES, EXAMEN_CHOICES
@@ -43,6 +46,10 @@ class CitaMedica(models.Model):
         choices=CITA_CHOICES,
         verbose_name="Estado de la Cita"
     )
+    # Momento en que se envió el recordatorio (send_appointment_reminders no lo repite)
+    recordatorio_enviado = models.DateTimeField(null=True, blank=True, editable=False, verbose_name="Recordatorio Enviado")
+    # Última modificación (el calendario .ics la usa para saber qué días volver a generar)
+    actualizado = models.DateTimeField(auto_now=True, verbose_name="Actualizado")
 
     def __str__(self):
         return f"Cita {self.paciente} el {self.fecha} a las {self.hora_cita}"
@@ -53,6 +60,16 @@ class CitaMedica(models.Model):
         indexes = [
             models.Index(fields=['fecha', 'hora_cita'], name='idx_fecha_hora'),
         ]
+        # Dos citas activas no pueden compartir fecha y hora (las canceladas liberan el horario).
+        # Lo garantiza un índice único parcial en la base de datos, también con reservas simultáneas
+        constraints = [
+            models.UniqueConstraint(
+                fields=['fecha', 'hora_cita'],
+                condition=~models.Q(estado='C'),
+                name='cita_fecha_hora_unica',
+                violation_error_message="Ya existe una cita en ese horario.",
+            ),
+        ]
         # Nombre singular y plural del modelo en la interfaz administrativa
         verbose_name = "Cita Médica"
         verbose_name_plural = "Citas Médicas"
@@ -74,15 +91,41 @@ class CostosAtencion(models.Model):
     def __str__(self):
         return f"{self.atencion} - Total: {self.total}"
 
+    @staticmethod
+    def get_expresion_cargos():
+        """
+        Expresión SQL con la suma de servicios adicionales, exámenes y medicamentos de cada costo,
+        calculada con subconsultas para poder anotarla o usarla en un update masivo.
+        """
+        dinero = models.DecimalField(max_digits=10, decimal_places=2)
+        servicios = ServiciosAdicionales.objects.filter(costo_atencion=OuterRef('pk')).order_by().values(
+            'costo_atencion').annotate(suma=Sum('costo_servicio')).values('suma')
+        examenes = DetalleAtencion.objects.filter(atencion=OuterRef('atencion'), examen_solicitado__isnull=False).order_by().values(
+            'atencion').annotate(suma=Sum('examen_solicitado__costo')).values('suma')
+        medicinas = DetalleAtencion.objects.filter(atencion=OuterRef('atencion')).order_by().values(
+            'atencion').annotate(suma=Sum('subtotal')).values('suma')
+        return sum(
+            (Coalesce(Subquery(consulta, output_field=dinero), Value(Decimal('0.00')), output_field=dinero)
+             for consulta in (servicios, examenes, medicinas)),
+            Value(Decimal('0.00'), output_field=dinero)
+        )
+
+    @staticmethod
+    def get_expresion_total():
+        return ExpressionWrapper(
+            F('costo_consulta') + CostosAtencion.get_expresion_cargos(),
+            output_field=models.DecimalField(max_digits=10, decimal_places=2)
+        )
+
     def calcular_total(self):
         """
         Calcula el total basado en los servicios adicionales, exámenes y medicamentos relacionados.
         """
         total = Decimal(self.costo_consulta)
         if self.pk:  # Solo calcular si la instancia tiene clave primaria
-            total += sum(Decimal(servicio.costo_servicio) for servicio in self.servicios.all())
-            total += sum(Decimal(detalle.calcular_costo_examen()) for detalle in self.atencion.detalles.all())
-            total += sum(Decimal(detalle.medicamento.precio) * Decimal(detalle.cantidad) for detalle in self.atencion.detalles.all())
+            total += CostosAtencion.objects.filter(pk=self.pk).annotate(
+                cargos=CostosAtencion.get_expresion_cargos()
+            ).values_list('cargos', flat=True).get()
         return total
 
     def save(self, *args, **kwargs):
@@ -128,6 +171,12 @@ class CostoAtencionDetalle(models.Model):
     def __str__(self):
         return f"{self.servicios_adicionales} - Costo: {self.costo_servicio}"  # Obtener costo desde ServiciosAdicionales
 
+    def save(self, *args, **kwargs):
+        # Congela el costo del servicio al momento de registrar el detalle
+        if self.costo_servicio is None:
+            self.costo_servicio = self.servicios_adicionales.costo_servicio
+        super().save(*args, **kwargs)
+
     class Meta:
         verbose_name = "Costo detalle Atención"
         verbose_name_plural = "Costos detalles Atención"
@@ -162,6 +211,10 @@ class DetalleAtencion(models.Model):
     cantidad = models.PositiveIntegerField(verbose_name="Cantidad")
     prescripcion = models.TextField(verbose_name="Prescripción")
     duracion_tratamiento = models.PositiveIntegerField(verbose_name="Duración del Tratamiento (días)", null=True, blank=True)
+    # Precio del medicamento al momento de la prescripción y total de la línea;
+    # la facturación suma estas columnas y no depende del precio actual del catálogo
+    precio_unitario = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Precio Unitario", null=True, blank=True, editable=False)
+    subtotal = models.DecimalField(max_digits=12, decimal_places=2, verbose_name="Subtotal", default=0, editable=False)
 
     def calcular_costo_examen(self):
         """
@@ -175,6 +228,10 @@ class DetalleAtencion(models.Model):
         # Validar que el examen esté asociado al paciente correcto
         if self.examen_solicitado and self.atencion.paciente != self.examen_solicitado.paciente:
             raise IntegrityError("El examen solicitado no pertenece al paciente de esta atención.")
+        # Congela el precio del catálogo la primera vez que se guarda la línea
+        if self.precio_unitario is None:
+            self.precio_unitario = self.medicamento.precio
+        self.subtotal = self.precio_unitario * self.cantidad
         super().save(*args, **kwargs)
 
     def __str__(self):
@@ -257,14 +314,18 @@ class Pago(models.Model):
     ], verbose_name="Método de Pago")
     pagado = models.BooleanField(default=False, verbose_name="Pagado")
     fecha_pago = models.DateTimeField(auto_now_add=True, verbose_name="Fecha de Pago")
+    # Identificador del cobro en la pasarela (PayPal); se asigna al crear el cobro
+    payment_id = models.CharField(max_length=100, unique=True, null=True, blank=True, editable=False, verbose_name="ID de Pago en Pasarela")
+    # Pagador que aprobó el cobro; se guarda al volver de la pasarela para poder reintentar la confirmación
+    payer_id = models.CharField(max_length=100, null=True, blank=True, editable=False, verbose_name="ID del Pagador")
 
     def __str__(self):
         return f"{self.paciente} - {self.costo_atencion} - {self.monto} - {self.metodo_pago}"
 
     def calcular_monto_total(self):
-        total_atencion = self.costo_atencion.total
+        total_atencion = self.costo_atencion.costo_consulta
         total_servicios = ServiciosAdicionales.objects.filter(
-            costos_atenciones__costo_atencion=self.costo_atencion
+            costo_atencion=self.costo_atencion
         ).aggregate(Sum('costo_servicio'))['costo_servicio__sum'] or 0
         total_examenes = ExamenSolicitado.objects.filter(
             atencion=self.costo_atencion.atencion
@@ -280,3 +341,101 @@ class Pago(models.Model):
     class Meta:
         verbose_name = "Pago"
         verbose_name_plural = "Pagos"
+        indexes = [
+            # pagos confirmados por rango de fechas (ingresos diarios)
+            models.Index(fields=['pagado', 'fecha_pago'], name='pago_pagado_fecha_idx'),
+        ]
+
+# Modelo que guarda el saldo acumulado de cada paciente (libro de facturación).
+# Se mantiene desde las señales de attention/signals.py para que consultar un saldo
+# sea una lectura por clave primaria; rebuild_ledger lo reconstruye desde las tablas origen.
+class CuentaPaciente(models.Model):
+    paciente = models.OneToOneField(Paciente, on_delete=models.CASCADE, primary_key=True, verbose_name="Paciente", related_name="cuenta")
+    atenciones = models.PositiveIntegerField(default=0, verbose_name="Atenciones")
+    costos_atencion = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Costos de Atención")
+    servicios_adicionales = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Servicios Adicionales")
+    examenes = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Exámenes")
+    medicinas = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Medicinas")
+    total_cargos = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Total Cargos")
+    total_pagado = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Total Pagado")
+    saldo = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Saldo Pendiente")
+    actualizado = models.DateTimeField(auto_now=True, verbose_name="Actualizado")
+
+    def __str__(self):
+        return f"{self.paciente} - Saldo: {self.saldo}"
+
+    class Meta:
+        verbose_name = "Cuenta de Paciente"
+        verbose_name_plural = "Cuentas de Pacientes"
+
+# Modelo con los ingresos confirmados de cada día por método de pago.
+# Se recalcula desde las señales de Pago; el dashboard y los reportes financieros lo leen
+# en lugar de agregar la tabla de pagos. rebuild_daily_revenue lo reconstruye.
+class IngresoDiario(models.Model):
+    fecha = models.DateField(verbose_name="Fecha")
+    metodo_pago = models.CharField(max_length=50, verbose_name="Método de Pago")
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name="Total")
+    cantidad = models.PositiveIntegerField(default=0, verbose_name="Cantidad de Pagos")
+    actualizado = models.DateTimeField(auto_now=True, verbose_name="Actualizado")
+
+    def __str__(self):
+        return f"{self.fecha} - {self.metodo_pago}: {self.total}"
+
+    @staticmethod
+    def total_dia(fecha):
+        return IngresoDiario.objects.filter(fecha=fecha).aggregate(total=Sum('total'))['total'] or 0
+
+    class Meta:
+        ordering = ['-fecha', 'metodo_pago']
+        verbose_name = "Ingreso Diario"
+        verbose_name_plural = "Ingresos Diarios"
+        constraints = [
+            models.UniqueConstraint(fields=['fecha', 'metodo_pago'], name='ingreso_diario_fecha_metodo_unico'),
+        ]
+
+
+# Bandeja de salida de correos (patrón outbox): el correo se guarda en la misma transacción
+# que el cambio que lo origina y un worker lo envía después (ver BandejaCorreo).
+# Si el envío falla se reintenta con espera exponencial hasta el máximo de intentos.
+class CorreoPendiente(models.Model):
+    ESTADOS = (
+        ('P', 'Pendiente'),
+        ('E', 'Enviado'),
+        ('F', 'Fallido'),
+    )
+    asunto = models.CharField(max_length=255, verbose_name="Asunto")
+    mensaje = models.TextField(verbose_name="Mensaje")
+    destinatario = models.EmailField(verbose_name="Destinatario")
+    estado = models.CharField(max_length=1, choices=ESTADOS, default='P', verbose_name="Estado")
+    intentos = models.PositiveSmallIntegerField(default=0, verbose_name="Intentos")
+    proximo_intento = models.DateTimeField(default=timezone.now, verbose_name="Próximo Intento")
+    error = models.TextField(blank=True, default='', verbose_name="Último Error")
+    creado = models.DateTimeField(auto_now_add=True, verbose_name="Creado")
+    enviado = models.DateTimeField(null=True, blank=True, verbose_name="Enviado")
+
+    def __str__(self):
+        return f"{self.asunto} -> {self.destinatario} ({self.get_estado_display()})"
+
+    class Meta:
+        ordering = ['proximo_intento', 'id']
+        verbose_name = "Correo Pendiente"
+        verbose_name_plural = "Correos Pendientes"
+        indexes = [
+            models.Index(fields=['estado', 'proximo_intento'], name='correo_estado_intento_idx'),
+        ]
+
+
+# Enlace secreto del calendario .ics de cada usuario (ver CalendarioCitas). El token es
+# aleatorio y se puede renovar: al cambiarlo, la dirección anterior deja de funcionar.
+class SuscripcionCalendario(models.Model):
+    usuario = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="suscripcion_calendario", verbose_name="Usuario")
+    token = models.CharField(max_length=64, unique=True, verbose_name="Token")
+    # momento en que se generó el token actual
+    generado = models.DateTimeField(auto_now=True, verbose_name="Generado")
+
+    def __str__(self):
+        return f"Calendario de {self.usuario}"
+
+    class Meta:
+        verbose_name = "Suscripción de Calendario"
+        verbose_name_plural = "Suscripciones de Calendario"
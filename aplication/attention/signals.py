@@ -0,0 +1,104 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from aplication.attention.models import (
+    Atencion,
+    CostosAtencion,
+    DetalleAtencion,
+    ExamenSolicitado,
+    Pago,
+    ServiciosAdicionales
+)
+from aplication.attention.instance.saldo_paciente import SaldoPaciente
+from aplication.attention.instance.ingresos_diarios import IngresosDiarios
+from aplication.attention.instance.estado_pago import EstadoPago
+from aplication.attention.tasks import generar_comprobante
+
+# modelos que afectan el libro de cuentas y el camino hasta su paciente
+CUENTA_PACIENTE_LOOKUPS = {
+    Atencion: 'paciente',
+    CostosAtencion: 'atencion__paciente',
+    ServiciosAdicionales: 'costo_atencion__atencion__paciente',
+    ExamenSolicitado: 'atencion__paciente',
+    DetalleAtencion: 'atencion__paciente',
+    Pago: 'paciente',
+}
+
+
+def _pacientes_de(sender, pk):
+    return set(
+        sender.objects.filter(pk=pk).values_list(CUENTA_PACIENTE_LOOKUPS[sender], flat=True)
+    )
+
+
+# antes de modificar o eliminar se guardan los pacientes actuales de la fila,
+# asi un cambio de paciente o atencion actualiza tambien la cuenta anterior
+def capturar_pacientes_cuenta(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    instance._cuenta_pacientes = _pacientes_de(sender, instance.pk) if instance.pk else set()
+
+
+# las cuentas se recalculan una sola vez al confirmar la transaccion, no por cada fila
+def actualizar_cuenta_guardado(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    pacientes = getattr(instance, '_cuenta_pacientes', set()) | _pacientes_de(sender, instance.pk)
+    SaldoPaciente.programar_actualizacion(pacientes)
+
+
+def actualizar_cuenta_eliminado(sender, instance, **kwargs):
+    SaldoPaciente.programar_actualizacion(getattr(instance, '_cuenta_pacientes', set()))
+
+
+for modelo in CUENTA_PACIENTE_LOOKUPS:
+    pre_save.connect(capturar_pacientes_cuenta, sender=modelo)
+    pre_delete.connect(capturar_pacientes_cuenta, sender=modelo)
+    post_save.connect(actualizar_cuenta_guardado, sender=modelo)
+    post_delete.connect(actualizar_cuenta_eliminado, sender=modelo)
+
+
+# un pago confirmado deja su comprobante dibujado en segundo plano; si la cola no esta
+# disponible solo se registra el error y el comprobante se dibuja en la primera descarga
+@receiver(post_save, sender=Pago)
+def generar_comprobante_pagado(sender, instance, **kwargs):
+    if kwargs.get('raw') or not instance.pagado:
+        return
+    pago_id = instance.pk
+    transaction.on_commit(lambda: generar_comprobante.delay(pago_id), robust=True)
+
+
+# dia y metodo del pago antes de modificarlo o eliminarlo, para actualizar tambien el dia anterior
+@receiver(pre_save, sender=Pago)
+@receiver(pre_delete, sender=Pago)
+def capturar_ingreso_diario(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    anterior = Pago.objects.filter(pk=instance.pk).only('pagado', 'fecha_pago', 'metodo_pago').first() if instance.pk else None
+    instance._ingreso_diario = IngresosDiarios.get_clave(anterior) if anterior else None
+
+
+@receiver(post_save, sender=Pago)
+def actualizar_ingreso_diario_guardado(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    claves = {getattr(instance, '_ingreso_diario', None), IngresosDiarios.get_clave(instance)}
+    IngresosDiarios.actualizar(claves)
+
+
+@receiver(post_delete, sender=Pago)
+def actualizar_ingreso_diario_eliminado(sender, instance, **kwargs):
+    IngresosDiarios.actualizar({getattr(instance, '_ingreso_diario', None)})
+
+
+# el estado de pago en cache depende de los pagos y atenciones del paciente;
+# se invalida al confirmar la transaccion para no repoblarlo con datos sin confirmar
+@receiver(post_save, sender=Pago)
+@receiver(post_save, sender=Atencion)
+@receiver(post_delete, sender=Pago)
+@receiver(post_delete, sender=Atencion)
+def invalidar_estado_pago(sender, instance, **kwargs):
+    if kwargs.get('raw'):
+        return
+    pacientes = getattr(instance, '_cuenta_pacientes', set()) | {instance.paciente_id}
+    transaction.on_commit(lambda: EstadoPago.invalidar(pacientes), robust=True)
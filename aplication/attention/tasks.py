@@ -0,0 +1,76 @@
+import datetime
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from aplication.attention.models import Pago
+from aplication.attention.instance.pasarela_pago import ErrorPasarela, get_pasarela
+from aplication.attention.instance.comprobante_pago import ComprobantePago
+from aplication.attention.instance.bandeja_correo import BandejaCorreo
+from aplication.attention.instance.recordatorios_citas import RecordatoriosCitas
+
+
+# Confirma en segundo plano un cobro aprobado por el pagador.
+# Es idempotente: la pasarela recibe siempre la misma clave para el mismo cobro
+# y el pago se marca como pagado una sola vez, bajo bloqueo de fila.
+@shared_task(bind=True, autoretry_for=(ErrorPasarela,), retry_backoff=True, max_retries=5)
+def confirmar_pago(self, pago_id, payer_id):
+    pago = Pago.objects.filter(pk=pago_id).only('pk', 'pagado', 'payment_id').first()
+    if pago is None or pago.pagado or not pago.payment_id:
+        return False
+
+    # La llamada a la pasarela se hace fuera de la transacción
+    if not get_pasarela().ejecutar_pago(pago.payment_id, payer_id):
+        return False
+
+    with transaction.atomic():
+        pago = Pago.objects.select_for_update().get(pk=pago_id)
+        if not pago.pagado:
+            pago.pagado = True
+            pago.save()
+    return True
+
+
+# Vuelve a encolar la confirmación de los pagos aprobados por el pagador que siguen sin
+# confirmar (por ejemplo, si el broker no estaba disponible al volver de PayPal).
+# Se programa con celery beat; confirmar_pago es idempotente, repetirla no cobra dos veces
+@shared_task
+def confirmar_pagos_pendientes():
+    desde = timezone.now() - datetime.timedelta(hours=settings.PAYMENT_CONFIRM_MAX_AGE_HOURS)
+    pendientes = Pago.objects.filter(
+        pagado=False, fecha_pago__gte=desde, payment_id__isnull=False, payer_id__isnull=False
+    ).values_list('pk', 'payer_id')
+    encolados = 0
+    for pago_id, payer_id in pendientes.iterator():
+        confirmar_pago.delay(pago_id, payer_id)
+        encolados += 1
+    return encolados
+
+
+# Dibuja y guarda el PDF del comprobante; si ya existe para la misma huella no hace nada
+@shared_task
+def generar_comprobante(pago_id):
+    pago = Pago.objects.select_related('paciente', 'costo_atencion').filter(pk=pago_id).first()
+    if pago is None:
+        return None
+    return ComprobantePago.obtener(pago)
+
+
+# Envía los correos vencidos de la bandeja de salida, lote por lote, hasta vaciarla.
+# Se lanza al confirmar cada correo encolado y periódicamente con celery beat (reintentos)
+@shared_task
+def enviar_correos():
+    enviados = fallidos = 0
+    while True:
+        lote_enviados, lote_fallidos = BandejaCorreo.enviar_lote()
+        if not lote_enviados and not lote_fallidos:
+            return {'enviados': enviados, 'fallidos': fallidos}
+        enviados += lote_enviados
+        fallidos += lote_fallidos
+
+
+# Recordatorios de las citas de mañana (programar con celery beat): se encolan en la bandeja
+# de salida, que hace el envío y los reintentos; las citas ya recordadas se omiten
+@shared_task
+def enviar_recordatorios_citas():
+    return RecordatoriosCitas.enviar(timezone.localdate() + datetime.timedelta(days=1))
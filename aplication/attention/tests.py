@@ -1,3 +1,858 @@
-from django.test import TestCase
+import datetime
+import json
+import shutil
+import tempfile
+import threading
+import zipfile
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from django.urls import reverse
+
+from aplication.attention.forms.citaMedica import CitaMedicaForm
+from aplication.attention.instance.bandeja_correo import BandejaCorreo
+from aplication.attention.instance.calendario_citas import CalendarioCitas
+from aplication.attention.instance.comprobante_pago import ComprobantePago
+from aplication.attention.instance.disponibilidad_citas import DisponibilidadCitas
+from aplication.attention.instance.estado_pago import EstadoPago
+from aplication.attention.instance.exportar_comprobantes import ExportacionComprobantes
+from aplication.attention.instance.ingresos_diarios import IngresosDiarios
+from aplication.attention.instance.pasarela_pago import PasarelaLocal
+from aplication.attention.instance.recordatorios_citas import RecordatoriosCitas
+from aplication.attention.instance.saldo_paciente import SaldoPaciente
+from aplication.attention.models import (
+    Atencion,
+    CitaMedica,
+    CorreoPendiente,
+    CostosAtencion,
+    CuentaPaciente,
+    DetalleAtencion,
+    ExamenSolicitado,
+    HorarioAtencion,
+    IngresoDiario,
+    Pago,
+    ServiciosAdicionales,
+)
+from aplication.attention.tasks import confirmar_pago, confirmar_pagos_pendientes, enviar_correos
+from aplication.core.models import Medicamento, Paciente, TipoMedicamento, TipoSangre
+from aplication.security.models import User
+
+
+def crear_paciente(cedula="1710034065"):
+    tipo_sangre, _ = TipoSangre.objects.get_or_create(tipo="O+", defaults={"descripcion": "O positivo"})
+    return Paciente.objects.create(
+        nombres="Ana", apellidos="Pérez", cedula=cedula, fecha_nacimiento=datetime.date(1990, 5, 1),
+        telefono="0999999999", sexo="F", estado_civil="S", direccion="Quito", tipo_sangre=tipo_sangre,
+    )
+
+
+def crear_medicamento(nombre="Paracetamol", precio="2.50"):
+    tipo, _ = TipoMedicamento.objects.get_or_create(nombre="Analgésico")
+    return Medicamento.objects.create(tipo=tipo, nombre=nombre, cantidad=100, precio=Decimal(precio))
+
+
+# atención con los cuatro componentes del saldo: consulta 10, servicio 5, examen 7
+# y medicinas 4 x 2.50 (el examen también va en una línea de detalle, como lo registra la vista)
+def crear_atencion_facturada(paciente, medicamento):
+    atencion = Atencion.objects.create(paciente=paciente, motivo_consulta="Dolor", sintomas="Fiebre", tratamiento="Reposo")
+    costo = CostosAtencion.objects.create(atencion=atencion, costo_consulta=Decimal("10.00"))
+    ServiciosAdicionales.objects.create(nombre_servicio="Curación", costo_servicio=Decimal("5.00"), costo_atencion=costo)
+    examen = ExamenSolicitado.objects.create(
+        nombre_examen="Hemograma", paciente=paciente, atencion=atencion, costo=Decimal("7.00"), estado="Pendiente"
+    )
+    DetalleAtencion.objects.create(atencion=atencion, medicamento=medicamento, cantidad=3, prescripcion="c/8h", examen_solicitado=examen)
+    DetalleAtencion.objects.create(atencion=atencion, medicamento=medicamento, cantidad=1, prescripcion="c/8h")
+    return atencion
+
+
+# pago de una atención nueva del paciente (cada pago necesita su propio costo de atención)
+def crear_pago(paciente, metodo_pago="Efectivo", monto="10.00", **campos):
+    atencion = Atencion.objects.create(paciente=paciente, motivo_consulta="Dolor", sintomas="Fiebre", tratamiento="Reposo")
+    costo = CostosAtencion.objects.create(atencion=atencion, costo_consulta=Decimal("10.00"))
+    return Pago.objects.create(paciente=paciente, costo_atencion=costo, monto=Decimal(monto), metodo_pago=metodo_pago, **campos)
+
+
+# los comprobantes de la prueba se guardan en una carpeta temporal
+def usar_media_temporal(test):
+    media = tempfile.mkdtemp()
+    test.addCleanup(shutil.rmtree, media, ignore_errors=True)
+    configuracion = override_settings(MEDIA_ROOT=media)
+    configuracion.enable()
+    test.addCleanup(configuracion.disable)
+
+
+# deja guardado el PDF de la huella actual del pago: así no hace falta weasyprint
+def guardar_comprobante(pago):
+    pago = Pago.objects.select_related("paciente", "costo_atencion").get(pk=pago.pk)
+    huella = ComprobantePago.get_huella(pago)
+    default_storage.save(ComprobantePago.get_nombre(huella), ContentFile(f"%PDF-{pago.pk}".encode()))
+    return huella
+
+
+class CitaMedicaHorarioUnicoTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.paciente = crear_paciente()
+        cls.fecha = datetime.date.today() + datetime.timedelta(days=7)
+        cls.hora = datetime.time(9, 0)
+        cls.usuario = User.objects.create_superuser(username="admin", email="admin@test.com", password="clave")
+
+    def test_la_base_de_datos_rechaza_la_misma_fecha_y_hora(self):
+        CitaMedica.objects.create(paciente=self.paciente, fecha=self.fecha, hora_cita=self.hora, estado="P")
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            CitaMedica.objects.create(paciente=self.paciente, fecha=self.fecha, hora_cita=self.hora, estado="P")
+
+    def test_las_citas_canceladas_liberan_el_horario(self):
+        CitaMedica.objects.create(paciente=self.paciente, fecha=self.fecha, hora_cita=self.hora, estado="C")
+        CitaMedica.objects.create(paciente=self.paciente, fecha=self.fecha, hora_cita=self.hora, estado="P")
+        self.assertEqual(CitaMedica.objects.filter(fecha=self.fecha, hora_cita=self.hora).count(), 2)
+
+    def test_la_vista_muestra_el_error_en_el_formulario(self):
+        CitaMedica.objects.create(paciente=self.paciente, fecha=self.fecha, hora_cita=self.hora, estado="P")
+        self.client.force_login(self.usuario)
+        response = self.client.post(reverse("attention:citaMedica_create"), {
+            "paciente": self.paciente.pk, "fecha": self.fecha.isoformat(), "hora_cita": "09:00", "estado": "P",
+        })
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("Ya existe una cita en ese horario.", str(response.context["form"].errors))
+        self.assertEqual(CitaMedica.objects.filter(fecha=self.fecha, hora_cita=self.hora).count(), 1)
+
+
+class DisponibilidadCitasTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.paciente = crear_paciente()
+        cls.usuario = User.objects.create_superuser(username="admin", email="admin@test.com", password="clave")
+        # los lunes de 08:00 a 12:00 con descanso de 10:00 a 10:30; citas de 30 minutos (sin doctor registrado)
+        HorarioAtencion.objects.create(
+            dia_semana="lunes", hora_inicio=datetime.time(8), hora_fin=datetime.time(12),
+            Intervalo_desde=datetime.time(10), Intervalo_hasta=datetime.time(10, 30),
+        )
+        hoy = datetime.date.today()
+        cls.lunes = hoy + datetime.timedelta(days=7 - hoy.weekday())
+        cls.cita = CitaMedica.objects.create(paciente=cls.paciente, fecha=cls.lunes, hora_cita=datetime.time(8, 30), estado="P")
+        CitaMedica.objects.create(paciente=cls.paciente, fecha=cls.lunes, hora_cita=datetime.time(11), estado="C")
+        # fuera de la grilla: ocupa parte de los turnos de 11:00 y de 11:30
+        cls.desfasada = CitaMedica.objects.create(paciente=cls.paciente, fecha=cls.lunes, hora_cita=datetime.time(11, 15), estado="P")
+
+    def test_tramos_sin_el_descanso(self):
+        self.assertEqual(DisponibilidadCitas.get_horarios(), {"lunes": [(480, 600), (630, 720)]})
+
+    def test_en_horario(self):
+        disponibilidad = DisponibilidadCitas()
+        self.assertTrue(disponibilidad.en_horario(self.lunes, 8 * 60))
+        self.assertTrue(disponibilidad.en_horario(self.lunes, 11 * 60 + 30))
+        # termina dentro del descanso, empieza en el descanso o antes de abrir
+        self.assertFalse(disponibilidad.en_horario(self.lunes, 9 * 60 + 45))
+        self.assertFalse(disponibilidad.en_horario(self.lunes, 10 * 60))
+        self.assertFalse(disponibilidad.en_horario(self.lunes, 7 * 60 + 30))
+        self.assertFalse(disponibilidad.en_horario(self.lunes + datetime.timedelta(days=1), 9 * 60))
+
+    def test_cruce_con_bisect(self):
+        disponibilidad = DisponibilidadCitas(duracion=30)
+        self.assertTrue(disponibilidad.libre([], 600))
+        self.assertTrue(disponibilidad.libre([600], 570))
+        self.assertFalse(disponibilidad.libre([600], 571))
+        self.assertFalse(disponibilidad.libre([600], 629))
+        self.assertTrue(disponibilidad.libre([600], 630))
+        self.assertFalse(disponibilidad.libre([540, 600, 660], 610))
+
+    def test_horas_libres_con_citas_existentes(self):
+        with self.assertNumQueries(3):
+            dias = DisponibilidadCitas().calcular(self.lunes, self.lunes + datetime.timedelta(days=1))
+        self.assertEqual(dias, [
+            {"fecha": self.lunes.isoformat(), "dia": "lunes", "horas": ["08:00", "09:00", "09:30", "10:30"]},
+            {"fecha": (self.lunes + datetime.timedelta(days=1)).isoformat(), "dia": "martes", "horas": []},
+        ])
+
+    def test_excluir_la_cita_que_se_modifica(self):
+        dias = DisponibilidadCitas().calcular(self.lunes, self.lunes, excluir=self.desfasada.pk)
+        self.assertEqual(dias[0]["horas"], ["08:00", "09:00", "09:30", "10:30", "11:00", "11:30"])
+        self.assertTrue(DisponibilidadCitas().esta_disponible(self.lunes, datetime.time(11, 30), excluir=self.desfasada.pk))
+        self.assertFalse(DisponibilidadCitas().esta_disponible(self.lunes, datetime.time(11, 30)))
+
+    def test_el_formulario_rechaza_cruces_y_horas_fuera_del_horario(self):
+        def errores(hora_cita, instance=None, estado="P"):
+            form = CitaMedicaForm(
+                data={"paciente": self.paciente.pk, "fecha": self.lunes.isoformat(), "hora_cita": hora_cita, "estado": estado},
+                instance=instance,
+            )
+            form.is_valid()
+            return form.errors.get("hora_cita", [])
+
+        self.assertEqual(errores("08:45"), ["Ya existe una cita en ese horario."])
+        self.assertEqual(errores("10:00"), ["La hora está fuera del horario de atención."])
+        self.assertEqual(errores("09:00"), [])
+        # la propia cita no se cruza consigo misma y las canceladas no se validan
+        self.assertEqual(errores("08:45", instance=self.cita), [])
+        self.assertEqual(errores("08:45", estado="C"), [])
+
+    def test_la_vista_requiere_iniciar_sesion(self):
+        url = reverse("attention:citaMedica_disponibilidad") + f"?desde={self.lunes.isoformat()}&excluir={self.desfasada.pk}"
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.usuario)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["duracion"], 30)
+        self.assertEqual(response.json()["dias"][0]["horas"][-2:], ["11:00", "11:30"])
+
+
+class CitaMedicaReservasConcurrentesTest(TransactionTestCase):
+    HILOS = 8
+
+    def test_solo_una_reserva_simultanea_ocupa_el_horario(self):
+        paciente = crear_paciente()
+        fecha = datetime.date.today() + datetime.timedelta(days=7)
+        barrera = threading.Barrier(self.HILOS)
+        resultados = []
+
+        def reservar():
+            try:
+                barrera.wait()
+                with transaction.atomic():
+                    CitaMedica.objects.create(paciente=paciente, fecha=fecha, hora_cita=datetime.time(10, 0), estado="P")
+                resultados.append("reservada")
+            except IntegrityError:
+                resultados.append("repetida")
+            except OperationalError:
+                # SQLite serializa las escrituras: un hilo puede encontrar la base bloqueada
+                resultados.append("bloqueada")
+            finally:
+                connection.close()
+
+        hilos = [threading.Thread(target=reservar) for _ in range(self.HILOS)]
+        for hilo in hilos:
+            hilo.start()
+        for hilo in hilos:
+            hilo.join()
+
+        self.assertEqual(len(resultados), self.HILOS)
+        self.assertEqual(resultados.count("reservada"), 1)
+        self.assertEqual(CitaMedica.objects.filter(fecha=fecha, hora_cita=datetime.time(10, 0)).count(), 1)
+
+
+class CalendarioCitasTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.paciente = crear_paciente()
+        cls.fecha = datetime.date.today() + datetime.timedelta(days=3)
+        cls.cita = CitaMedica.objects.create(paciente=cls.paciente, fecha=cls.fecha, hora_cita=datetime.time(9, 30), estado="P")
+        cls.usuario = User.objects.create_user(username="recepcion", email="recepcion@test.com", password="clave")
+
+    def setUp(self):
+        cache.clear()
+        self.url = reverse("attention:citaMedica_calendario", args=[CalendarioCitas.get_token(self.usuario)])
+
+    def leer(self, response):
+        return b"".join(response.streaming_content).decode()
+
+    def test_token_invalido(self):
+        response = self.client.get(reverse("attention:citaMedica_calendario", args=["token-inventado"]))
+        self.assertEqual(response.status_code, 404)
+
+    def test_renovar_el_token_revoca_el_enlace_anterior(self):
+        self.client.force_login(self.usuario)
+        response = self.client.post(reverse("attention:citaMedica_calendario_renovar"))
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.client.get(self.url).status_code, 404)
+        nuevo = reverse("attention:citaMedica_calendario", args=[CalendarioCitas.get_token(self.usuario)])
+        self.assertEqual(self.client.get(nuevo).status_code, 200)
+
+    def test_genera_el_calendario_con_las_citas(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/calendar; charset=utf-8")
+        contenido = self.leer(response)
+        self.assertTrue(contenido.startswith("BEGIN:VCALENDAR\r\n"))
+        self.assertIn(f"UID:cita-{self.cita.pk}@sistema-medico", contenido)
+        self.assertIn("SUMMARY:Cita: Pérez Ana", contenido)
+        self.assertTrue(contenido.endswith("END:VCALENDAR\r\n"))
+
+    def test_sin_cambios_responde_304_sin_leer_citas(self):
+        etag = self.client.get(self.url)["ETag"]
+        with self.assertNumQueries(3):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_solo_regenera_los_dias_modificados(self):
+        otra = CitaMedica.objects.create(
+            paciente=self.paciente, fecha=self.fecha + datetime.timedelta(days=1), hora_cita=datetime.time(10), estado="P"
+        )
+        primera = self.client.get(self.url)
+        self.leer(primera)
+        otra.estado = "C"
+        otra.save()
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=primera["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], primera["ETag"])
+        # el día sin cambios sale de la caché y el modificado se lee con una sola consulta
+        with self.assertNumQueries(1):
+            contenido = self.leer(response)
+        self.assertIn("STATUS:CANCELLED", contenido)
+        self.assertEqual(contenido.count("BEGIN:VEVENT"), 2)
+
+
+class SaldoPacienteTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.paciente = crear_paciente()
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.atencion = crear_atencion_facturada(cls.paciente, crear_medicamento())
+        cls.usuario = User.objects.create_superuser(username="admin", email="admin@test.com", password="clave")
+
+    def test_calcula_los_cuatro_componentes(self):
+        saldo = SaldoPaciente.calcular(self.paciente.pk)
+        self.assertEqual(saldo["costos_atencion"], Decimal("10.00"))
+        self.assertEqual(saldo["servicios_adicionales"], Decimal("5.00"))
+        self.assertEqual(saldo["examenes"], Decimal("7.00"))
+        self.assertEqual(saldo["medicinas"], Decimal("10.00"))
+        self.assertEqual(saldo["total_general"], Decimal("32.00"))
+        self.assertTrue(saldo["tiene_atencion"])
+
+    def test_paciente_sin_atenciones(self):
+        saldo = SaldoPaciente.calcular(crear_paciente(cedula="0102030405").pk)
+        self.assertEqual(saldo["total_general"], Decimal("0.00"))
+        self.assertFalse(saldo["tiene_atencion"])
+
+    def test_calcular_usa_una_sola_consulta(self):
+        with self.assertNumQueries(1):
+            SaldoPaciente.calcular(self.paciente.pk)
+
+    def test_obtener_lee_la_cuenta_por_clave_primaria(self):
+        with self.assertNumQueries(1):
+            saldo = SaldoPaciente.obtener(self.paciente.pk)
+        self.assertEqual(saldo["total_general"], Decimal("32.00"))
+
+    # las tres vistas de cobro leen el saldo con SaldoPaciente.obtener: una consulta sin
+    # importar cuántas atenciones, servicios, exámenes o medicinas tenga el paciente
+    def test_consultas_de_las_vistas_de_facturacion(self):
+        self.client.force_login(self.usuario)
+        # SAVEPOINT, cuenta, RELEASE
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse("attention:obtener_costos_completos_paciente"), {"paciente_id": self.paciente.pk})
+        self.assertEqual(response.json()["total_general"], "32.00")
+
+        # incluye guardar el pago y actualizar su cuenta e ingreso diario en las señales
+        with self.assertNumQueries(21), self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse("attention:pago_create"), {"paciente": self.paciente.pk, "metodo_pago": "Efectivo"})
+        self.assertEqual(response.status_code, 302)
+        pago = Pago.objects.get(paciente=self.paciente)
+        self.assertEqual(pago.monto, Decimal("32.00"))
+
+        # sesión, usuario, pago, cuenta y pacientes del formulario
+        with self.assertNumQueries(5):
+            response = self.client.get(reverse("attention:pago_update", args=[pago.pk]))
+        self.assertEqual(response.context["total_a_pagar"], Decimal("32.00"))
+
+
+class CuentaPacienteSenalesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.paciente = crear_paciente()
+        cls.otro = crear_paciente(cedula="0102030405")
+        cls.medicamento = crear_medicamento()
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.atencion = crear_atencion_facturada(cls.paciente, cls.medicamento)
+
+    def assertCuentaAlDia(self, paciente):
+        self.assertTrue(CuentaPaciente.objects.filter(pk=paciente.pk).exists())
+        self.assertEqual(SaldoPaciente.obtener(paciente.pk), SaldoPaciente.calcular(paciente.pk))
+
+    def test_una_actualizacion_por_transaccion(self):
+        with mock.patch.object(SaldoPaciente, "actualizar_cuentas", wraps=SaldoPaciente.actualizar_cuentas) as actualizar:
+            with self.captureOnCommitCallbacks(execute=True):
+                crear_atencion_facturada(self.otro, self.medicamento)
+                self.assertFalse(actualizar.called)
+        actualizar.assert_called_once_with({self.otro.pk})
+        self.assertCuentaAlDia(self.otro)
+
+    def test_crear(self):
+        self.assertCuentaAlDia(self.paciente)
+        self.assertEqual(SaldoPaciente.obtener(self.paciente.pk)["total_general"], Decimal("32.00"))
+
+    def test_modificar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            ServiciosAdicionales.objects.filter(costo_atencion__atencion=self.atencion).get().delete()
+            detalle = self.atencion.detalles.get(cantidad=1)
+            detalle.cantidad = 5
+            detalle.save()
+        self.assertCuentaAlDia(self.paciente)
+        self.assertEqual(SaldoPaciente.obtener(self.paciente.pk)["total_general"], Decimal("37.00"))
+
+    def test_eliminar(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.atencion.detalles.get(cantidad=3).delete()
+        self.assertCuentaAlDia(self.paciente)
+        self.assertEqual(SaldoPaciente.obtener(self.paciente.pk)["medicinas"], Decimal("2.50"))
+
+    def test_cambiar_de_paciente_actualiza_ambas_cuentas(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.atencion.paciente = self.otro
+            self.atencion.save()
+        self.assertCuentaAlDia(self.paciente)
+        self.assertCuentaAlDia(self.otro)
+        self.assertEqual(SaldoPaciente.obtener(self.paciente.pk)["total_general"], Decimal("0.00"))
+        self.assertEqual(SaldoPaciente.obtener(self.otro.pk)["costos_atencion"], Decimal("10.00"))
+
+    def test_rebuild_ledger_verify(self):
+        # el otro paciente no tiene movimientos, todavía no tiene cuenta en el libro
+        salida = StringIO()
+        with self.assertRaises(CommandError):
+            call_command("rebuild_ledger", "--verify", stdout=salida)
+        self.assertIn(f"Paciente {self.otro.pk}: sin cuenta en el libro.", salida.getvalue())
+
+        call_command("rebuild_ledger", stdout=StringIO())
+        call_command("rebuild_ledger", "--verify", stdout=StringIO())
+
+        CuentaPaciente.objects.filter(pk=self.paciente.pk).update(saldo=Decimal("1.00"))
+        salida = StringIO()
+        with self.assertRaises(CommandError):
+            call_command("rebuild_ledger", "--verify", stdout=salida)
+        self.assertIn(f"Paciente {self.paciente.pk}: saldo libro=1.00", salida.getvalue())
+
+
+class PrecioMedicamentoTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.paciente = crear_paciente()
+        cls.medicamento = crear_medicamento()
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.atencion = crear_atencion_facturada(cls.paciente, cls.medicamento)
+        cls.usuario = User.objects.create_superuser(username="admin", email="admin@test.com", password="clave")
+
+    def cambiar_precio(self, precio):
+        self.medicamento.precio = Decimal(precio)
+        self.medicamento.save()
+
+    def test_cambiar_el_precio_del_catalogo_no_altera_los_cargos(self):
+        self.cambiar_precio("9.00")
+        detalles = list(self.atencion.detalles.order_by("cantidad").values_list("precio_unitario", "subtotal"))
+        self.assertEqual(detalles, [(Decimal("2.50"), Decimal("2.50")), (Decimal("2.50"), Decimal("7.50"))])
+        self.assertEqual(SaldoPaciente.calcular(self.paciente.pk)["medicinas"], Decimal("10.00"))
+
+    def test_editar_la_atencion_conserva_el_precio_registrado(self):
+        self.cambiar_precio("9.00")
+        nuevo = crear_medicamento(nombre="Ibuprofeno", precio="4.00")
+        self.client.force_login(self.usuario)
+        response = self.client.post(reverse("attention:attention_update", args=[self.atencion.pk]), json.dumps({
+            "paciente": self.paciente.pk, "presionArterial": "120/80", "pulso": "70", "temperatura": "36.5",
+            "frecuenciaRespiratoria": "16", "saturacionOxigeno": "98", "peso": "60", "altura": "1.60",
+            "motivoConsulta": "Dolor", "sintomas": "Fiebre", "tratamiento": "Reposo", "examenFisico": "",
+            "comentarioAdicional": "", "diagnostico": [], "examenesEnviados": [],
+            "medicamentos": [
+                {"codigo": self.medicamento.pk, "cantidad": "2", "prescripcion": "c/8h"},
+                {"codigo": nuevo.pk, "cantidad": "1", "prescripcion": "c/12h"},
+            ],
+        }), content_type="application/json")
+        self.assertEqual(response.status_code, 200)
+        precios = dict(self.atencion.detalles.values_list("medicamento_id", "precio_unitario"))
+        self.assertEqual(precios, {self.medicamento.pk: Decimal("2.50"), nuevo.pk: Decimal("4.00")})
+        self.assertEqual(SaldoPaciente.calcular(self.paciente.pk)["medicinas"], Decimal("9.00"))
+
+
+@override_settings(PAYMENT_GATEWAY="local")
+class PagoPasarelaTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.paciente = crear_paciente()
+        cls.usuario = User.objects.create_superuser(username="admin", email="admin@test.com", password="clave")
+
+    def crear_pago(self, numero, **campos):
+        return crear_pago(self.paciente, "PayPal", payment_id=f"LOCAL-{numero}", **campos)
+
+    def test_confirmar_pago_es_idempotente(self):
+        pago = self.crear_pago(1, payer_id=PasarelaLocal.PAYER_ID)
+        self.assertTrue(confirmar_pago(pago.pk, PasarelaLocal.PAYER_ID))
+        with mock.patch.object(PasarelaLocal, "ejecutar_pago") as ejecutar:
+            self.assertFalse(confirmar_pago(pago.pk, PasarelaLocal.PAYER_ID))
+        ejecutar.assert_not_called()
+        self.assertEqual(Pago.objects.filter(pk=pago.pk, pagado=True).count(), 1)
+
+    @override_settings(PAYMENT_CONFIRM_MAX_AGE_HOURS=24)
+    def test_el_barrido_solo_reencola_pagos_aprobados_sin_confirmar_y_recientes(self):
+        pendiente = self.crear_pago(1, payer_id="PAGADOR")
+        self.crear_pago(2, payer_id="PAGADOR", pagado=True)
+        self.crear_pago(3)
+        antiguo = self.crear_pago(4, payer_id="PAGADOR")
+        Pago.objects.filter(pk=antiguo.pk).update(fecha_pago=timezone.now() - datetime.timedelta(hours=25))
+        with mock.patch.object(confirmar_pago, "delay") as delay:
+            self.assertEqual(confirmar_pagos_pendientes(), 1)
+        delay.assert_called_once_with(pendiente.pk, "PAGADOR")
+
+    def test_volver_de_paypal_guarda_el_pagador_sin_confirmar_el_pago(self):
+        pago = self.crear_pago(1)
+        self.client.force_login(self.usuario)
+        with mock.patch.object(confirmar_pago, "delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                response = self.client.get(reverse("attention:paypal_execute"), {"paymentId": pago.payment_id, "PayerID": "PAGADOR"})
+        self.assertRedirects(response, reverse("attention:pago_list"), fetch_redirect_response=False)
+        pago.refresh_from_db()
+        self.assertEqual(pago.payer_id, "PAGADOR")
+        self.assertFalse(pago.pagado)
+        delay.assert_called_once_with(pago.pk, "PAGADOR")
+
+
+class ComprobantePagoTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.paciente = crear_paciente()
+        cls.pago = crear_pago(cls.paciente, pagado=True)
+
+    def setUp(self):
+        usar_media_temporal(self)
+        self.pago = Pago.objects.select_related("paciente", "costo_atencion").get(pk=self.pago.pk)
+        self.huella = guardar_comprobante(self.pago)
+
+    def test_la_misma_huella_reutiliza_el_archivo(self):
+        with mock.patch.object(ComprobantePago, "renderizar_pdf") as renderizar:
+            nombre = ComprobantePago.obtener(self.pago)
+        renderizar.assert_not_called()
+        self.assertEqual(nombre, ComprobantePago.get_nombre(self.huella))
+        self.assertEqual(ComprobantePago.get_huella(self.pago), self.huella)
+
+    def test_cambiar_el_pago_cambia_la_huella(self):
+        self.pago.metodo_pago = "PayPal"
+        self.assertNotEqual(ComprobantePago.get_huella(self.pago), self.huella)
+
+    def test_etag_y_304(self):
+        url = reverse("attention:pago_comprobante", args=[self.pago.pk])
+        with mock.patch.object(ComprobantePago, "renderizar_pdf") as renderizar:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["ETag"], f'"{self.huella}"')
+            self.assertEqual(b"".join(response.streaming_content), f"%PDF-{self.pago.pk}".encode())
+            response.close()
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=f'"{self.huella}"')
+        self.assertEqual(response.status_code, 304)
+        renderizar.assert_not_called()
+
+
+class ExportacionComprobantesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.paciente = crear_paciente()
+        cls.usuario = User.objects.create_user(username="caja", email="caja@test.com", password="clave")
+        cls.fecha = datetime.date(2026, 3, 10)
+        cls.incluido = cls.crear_pago("Efectivo", True, cls.fecha)
+        cls.sin_pagar = cls.crear_pago("Efectivo", False, cls.fecha)
+        cls.otro_metodo = cls.crear_pago("PayPal", True, cls.fecha)
+        cls.fuera_de_rango = cls.crear_pago("Efectivo", True, cls.fecha - datetime.timedelta(days=10))
+
+    @classmethod
+    def crear_pago(cls, metodo_pago, pagado, fecha):
+        pago = crear_pago(cls.paciente, metodo_pago, pagado=pagado)
+        momento = timezone.make_aware(datetime.datetime.combine(fecha, datetime.time(12)))
+        Pago.objects.filter(pk=pago.pk).update(fecha_pago=momento)
+        return pago
+
+    def setUp(self):
+        cache.clear()
+        usar_media_temporal(self)
+        for pago in Pago.objects.all():
+            guardar_comprobante(pago)
+
+    def exportar(self, **parametros):
+        self.client.force_login(self.usuario)
+        response = self.client.get(reverse("attention:pago_exportar_comprobantes"), parametros)
+        self.assertEqual(response.status_code, 200)
+        contenido = tempfile.SpooledTemporaryFile()
+        for parte in response.streaming_content:
+            contenido.write(parte)
+        with zipfile.ZipFile(contenido) as archivo_zip:
+            return {nombre: archivo_zip.read(nombre) for nombre in archivo_zip.namelist()}
+
+    def test_solo_pagos_confirmados_del_rango_y_metodo(self):
+        archivos = self.exportar(
+            fecha_inicio=self.fecha.isoformat(), fecha_fin=self.fecha.isoformat(), metodo_pago="Efectivo", token="prueba"
+        )
+        self.assertEqual(archivos, {ComprobantePago.get_nombre_descarga(self.incluido): f"%PDF-{self.incluido.pk}".encode()})
+        self.assertEqual(ExportacionComprobantes.get_progreso("prueba"), {"total": 1, "procesados": 1, "terminado": True})
+
+    def test_sin_filtros_incluye_todos_los_pagos_confirmados(self):
+        archivos = self.exportar()
+        esperados = {self.incluido, self.otro_metodo, self.fuera_de_rango}
+        self.assertEqual(set(archivos), {ComprobantePago.get_nombre_descarga(pago) for pago in esperados})
+
+    def test_el_progreso_requiere_iniciar_sesion(self):
+        url = reverse("attention:pago_exportar_progreso") + "?token=prueba"
+        self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+
+class CostosAtencionTotalTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.paciente = crear_paciente()
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.atencion = crear_atencion_facturada(cls.paciente, crear_medicamento())
+            otro_medicamento = crear_medicamento(nombre="Ibuprofeno", precio="1.25")
+            DetalleAtencion.objects.create(atencion=cls.atencion, medicamento=otro_medicamento, cantidad=2, prescripcion="c/12h")
+        cls.costo = cls.atencion.costos.get()
+
+    # cálculo anterior, recorriendo las relaciones en Python
+    def total_con_bucle(self, costo):
+        total = Decimal(costo.costo_consulta)
+        total += sum(servicio.costo_servicio for servicio in costo.servicios.all())
+        for detalle in costo.atencion.detalles.all():
+            total += detalle.calcular_costo_examen()
+            total += detalle.medicamento.precio * detalle.cantidad
+        return total
+
+    def test_calcular_total_coincide_con_el_bucle(self):
+        self.assertEqual(self.costo.calcular_total(), self.total_con_bucle(self.costo))
+        self.assertEqual(self.costo.calcular_total(), Decimal("34.50"))
+
+    def test_calcular_total_sin_cargos(self):
+        atencion = Atencion.objects.create(paciente=self.paciente, motivo_consulta="Control", sintomas="Ninguno", tratamiento="Ninguno")
+        costo = CostosAtencion.objects.create(atencion=atencion, costo_consulta=Decimal("10.00"))
+        self.assertEqual(costo.calcular_total(), self.total_con_bucle(costo))
+
+    def test_recalculate_costs_no_duplica_el_saldo(self):
+        saldo = SaldoPaciente.calcular(self.paciente.pk)
+        call_command("recalculate_costs", stdout=StringIO())
+        self.costo.refresh_from_db()
+        self.assertEqual(self.costo.total, Decimal("34.50"))
+        self.assertEqual(SaldoPaciente.calcular(self.paciente.pk), saldo)
+        self.assertEqual(saldo["total_general"], Decimal("34.50"))
+        call_command("rebuild_ledger", "--verify", stdout=StringIO())
+
+    def test_monto_del_pago_sin_indicar(self):
+        pago = Pago.objects.create(paciente=self.paciente, costo_atencion=self.costo, metodo_pago="Efectivo")
+        # consulta, servicios adicionales y exámenes de la atención
+        self.assertEqual(pago.monto, Decimal("22.00"))
+
+
+class IngresoDiarioTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.paciente = crear_paciente()
+        cls.efectivo = crear_pago(cls.paciente, "Efectivo", "10.00", pagado=True)
+        crear_pago(cls.paciente, "Efectivo", "15.50", pagado=True)
+        cls.paypal = crear_pago(cls.paciente, "PayPal", "20.00", pagado=True)
+        cls.pendiente = crear_pago(cls.paciente, "PayPal", "99.00")
+
+    # ingresos calculados directamente desde los pagos confirmados
+    def agregado_directo(self):
+        filas = Pago.objects.filter(pagado=True).annotate(dia=TruncDate("fecha_pago")).order_by().values(
+            "dia", "metodo_pago"
+        ).annotate(total=Sum("monto"), cantidad=Count("id"))
+        return {(fila["dia"], fila["metodo_pago"]): (fila["total"], fila["cantidad"]) for fila in filas}
+
+    def ingresos(self):
+        return {
+            (ingreso.fecha, ingreso.metodo_pago): (ingreso.total, ingreso.cantidad)
+            for ingreso in IngresoDiario.objects.filter(cantidad__gt=0)
+        }
+
+    def test_las_senales_mantienen_los_ingresos(self):
+        self.assertEqual(self.ingresos(), self.agregado_directo())
+        hoy = timezone.localdate()
+        self.assertEqual(IngresoDiario.total_dia(hoy), Decimal("45.50"))
+
+    def test_confirmar_cambiar_y_eliminar_pagos(self):
+        self.pendiente.pagado = True
+        self.pendiente.save()
+        self.efectivo.metodo_pago = "PayPal"
+        self.efectivo.save()
+        self.paypal.delete()
+        self.assertEqual(self.ingresos(), self.agregado_directo())
+        self.assertEqual(IngresoDiario.total_dia(timezone.localdate()), Decimal("124.50"))
+
+    def test_rebuild_daily_revenue(self):
+        # update() no dispara señales: los ingresos quedan desactualizados hasta reconstruirlos
+        ayer = timezone.now() - datetime.timedelta(days=1)
+        Pago.objects.filter(pk__in=[self.efectivo.pk, self.paypal.pk]).update(fecha_pago=ayer)
+        self.assertNotEqual(self.ingresos(), self.agregado_directo())
+        call_command("rebuild_daily_revenue", stdout=StringIO())
+        self.assertEqual(self.ingresos(), self.agregado_directo())
+        self.assertEqual(len(self.ingresos()), 3)
+
+    def test_reconstruir_solo_el_rango_indicado(self):
+        hoy = timezone.localdate()
+        IngresoDiario.objects.create(fecha=hoy - datetime.timedelta(days=30), metodo_pago="Efectivo", total=Decimal("1.00"), cantidad=1)
+        self.assertEqual(IngresosDiarios.reconstruir(hoy, hoy), 2)
+        self.assertTrue(IngresoDiario.objects.filter(fecha=hoy - datetime.timedelta(days=30)).exists())
+
+
+class EstadoPagoTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.paciente = crear_paciente()
+        cls.sin_atencion = crear_paciente(cedula="0102030405")
+        cls.atencion = Atencion.objects.create(paciente=cls.paciente, motivo_consulta="Dolor", sintomas="Fiebre", tratamiento="Reposo")
+        cls.usuario = User.objects.create_user(username="caja", email="caja@test.com", password="clave")
+
+    def setUp(self):
+        cache.clear()
+
+    def test_una_consulta_para_varios_pacientes_y_luego_cache(self):
+        ids = [self.paciente.pk, self.sin_atencion.pk, 999999]
+        with self.assertNumQueries(1):
+            estados = EstadoPago.consultar(ids)
+        self.assertEqual(estados, {
+            self.paciente.pk: {"tiene_atencion": True, "ha_pagado": False},
+            self.sin_atencion.pk: {"tiene_atencion": False, "ha_pagado": False},
+        })
+        with self.assertNumQueries(0):
+            EstadoPago.consultar([self.paciente.pk, self.sin_atencion.pk])
+
+    def test_consultar_no_crea_costos_de_atencion(self):
+        EstadoPago.consultar([self.paciente.pk])
+        self.client.force_login(self.usuario)
+        self.client.get(reverse("attention:verificar_pago_paciente"), {"paciente_id": self.paciente.pk})
+        self.assertFalse(CostosAtencion.objects.exists())
+
+    def test_guardar_un_pago_invalida_el_estado(self):
+        self.assertFalse(EstadoPago.consultar([self.paciente.pk])[self.paciente.pk]["ha_pagado"])
+        costo = CostosAtencion.objects.create(atencion=self.atencion, costo_consulta=Decimal("10.00"))
+        # el comprobante se encola al confirmar; aquí no hay broker
+        with mock.patch("aplication.attention.signals.generar_comprobante.delay"), self.captureOnCommitCallbacks(execute=True):
+            Pago.objects.create(paciente=self.paciente, costo_atencion=costo, monto=Decimal("10.00"), metodo_pago="Efectivo", pagado=True)
+        self.assertTrue(EstadoPago.consultar([self.paciente.pk])[self.paciente.pk]["ha_pagado"])
+
+    def test_las_vistas_requieren_iniciar_sesion(self):
+        urls = [
+            reverse("attention:verificar_pago_paciente") + f"?paciente_id={self.paciente.pk}",
+            reverse("attention:estado_pagos_pacientes") + f"?ids={self.paciente.pk},{self.sin_atencion.pk}",
+        ]
+        for url in urls:
+            self.assertEqual(self.client.get(url).status_code, 302)
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.client.get(urls[0]).json(), {"ha_pagado": False})
+        self.assertEqual(self.client.get(urls[1]).json()["pacientes"][str(self.sin_atencion.pk)], {"tiene_atencion": False, "ha_pagado": False})
+
+
+@override_settings(
+    EMAIL_BACKEND="django.core.mail.backends.locmem.EmailBackend",
+    EMAIL_OUTBOX_MAX_ATTEMPTS=3, EMAIL_OUTBOX_RETRY_SECONDS=60,
+)
+class BandejaCorreoTest(TestCase):
+    def encolar(self, cantidad):
+        return [BandejaCorreo.encolar(f"Asunto {i}", "Mensaje", f"paciente{i}@test.com") for i in range(cantidad)]
+
+    def test_el_aviso_al_worker_espera_la_confirmacion(self):
+        with mock.patch.object(enviar_correos, "delay") as delay:
+            with self.captureOnCommitCallbacks() as callbacks:
+                self.encolar(1)
+            delay.assert_not_called()
+            for callback in callbacks:
+                callback()
+        delay.assert_called_once()
+        self.assertEqual(CorreoPendiente.objects.count(), 1)
+
+    def test_una_transaccion_revertida_descarta_el_correo(self):
+        with mock.patch.object(enviar_correos, "delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                try:
+                    with transaction.atomic():
+                        self.encolar(1)
+                        raise IntegrityError
+                except IntegrityError:
+                    pass
+        delay.assert_not_called()
+        self.assertFalse(CorreoPendiente.objects.exists())
+
+    def test_un_lote_usa_una_sola_conexion(self):
+        self.encolar(3)
+        with mock.patch("aplication.attention.instance.bandeja_correo.get_connection", wraps=mail.get_connection) as conexion:
+            self.assertEqual(BandejaCorreo.enviar_lote(), (3, 0))
+        conexion.assert_called_once()
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(CorreoPendiente.objects.filter(estado="E", intentos=1).count(), 3)
+
+    def test_un_fallo_programa_el_reintento(self):
+        correo, = self.encolar(1)
+        antes = timezone.now()
+        with mock.patch("django.core.mail.EmailMessage.send", side_effect=OSError("SMTP caído")):
+            self.assertEqual(BandejaCorreo.enviar_lote(), (0, 1))
+        correo.refresh_from_db()
+        self.assertEqual((correo.estado, correo.intentos, correo.error), ("P", 1, "SMTP caído"))
+        self.assertGreaterEqual(correo.proximo_intento, antes + datetime.timedelta(seconds=60))
+        # todavía no vence: el siguiente lote no lo toma
+        self.assertEqual(BandejaCorreo.enviar_lote(), (0, 0))
+        self.assertEqual(BandejaCorreo.get_espera(3), 240)
+
+    def test_agotados_los_intentos_no_se_reintenta(self):
+        correo, = self.encolar(1)
+        CorreoPendiente.objects.filter(pk=correo.pk).update(intentos=2)
+        with mock.patch("django.core.mail.EmailMessage.send", side_effect=OSError("SMTP caído")):
+            self.assertEqual(BandejaCorreo.enviar_lote(), (0, 1))
+        correo.refresh_from_db()
+        self.assertEqual((correo.estado, correo.intentos), ("F", 3))
+        CorreoPendiente.objects.filter(pk=correo.pk).update(proximo_intento=timezone.now() - datetime.timedelta(days=1))
+        self.assertEqual(BandejaCorreo.enviar_lote(), (0, 0))
+        self.assertEqual(mail.outbox, [])
+
+
+class RecordatoriosCitasTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.paciente = crear_paciente()
+        cls.paciente.email = "ana@test.com"
+        cls.paciente.save()
+        sin_correo = crear_paciente(cedula="0102030405")
+        cls.fecha = datetime.date.today() + datetime.timedelta(days=1)
+        cls.citas = [
+            CitaMedica.objects.create(paciente=cls.paciente, fecha=cls.fecha, hora_cita=datetime.time(8 + i), estado="P")
+            for i in range(3)
+        ]
+        CitaMedica.objects.create(paciente=cls.paciente, fecha=cls.fecha, hora_cita=datetime.time(12), estado="C")
+        CitaMedica.objects.create(paciente=sin_correo, fecha=cls.fecha, hora_cita=datetime.time(13), estado="P")
+        cls.usuario = User.objects.create_superuser(username="admin", email="admin@test.com", password="clave")
+
+    def test_una_segunda_ejecucion_no_encola_nada(self):
+        self.assertEqual(RecordatoriosCitas.enviar(self.fecha, tamano_lote=2), 3)
+        self.assertEqual(
+            sorted(CorreoPendiente.objects.values_list("destinatario", flat=True)), ["ana@test.com"] * 3
+        )
+        self.assertEqual(RecordatoriosCitas.enviar(self.fecha, tamano_lote=2), 0)
+        self.assertEqual(CorreoPendiente.objects.count(), 3)
+
+    def test_cada_lote_se_marca_y_encola_en_la_misma_transaccion(self):
+        encolar_lote = BandejaCorreo.encolar_lote
+        lotes = []
+
+        def fallar_en_el_segundo_lote(correos):
+            if lotes:
+                raise RuntimeError("base de datos caída")
+            lotes.append(correos)
+            return encolar_lote(correos)
+
+        with mock.patch.object(BandejaCorreo, "encolar_lote", side_effect=fallar_en_el_segundo_lote):
+            with self.assertRaises(RuntimeError):
+                RecordatoriosCitas.enviar(self.fecha, tamano_lote=2)
+        # el primer lote quedó completo; el segundo se revirtió sin marcar su cita
+        self.assertEqual(CorreoPendiente.objects.count(), 2)
+        marcadas = CitaMedica.objects.filter(pk__in=[cita.pk for cita in self.citas], recordatorio_enviado__isnull=False)
+        self.assertEqual(marcadas.count(), 2)
+        self.assertEqual(RecordatoriosCitas.enviar(self.fecha), 1)
+        self.assertEqual(CorreoPendiente.objects.count(), 3)
+
+    def test_cambiar_fecha_u_hora_vuelve_a_enviar_el_recordatorio(self):
+        RecordatoriosCitas.enviar(self.fecha)
+        cita = self.citas[0]
+        url = reverse("attention:citaMedica_update", args=[cita.pk])
+        self.client.force_login(self.usuario)
+
+        datos = {"paciente": self.paciente.pk, "fecha": self.fecha.isoformat(), "hora_cita": "08:00", "estado": "P"}
+        self.assertEqual(self.client.post(url, datos).status_code, 302)
+        cita.refresh_from_db()
+        self.assertIsNotNone(cita.recordatorio_enviado)
+
+        self.assertEqual(self.client.post(url, dict(datos, hora_cita="15:00")).status_code, 302)
+        cita.refresh_from_db()
+        self.assertIsNone(cita.recordatorio_enviado)
+        self.assertEqual(RecordatoriosCitas.enviar(self.fecha), 1)
@@ -1,12 +1,12 @@
 from django.urls import path
 from aplication.attention.views.medical_attention import AttentionCreateView, AttentionDetailView, AttentionListView, AttentionUpdateView
 from aplication.attention.views.horarioAtencion import HorarioAtencionCreateView, HorarioAtencionListView, HorarioAtencionUpdateView, HorarioAtencionDeleteView, HorarioAtencionDetailView
-from aplication.attention.views.citaMedica import CitaMedicaCreateView, CitaMedicaListView, CitaMedicaUpdateView, CitaMedicaDeleteView, CitaMedicaDetailView
+from aplication.attention.views.citaMedica import CitaMedicaCreateView, CitaMedicaListView, CitaMedicaUpdateView, CitaMedicaDeleteView, CitaMedicaDetailView, disponibilidad_citas, calendario_citas, renovar_calendario_citas
 from aplication.attention.views.serviciosAdicionales import ServiciosAdicionalesCreateView, ServiciosAdicionalesListView, ServiciosAdicionalesUpdateView, ServiciosAdicionalesDeleteView, ServiciosAdicionalesDetailView
 from aplication.attention.views.examenSolicitado import ExamenSolicitadoCreateView, ExamenSolicitadoListView, ExamenSolicitadoUpdateView, ExamenSolicitadoDeleteView, ExamenSolicitadoDetailView
 from aplication.attention.views.certificado import CertificadoCreateView, CertificadoListView, CertificadoUpdateView, CertificadoDeleteView, CertificadoDetailView, CertificadoPDFView
 from aplication.attention.views.fichaClinica import FichaClinicaListView, FichaClinicaDetailView, ImprimirHistorialClinico
-from aplication.attention.views.costo_pago import PagoCreateView, PagoListView, PagoUpdateView, PagoDeleteView, PagoComprobanteView, paypal_execute, verificar_pago_paciente, obtener_examenes_paciente, obtener_costos_completos_paciente
+from aplication.attention.views.costo_pago import PagoCreateView, PagoListView, PagoUpdateView, PagoDeleteView, PagoComprobanteView, PagoExportarComprobantesView, progreso_exportacion_comprobantes, paypal_execute, verificar_pago_paciente, estado_pagos_pacientes, obtener_examenes_paciente, obtener_costos_completos_paciente
 
 app_name = 'attention'
 
@@ -31,6 +31,9 @@ urlpatterns = [
   path('cita_update/<int:pk>/', CitaMedicaUpdateView.as_view(),name='citaMedica_update'),
   path('cita_detail/<int:pk>/', CitaMedicaDetailView.as_view(),name='citaMedica_detail'),
   path('cita_delete/<int:pk>/', CitaMedicaDeleteView.as_view(),name='citaMedica_delete'),
+  path('cita_disponibilidad/', disponibilidad_citas,name='citaMedica_disponibilidad'),
+  path('cita_calendario/<str:token>/citas.ics', calendario_citas,name='citaMedica_calendario'),
+  path('cita_calendario_renovar/', renovar_calendario_citas,name='citaMedica_calendario_renovar'),
   
   # Servicios Adicionales
   path('servicio_list/',ServiciosAdicionalesListView.as_view() ,name="servicio_list"),
@@ -65,8 +68,11 @@ urlpatterns = [
   path('pago_update/<int:pk>/', PagoUpdateView.as_view(), name='pago_update'),
   path('pago_delete/<int:pk>/', PagoDeleteView.as_view(), name='pago_delete'),
   path('pago_comprobante/<int:pk>/', PagoComprobanteView.as_view(), name='pago_comprobante'),
+  path('pago_exportar_comprobantes/', PagoExportarComprobantesView.as_view(), name='pago_exportar_comprobantes'),
+  path('pago_exportar_progreso/', progreso_exportacion_comprobantes, name='pago_exportar_progreso'),
   path('paypal_execute/', paypal_execute, name='paypal_execute'),
   path('verificar_pago_paciente/', verificar_pago_paciente, name='verificar_pago_paciente'),
+  path('estado_pagos_pacientes/', estado_pagos_pacientes, name='estado_pagos_pacientes'),
   path('obtener_costos_completos_paciente/', obtener_costos_completos_paciente, name='obtener_costos_completos_paciente'),
   path('obtener_examenes_paciente/', obtener_examenes_paciente, name='obtener_examenes_paciente'),
   
@@ -1,16 +1,24 @@
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from aplication.attention.forms.citaMedica import CitaMedicaForm
 from aplication.attention.models import CitaMedica
 from django.views.generic import CreateView, ListView, UpdateView, DeleteView, DetailView
-from django.http import JsonResponse
+from django.http import Http404, JsonResponse, StreamingHttpResponse
+from django.shortcuts import redirect
+from django.views.decorators.http import require_POST
 from django.contrib import messages
 from django.db.models import Q
 from doctor.mixins import CreateViewMixin, DeleteViewMixin, ListViewMixin, UpdateViewMixin
+from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from doctor.utils import save_audit
-from django.core.mail import send_mail
+from aplication.attention.instance.bandeja_correo import BandejaCorreo
+from aplication.attention.instance.disponibilidad_citas import DisponibilidadCitas
+from aplication.attention.instance.calendario_citas import CalendarioCitas
+from django.db import IntegrityError, transaction
+from django.utils.dateparse import parse_date
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date
 from django.conf import settings
-from django.utils import timezone
 
 class CitaMedicaListView(LoginRequiredMixin,ListViewMixin,ListView):
     template_name = "attention/citaMedica/list.html"
@@ -35,6 +43,14 @@ class CitaMedicaListView(LoginRequiredMixin,ListViewMixin,ListView):
             query &= Q(estado=estado)
         
         return CitaMedica.objects.filter(query).order_by('fecha')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        # dirección del calendario .ics del usuario para suscribirse desde su aplicación de calendario
+        context['calendario_url'] = self.request.build_absolute_uri(
+            reverse('attention:citaMedica_calendario', args=[CalendarioCitas.get_token(self.request.user)])
+        )
+        return context
     
 class CitaMedicaCreateView(LoginRequiredMixin, CreateViewMixin, CreateView):
     model = CitaMedica
@@ -51,7 +67,14 @@ class CitaMedicaCreateView(LoginRequiredMixin, CreateViewMixin, CreateView):
     
     def form_valid(self, form):
         # print("entro al form_valid")
-        response = super().form_valid(form)
+        try:
+            # savepoint: si otra reserva ocupó la misma fecha y hora entre la validación y el
+            # INSERT, el índice único cita_fecha_hora_unica rechaza la fila sin romper el request
+            with transaction.atomic():
+                response = super().form_valid(form)
+        except IntegrityError:
+            form.add_error('hora_cita', "Ya existe una cita en ese horario.")
+            return self.form_invalid(form)
         citamedica = self.object
         
         # Envío de correo al paciente con formato mejorado
@@ -77,14 +100,8 @@ class CitaMedicaCreateView(LoginRequiredMixin, CreateViewMixin, CreateView):
         ------------------------------------------
         Este es un correo automático, por favor no responder.
         """
-        recipient_email = citamedica.paciente.email
-        send_mail(
-            subject,
-            message,
-            from_email=None,
-            recipient_list=[recipient_email],
-            fail_silently=False,
-        )
+        # se envía en segundo plano cuando se confirma la transacción (bandeja de salida)
+        BandejaCorreo.encolar(subject, message, citamedica.paciente.email)
         
         save_audit(self.request, citamedica, action='A')
         messages.success(self.request, f"Éxito al crear la cita medica del paciente: {citamedica.paciente}.")
@@ -109,7 +126,16 @@ class CitaMedicaUpdateView(LoginRequiredMixin, UpdateViewMixin, UpdateView):
         return context
     
     def form_valid(self, form):
-        response = super().form_valid(form)
+        # si cambia la fecha u hora la cita vuelve a recibir recordatorio
+        if {'fecha', 'hora_cita'} & set(form.changed_data):
+            form.instance.recordatorio_enviado = None
+        try:
+            # savepoint: el índice único cita_fecha_hora_unica rechaza la hora si otra reserva la ocupó
+            with transaction.atomic():
+                response = super().form_valid(form)
+        except IntegrityError:
+            form.add_error('hora_cita', "Ya existe una cita en ese horario.")
+            return self.form_invalid(form)
         citamedica = self.object
         
         # Enviar correo electrónico de modificación de cita
@@ -130,14 +156,8 @@ class CitaMedicaUpdateView(LoginRequiredMixin, UpdateViewMixin, UpdateView):
         ------------------------------------------
         Este es un correo automático, por favor no responder.
         """
-        recipient_email = citamedica.paciente.email
-        send_mail(
-            subject,
-            message,
-            from_email=None,
-            recipient_list=[recipient_email],
-            fail_silently=False,
-        )
+        # se envía en segundo plano cuando se confirma la transacción (bandeja de salida)
+        BandejaCorreo.encolar(subject, message, citamedica.paciente.email)
         
         save_audit(self.request, citamedica, action='M')
         messages.success(self.request, f"Éxito al Modificar la cita medica del paciente : {citamedica.paciente}.")
@@ -162,8 +182,8 @@ class CitaMedicaDeleteView(LoginRequiredMixin, DeleteViewMixin, DeleteView):
         context['back_url'] = self.success_url
         return context
     
-    def delete(self, request, *args, **kwargs):
-        self.object = self.get_object()
+    # DeleteView procesa el POST en form_valid (delete() ya no se llama)
+    def form_valid(self, form):
         citamedica = self.object
         
         # Enviar correo electrónico de cancelación de cita
@@ -180,18 +200,12 @@ class CitaMedicaDeleteView(LoginRequiredMixin, DeleteViewMixin, DeleteView):
         ------------------------------------------
         Este es un correo automático, por favor no responder.
         """
-        recipient_email = citamedica.paciente.email
-        send_mail(
-            subject,
-            message,
-            from_email=None,
-            recipient_list=[recipient_email],
-            fail_silently=False,
-        )
+        # se envía en segundo plano cuando se confirma la transacción (bandeja de salida)
+        BandejaCorreo.encolar(subject, message, citamedica.paciente.email)
         
-        success_message = f"Éxito al eliminar lógicamente la cita medica {self.object.name}."
+        success_message = f"Éxito al eliminar lógicamente la cita medica {citamedica}."
         messages.success(self.request, success_message)
-        return super().delete(request, *args, **kwargs)
+        return super().form_valid(form)
     
     
 class CitaMedicaDetailView(LoginRequiredMixin,DetailView):
@@ -207,25 +221,63 @@ class CitaMedicaDetailView(LoginRequiredMixin,DetailView):
             # Añade más campos según tu modelo
         }
         return JsonResponse(data)
-    
-def enviar_notificacion_cita(cita, asunto, mensaje):
-    send_mail(
-        asunto,
-        mensaje,
-        settings.EMAIL_HOST_USER,
-        [cita.paciente.email],
-        fail_silently=False,
-    )
-
-def enviar_recordatorios():
-    manana = (timezone.now() + timezone.timedelta(days=1)).date()  # Obtener la fecha de mañana
-
-    citas_manana = CitaMedica.objects.filter(
-        fecha=manana,      # Filtrar citas con fecha igual a mañana
-        estado='P'         # 'P' para Programada
-    )
-    for cita in citas_manana:
-        asunto = 'Recordatorio de cita médica (mañana)'
-        mensaje = f'Estimado(a) {cita.paciente.nombre_completo},\n\nLe recordamos que tiene una cita médica con el Dr. {cita.doctor.nombre_completo} mañana a las {cita.hora_cita}.\n\nAtentamente,\nClínica SaludSync'
-
-        enviar_notificacion_cita(cita, asunto, mensaje)
\ No newline at end of file
+
+
+# días máximos por consulta de disponibilidad
+MAX_DIAS_DISPONIBILIDAD = 62
+
+# Horas libres para agendar: ?desde=AAAA-MM-DD&hasta=AAAA-MM-DD (por defecto solo desde)
+# y ?excluir=<id> para no contar la cita que se está modificando
+@login_required
+@transaction.non_atomic_requests
+def disponibilidad_citas(request):
+    try:
+        desde = parse_date(request.GET.get('desde') or '')
+        hasta = parse_date(request.GET.get('hasta') or '') or desde
+    except ValueError:
+        desde = None
+    if desde is None:
+        return JsonResponse({'error': 'Las fechas deben tener el formato AAAA-MM-DD'}, status=400)
+    if desde > hasta or (hasta - desde).days >= MAX_DIAS_DISPONIBILIDAD:
+        return JsonResponse({'error': f'El rango debe tener entre 1 y {MAX_DIAS_DISPONIBILIDAD} días'}, status=400)
+    excluir = request.GET.get('excluir')
+
+    disponibilidad = DisponibilidadCitas()
+    return JsonResponse({
+        'duracion': disponibilidad.duracion,
+        'dias': disponibilidad.calcular(desde, hasta, excluir if excluir and excluir.isdigit() else None),
+    })
+
+
+# Renueva el enlace del calendario .ics del usuario; el anterior deja de funcionar
+@login_required
+@require_POST
+def renovar_calendario_citas(request):
+    CalendarioCitas.renovar_token(request.user)
+    messages.success(request, "Se generó un nuevo enlace de calendario. El enlace anterior ya no funciona.")
+    return redirect('attention:citaMedica_list')
+
+
+# Calendario .ics de las citas para suscribirse desde Google Calendar, Outlook, etc.
+# Se accede con el token secreto del usuario (los clientes no envían la sesión). Con
+# If-None-Match la respuesta 304 solo cuesta la consulta agrupada de las firmas por día;
+# si algo cambió, el archivo se envía por partes y solo se regeneran los días modificados
+@transaction.non_atomic_requests
+def calendario_citas(request, token):
+    if CalendarioCitas.get_usuario(token) is None:
+        raise Http404("Calendario no encontrado")
+
+    calendario = CalendarioCitas()
+    etag = calendario.get_etag()
+    ultima = calendario.get_ultima_modificacion()
+    last_modified = ultima.timestamp() if ultima else None
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        response = StreamingHttpResponse(calendario.generar(), content_type='text/calendar; charset=utf-8')
+        response['Content-Disposition'] = 'inline; filename="citas.ics"'
+        response['ETag'] = etag
+        if last_modified:
+            response['Last-Modified'] = http_date(last_modified)
+    patch_cache_control(response, private=True, max_age=settings.ICS_FEED_MAX_AGE)
+    return response
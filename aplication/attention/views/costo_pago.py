@@ -1,32 +1,59 @@
 from django.shortcuts import redirect, get_object_or_404
-from django.http import JsonResponse, HttpResponse
-from django.template.loader import get_template
+from django.http import JsonResponse, FileResponse, StreamingHttpResponse
+from django.core.files.storage import default_storage
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_date
+from django.utils.http import http_date
 from django.views.generic import CreateView, ListView, UpdateView, DeleteView, View
+from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
-from django.db.models import Sum
 from django.db import transaction
-from weasyprint import HTML
-from io import BytesIO
-from django.conf import settings
+from django.utils.decorators import method_decorator
 from django.urls import reverse_lazy
-import paypalrestsdk
+from django.conf import settings
 from aplication.attention.models import (
     Pago,
-    Atencion,
     CostosAtencion,
-    ServiciosAdicionales,
-    ExamenSolicitado,
-    DetalleAtencion
+    ExamenSolicitado
 )
 from aplication.attention.forms.pago import PagoForm
+from aplication.attention.instance.saldo_paciente import SaldoPaciente
+from aplication.attention.instance.comprobante_pago import ComprobantePago
+from aplication.attention.instance.estado_pago import EstadoPago
+from aplication.attention.instance.exportar_comprobantes import ExportacionComprobantes
+from aplication.attention.instance.pasarela_pago import ErrorPasarela, get_pasarela
+from aplication.attention.tasks import confirmar_pago
+
+# Registra el pago pendiente y crea el cobro en la pasarela.
+# La vista no corre dentro de ATOMIC_REQUESTS: el pago pendiente se guarda en su propia
+# transacción y la llamada HTTP a la pasarela no retiene ninguna conexión a la base de datos.
+def iniciar_pago_paypal(request, form, total, success_url):
+    pago = form.instance
+    if pago.pk is None:
+        # Reutiliza el pago pendiente de un intento anterior sobre el mismo costo de atención
+        pago = Pago.objects.filter(costo_atencion=pago.costo_atencion, pagado=False).first() or pago
+        pago.paciente = form.instance.paciente
+        pago.costo_atencion = form.instance.costo_atencion
+    pago.metodo_pago = 'PayPal'
+    pago.monto = total
+
+    try:
+        with transaction.atomic():
+            pago.save()
+        payment_id, approval_url = get_pasarela().crear_pago(
+            pago,
+            request.build_absolute_uri(reverse_lazy('attention:paypal_execute')),
+            request.build_absolute_uri(reverse_lazy('attention:pago_list'))
+        )
+        Pago.objects.filter(pk=pago.pk).update(payment_id=payment_id)
+    except ErrorPasarela as e:
+        messages.error(request, f"Hubo un problema al procesar el pago con PayPal: {e}")
+        return redirect(success_url)
+    return redirect(approval_url)
 
-# Configuración de PayPal
-paypalrestsdk.configure({
-    "mode": "sandbox",  # Cambiar a "live" en producción
-    "client_id": settings.PAYPAL_CLIENT_ID,
-    "client_secret": settings.PAYPAL_SECRET
-})
+# Pacientes que se aceptan en una consulta de estado de pagos
+MAX_PACIENTES_ESTADO = 200
 
 ### VISTAS CLASE-BASED VIEWS ###
 
@@ -37,6 +64,7 @@ class PagoListView(LoginRequiredMixin, ListView):
     context_object_name = 'pagos'
 
 # Crear un pago
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
 class PagoCreateView(LoginRequiredMixin, CreateView):
     model = Pago
     template_name = 'attention/pago/form.html'
@@ -44,18 +72,7 @@ class PagoCreateView(LoginRequiredMixin, CreateView):
     success_url = reverse_lazy('attention:pago_list')
 
     def obtener_costos_completos_paciente(self, paciente_id):
-        costos_atencion = CostosAtencion.objects.filter(atencion__paciente_id=paciente_id, activo=True)
-        total_costos_atencion = costos_atencion.aggregate(Sum('total'))['total__sum'] or 0
-
-        servicios_adicionales = ServiciosAdicionales.objects.filter(
-            costo_atencion__atencion__paciente_id=paciente_id
-        )
-        total_servicios_adicionales = servicios_adicionales.aggregate(Sum('costo_servicio'))['costo_servicio__sum'] or 0
-
-        examenes = ExamenSolicitado.objects.filter(atencion__paciente_id=paciente_id)
-        total_examenes = examenes.aggregate(Sum('costo'))['costo__sum'] or 0
-
-        return total_costos_atencion + total_servicios_adicionales + total_examenes
+        return SaldoPaciente.obtener(paciente_id)['total_general']
 
     def validar_costo_atencion(self, atencion):
         if not CostosAtencion.objects.filter(atencion=atencion).exists():
@@ -93,12 +110,12 @@ class PagoCreateView(LoginRequiredMixin, CreateView):
 
         if metodo_pago == 'PayPal':
             return self.process_paypal_payment(form, total_costos)
-        return self.process_cash_payment(form)
+        return self.process_cash_payment(form, total_costos)
 
-    def process_cash_payment(self, form):
+    def process_cash_payment(self, form, total):
         try:
             with transaction.atomic():
-                form.instance.monto = self.obtener_costos_completos_paciente(form.cleaned_data['paciente'].id)
+                form.instance.monto = total
                 form.save()
             messages.success(self.request, "El pago en efectivo se ha registrado correctamente.")
         except Exception as e:
@@ -106,38 +123,10 @@ class PagoCreateView(LoginRequiredMixin, CreateView):
         return redirect(self.success_url)
 
     def process_paypal_payment(self, form, total):
-        items = [{
-            "name": "Pago Médico",
-            "sku": "001",
-            "price": f"{total:.2f}",
-            "currency": "USD",
-            "quantity": 1
-        }]
-
-        payment = paypalrestsdk.Payment({
-            "intent": "sale",
-            "payer": {"payment_method": "paypal"},
-            "redirect_urls": {
-                "return_url": self.request.build_absolute_uri(reverse_lazy('attention:paypal_execute')),
-                "cancel_url": self.request.build_absolute_uri(reverse_lazy('attention:pago_list'))
-            },
-            "transactions": [{
-                "item_list": {"items": items},
-                "amount": {"total": f"{total:.2f}", "currency": "USD"},
-                "description": "Pago de servicios médicos"
-            }]
-        })
-
-        if payment.create():
-            approval_url = next((link.href for link in payment.links if link.rel == "approval_url"), None)
-            if approval_url:
-                return redirect(approval_url)
-
-        error_msg = payment.error.get('message', 'Error desconocido') if payment.error else 'Error al crear el pago'
-        messages.error(self.request, f"Hubo un problema al procesar el pago con PayPal: {error_msg}")
-        return redirect(self.success_url)
+        return iniciar_pago_paypal(self.request, form, total, self.success_url)
 
 # Editar un pago
+@method_decorator(transaction.non_atomic_requests, name='dispatch')
 class PagoUpdateView(LoginRequiredMixin, UpdateView):
     model = Pago
     template_name = 'attention/pago/form.html'
@@ -145,23 +134,7 @@ class PagoUpdateView(LoginRequiredMixin, UpdateView):
     success_url = reverse_lazy('attention:pago_list')
 
     def obtener_costos_completos_paciente(self, paciente_id):
-        costos_atencion = CostosAtencion.objects.filter(atencion__paciente_id=paciente_id, activo=True)
-        total_costos_atencion = costos_atencion.aggregate(Sum('total'))['total__sum'] or 0
-
-        servicios_adicionales = ServiciosAdicionales.objects.filter(
-            costo_atencion__atencion__paciente_id=paciente_id
-        )
-        total_servicios_adicionales = servicios_adicionales.aggregate(Sum('costo_servicio'))['costo_servicio__sum'] or 0
-
-        examenes = ExamenSolicitado.objects.filter(atencion__paciente_id=paciente_id)
-        total_examenes = examenes.aggregate(Sum('costo'))['costo__sum'] or 0
-
-        medicinas = DetalleAtencion.objects.filter(atencion__paciente_id=paciente_id)
-        total_medicinas = sum(
-            detalle.medicamento.precio * detalle.cantidad for detalle in medicinas
-        )
-
-        return total_costos_atencion + total_servicios_adicionales + total_examenes + total_medicinas
+        return SaldoPaciente.obtener(paciente_id)['total_general']
 
     def validar_costo_atencion(self, atencion):
         if not CostosAtencion.objects.filter(atencion=atencion).exists():
@@ -174,37 +147,11 @@ class PagoUpdateView(LoginRequiredMixin, UpdateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        paciente_id = self.object.paciente.id
-        total_costos = self.obtener_costos_completos_paciente(paciente_id)
-        context['total_a_pagar'] = total_costos
-        context['costos_detallados'] = self.obtener_costos_detallados(paciente_id)
+        saldo = SaldoPaciente.obtener(self.object.paciente_id)
+        context['total_a_pagar'] = saldo['total_general']
+        context['costos_detallados'] = SaldoPaciente.get_detalle(saldo)
         return context
 
-    def obtener_costos_detallados(self, paciente_id):
-        costos_atencion = CostosAtencion.objects.filter(atencion__paciente_id=paciente_id, activo=True)
-        total_costos_atencion = costos_atencion.aggregate(Sum('total'))['total__sum'] or 0
-
-        servicios_adicionales = ServiciosAdicionales.objects.filter(
-            costo_atencion__atencion__paciente_id=paciente_id
-        )
-        total_servicios_adicionales = servicios_adicionales.aggregate(Sum('costo_servicio'))['costo_servicio__sum'] or 0
-
-        examenes = ExamenSolicitado.objects.filter(atencion__paciente_id=paciente_id)
-        total_examenes = examenes.aggregate(Sum('costo'))['costo__sum'] or 0
-
-        medicinas = DetalleAtencion.objects.filter(atencion__paciente_id=paciente_id)
-        total_medicinas = sum(
-            detalle.medicamento.precio * detalle.cantidad for detalle in medicinas
-        )
-
-        detalles = f"Costos Atención: ${total_costos_atencion:.2f}\n"
-        detalles += f"Servicios Adicionales: ${total_servicios_adicionales:.2f}\n"
-        detalles += f"Exámenes: ${total_examenes:.2f}\n"
-        detalles += f"Medicinas: ${total_medicinas:.2f}\n\n"
-        detalles += f"Total General: ${total_costos_atencion + total_servicios_adicionales + total_examenes + total_medicinas:.2f}"
-
-        return detalles
-
     def form_valid(self, form):
         paciente = form.cleaned_data['paciente']
         atencion = paciente.doctores_atencion.first()
@@ -232,12 +179,12 @@ class PagoUpdateView(LoginRequiredMixin, UpdateView):
 
         if metodo_pago == 'PayPal':
             return self.process_paypal_payment(form, total_costos)
-        return self.process_cash_payment(form)
+        return self.process_cash_payment(form, total_costos)
 
-    def process_cash_payment(self, form):
+    def process_cash_payment(self, form, total):
         try:
             with transaction.atomic():
-                form.instance.monto = self.obtener_costos_completos_paciente(form.cleaned_data['paciente'].id)
+                form.instance.monto = total
                 form.save()
             messages.success(self.request, "El pago en efectivo se ha registrado correctamente.")
         except Exception as e:
@@ -245,32 +192,7 @@ class PagoUpdateView(LoginRequiredMixin, UpdateView):
         return redirect(self.success_url)
 
     def process_paypal_payment(self, form, total):
-        items = [{
-            "name": "Pago Médico",
-            "sku": "001",
-            "price": str(total),
-            "currency": "USD",
-            "quantity": 1
-        }]
-
-        payment = paypalrestsdk.Payment({
-            "intent": "sale",
-            "payer": {"payment_method": "paypal"},
-            "redirect_urls": {
-                "return_url": self.request.build_absolute_uri(reverse_lazy('attention:paypal_execute')),
-                "cancel_url": self.request.build_absolute_uri(reverse_lazy('attention:pago_list'))
-            },
-            "transactions": [{
-                "item_list": {"items": items},
-                "amount": {"total": str(total), "currency": "USD"},
-                "description": "Pago de servicios médicos"
-            }]
-        })
-
-        if payment.create():
-            return redirect(next(link.href for link in payment.links if link.rel == "approval_url"))
-        messages.error(self.request, "Hubo un problema al procesar el pago con PayPal.")
-        return redirect(self.success_url)
+        return iniciar_pago_paypal(self.request, form, total, self.success_url)
 
 # Eliminar un pago
 class PagoDeleteView(LoginRequiredMixin, DeleteView):
@@ -285,25 +207,68 @@ class PagoDeleteView(LoginRequiredMixin, DeleteView):
         return redirect(self.success_url)
 
 # Comprobante de pago (PDF)
+# El PDF se guarda con el nombre de su huella: si ya existe se sirve sin volver a dibujarlo
+# y el navegador lo revalida con ETag/Last-Modified
 class PagoComprobanteView(View):
     def get(self, request, *args, **kwargs):
-        pago = get_object_or_404(Pago, pk=self.kwargs['pk'])
-        context = {
-            'pago': pago,
-            'total_pagado': pago.monto,
-        }
-        html = get_template('attention/pago/comprobante.html').render(context)
-        pdf = BytesIO()
-        HTML(string=html).write_pdf(pdf)
-
-        response = HttpResponse(pdf.getvalue(), content_type='application/pdf')
-        response['Content-Disposition'] = f'attachment; filename="comprobante_pago_{pago.pk}.pdf"'
+        pago = get_object_or_404(Pago.objects.select_related('paciente', 'costo_atencion'), pk=self.kwargs['pk'])
+        huella = ComprobantePago.get_huella(pago)
+        nombre = ComprobantePago.get_nombre(huella)
+        etag = f'"{huella}"'
+
+        if default_storage.exists(nombre):
+            last_modified = default_storage.get_modified_time(nombre).timestamp()
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is not None:
+                patch_cache_control(response, private=True, no_cache=True)
+                return response
+        else:
+            nombre = ComprobantePago.obtener(pago, huella)
+            last_modified = default_storage.get_modified_time(nombre).timestamp()
+
+        response = FileResponse(
+            default_storage.open(nombre, 'rb'),
+            as_attachment=True,
+            filename=ComprobantePago.get_nombre_descarga(pago),
+            content_type='application/pdf'
+        )
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
 
+# Exportación de comprobantes en un ZIP, filtrados por rango de fechas y método de pago.
+# El archivo se envía por partes mientras se genera; el avance se consulta con el token
+# en progreso_exportacion_comprobantes
+class PagoExportarComprobantesView(LoginRequiredMixin, View):
+    def get(self, request, *args, **kwargs):
+        try:
+            fecha_inicio = parse_date(request.GET.get('fecha_inicio') or '')
+            fecha_fin = parse_date(request.GET.get('fecha_fin') or '')
+        except ValueError:
+            return JsonResponse({'error': 'Las fechas deben tener el formato AAAA-MM-DD'}, status=400)
+        metodo_pago = request.GET.get('metodo_pago') or None
+        if metodo_pago and metodo_pago not in dict(Pago._meta.get_field('metodo_pago').choices):
+            return JsonResponse({'error': 'Método de pago no válido'}, status=400)
+
+        exportacion = ExportacionComprobantes(fecha_inicio, fecha_fin, metodo_pago, request.GET.get('token'))
+        response = StreamingHttpResponse(exportacion.generar_zip(), content_type='application/zip')
+        response['Content-Disposition'] = f'attachment; filename="{exportacion.get_nombre_archivo()}"'
         return response
 
 ### FUNCIONES (API JSON RESPONSES) ###
 
-# Procesar el pago con PayPal
+# Avance de una exportación de comprobantes
+@login_required
+def progreso_exportacion_comprobantes(request):
+    token = request.GET.get('token')
+    progreso = ExportacionComprobantes.get_progreso(token) if token else None
+    if progreso is None:
+        return JsonResponse({'error': 'No se encontró la exportación indicada.'}, status=404)
+    return JsonResponse(progreso)
+
+# Procesar el pago con PayPal: la confirmación con la pasarela se hace en segundo plano
+@transaction.non_atomic_requests
 def paypal_execute(request):
     payment_id = request.GET.get('paymentId')
     payer_id = request.GET.get('PayerID')
@@ -312,41 +277,56 @@ def paypal_execute(request):
         messages.error(request, "Datos insuficientes para completar el pago con PayPal.")
         return redirect('attention:pago_list')
 
-    try:
-        payment = paypalrestsdk.Payment.find(payment_id)
-        if payment.execute({"payer_id": payer_id}):
-            # Aquí puedes actualizar el estado del pago en tu modelo Pago
-            Pago.objects.filter(payment_id=payment_id).update(pagado=True)
-            messages.success(request, "El pago con PayPal se ha procesado correctamente.")
-            return redirect('attention:pago_list')
-        else:
-            raise Exception(payment.error)
-    except Exception as e:
-        messages.error(request, f"Error en PayPal: {e}")
+    pago = Pago.objects.filter(payment_id=payment_id).only('pk', 'pagado').first()
+    if pago is None:
+        messages.error(request, "No se encontró el pago de PayPal indicado.")
         return redirect('attention:pago_list')
 
-# Verificar si un paciente tiene pagos
+    if pago.pagado:
+        messages.success(request, "El pago con PayPal ya fue procesado.")
+        return redirect('attention:pago_list')
+
+    # el pagador queda guardado: si el broker no responde, confirmar_pagos_pendientes reintenta
+    Pago.objects.filter(pk=pago.pk, pagado=False).update(payer_id=payer_id)
+    transaction.on_commit(lambda: confirmar_pago.delay(pago.pk, payer_id), robust=True)
+    messages.success(request, "El pago con PayPal fue aprobado y se está confirmando.")
+    return redirect('attention:pago_list')
+
+# Verificar si un paciente tiene pagos (solo lectura, respuesta en caché por pocos segundos)
+@login_required
+@transaction.non_atomic_requests
 def verificar_pago_paciente(request):
     paciente_id = request.GET.get('paciente_id')
 
     if not paciente_id:
         return JsonResponse({'error': 'El ID del paciente es obligatorio'}, status=400)
+    if not paciente_id.isdigit():
+        return JsonResponse({'error': 'El ID del paciente no es válido'}, status=400)
 
-    atencion = Atencion.objects.filter(paciente_id=paciente_id).first()
-    if not atencion:
+    estado = EstadoPago.consultar([int(paciente_id)]).get(int(paciente_id))
+    if not estado or not estado['tiene_atencion']:
         return JsonResponse({'error': 'No se encontró ninguna atención asociada al paciente.'}, status=400)
 
-    # Verifica o crea costos de atención
-    if not CostosAtencion.objects.filter(atencion=atencion).exists():
-        CostosAtencion.objects.create(
-            atencion=atencion,
-            costo_consulta=100.00,
-            descripcion="Consulta médica general",
-            activo=True
-        )
+    response = JsonResponse({'ha_pagado': estado['ha_pagado']})
+    patch_cache_control(response, private=True, max_age=settings.PAYMENT_STATUS_CACHE_TTL)
+    return response
+
+# Estado de pago de varios pacientes en una sola llamada: ?ids=1,2,3
+@login_required
+@transaction.non_atomic_requests
+def estado_pagos_pacientes(request):
+    ids = [valor for valor in request.GET.get('ids', '').split(',') if valor]
+    if not ids:
+        return JsonResponse({'error': 'Debe indicar al menos un ID de paciente'}, status=400)
+    if len(ids) > MAX_PACIENTES_ESTADO:
+        return JsonResponse({'error': f'Se permiten como máximo {MAX_PACIENTES_ESTADO} pacientes por consulta'}, status=400)
+    if not all(valor.isdigit() for valor in ids):
+        return JsonResponse({'error': 'Los IDs de paciente no son válidos'}, status=400)
 
-    ha_pagado = Pago.objects.filter(paciente_id=paciente_id, pagado=True).exists()
-    return JsonResponse({'ha_pagado': ha_pagado})
+    estados = EstadoPago.consultar([int(valor) for valor in ids])
+    response = JsonResponse({'pacientes': {str(pk): estado for pk, estado in estados.items()}})
+    patch_cache_control(response, private=True, max_age=settings.PAYMENT_STATUS_CACHE_TTL)
+    return response
 
 
 # Obtener los exámenes pendientes de un paciente
@@ -362,44 +342,13 @@ def obtener_costos_completos_paciente(request):
     if not paciente_id:
         return JsonResponse({'error': 'El ID del paciente es obligatorio'}, status=400)
     
-    # Verificar que el paciente tiene al menos una atención
-    atencion = Atencion.objects.filter(paciente_id=paciente_id).first()
-    if not atencion:
+    # Calcula el saldo y verifica que el paciente tiene al menos una atención en una sola consulta
+    saldo = SaldoPaciente.obtener(paciente_id)
+    if not saldo['tiene_atencion']:
         return JsonResponse({'error': 'No se encontró ninguna atención asociada al paciente.'}, status=400)
 
-    # Calcular costos de atención
-    costos_atencion = CostosAtencion.objects.filter(atencion__paciente_id=paciente_id, activo=True)
-    total_costos_atencion = costos_atencion.aggregate(Sum('total'))['total__sum'] or 0
-
-    # Calcular costos de servicios adicionales
-    servicios_adicionales = ServiciosAdicionales.objects.filter(
-        costo_atencion__atencion__paciente_id=paciente_id
-    )
-    total_servicios_adicionales = servicios_adicionales.aggregate(Sum('costo_servicio'))['costo_servicio__sum'] or 0
-
-    # Calcular costos de exámenes
-    examenes = ExamenSolicitado.objects.filter(atencion__paciente_id=paciente_id)
-    print(examenes)
-    total_examenes = examenes.aggregate(Sum('costo'))['costo__sum'] or 0
-
-    # Calcular costos de medicinas
-    medicinas = DetalleAtencion.objects.filter(atencion__paciente_id=paciente_id)
-    total_medicinas = sum(
-        detalle.medicamento.precio * detalle.cantidad for detalle in medicinas
-    )
-
-    # Total general
-    total_general = total_costos_atencion + total_servicios_adicionales + total_examenes + total_medicinas
-
     # Devolver la respuesta JSON con los costos
     return JsonResponse({
-        'costos_atencion': str(total_costos_atencion),
-        'servicios_adicionales': str(total_servicios_adicionales),
-        'examenes': str(total_examenes),
-        'medicinas': str(total_medicinas),
-        'total_general': str(total_general)
+        componente: str(saldo[componente])
+        for componente in SaldoPaciente.COMPONENTES + ('total_general',)
     })
-
-
-
-
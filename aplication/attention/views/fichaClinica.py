@@ -38,7 +38,7 @@ class FichaClinicaDetailView(LoginRequiredMixin, DetailView):
             'atenciones': Atencion.objects.filter(paciente=paciente).order_by('-fecha_atencion'),
             'medicamentos': DetalleAtencion.objects.filter(atencion__paciente=paciente).select_related('medicamento'),
             'certificados': Certificado.objects.filter(paciente=paciente).order_by('-fecha_emision'),
-            'edad': self.calcular_edad(paciente.fecha_nacimiento)
+            'edad': paciente.calcular_edad()
         })
 
         self._add_ultima_atencion_data(context, paciente)
@@ -46,11 +46,6 @@ class FichaClinicaDetailView(LoginRequiredMixin, DetailView):
 
         return context
      
-    def calcular_edad(self, fecha_nacimiento):
-        from datetime import date
-        today = date.today()
-        return today.year - fecha_nacimiento.year - ((today.month, today.day) < (fecha_nacimiento.month, fecha_nacimiento.day))
-
     def _add_ultima_atencion_data(self, context, patient):
         ultima_atencion = Atencion.objects.filter(paciente=patient).order_by('-fecha_atencion').first()
         if ultima_atencion:
@@ -90,7 +85,7 @@ class ImprimirHistorialClinico(View):
             'atenciones': atenciones,
             'medicamentos': medicamentos,
             'certificados': certificados,
-            'edad': FichaClinicaDetailView().calcular_edad(paciente.fecha_nacimiento)
+            'edad': paciente.calcular_edad()
         }
 
         # Renderizar el HTML
@@ -73,6 +73,11 @@ class AttentionCreateView(LoginRequiredMixin,CreateViewMixin, CreateView):
                 
                 atencion.save()
                 
+                # Precios vigentes del catálogo en una sola consulta
+                precios = dict(Medicamento.objects.filter(
+                    id__in=[int(medicamento['codigo']) for medicamento in medicamentos]
+                ).values_list('id', 'precio'))
+
                 # Ahora procesamos el arreglo de medicamentos
                 for medicamento in medicamentos:
                     #Crear el detalle de atención para cada medicamento
@@ -81,6 +86,7 @@ class AttentionCreateView(LoginRequiredMixin,CreateViewMixin, CreateView):
                         medicamento_id=int(medicamento['codigo']),
                         cantidad=int(medicamento['cantidad']),
                         prescripcion=medicamento['prescripcion'],
+                        precio_unitario=precios.get(int(medicamento['codigo'])),
                         # Si necesitas la duración del tratamiento, puedes agregarla aquí
                     )
                 
@@ -140,6 +146,12 @@ class AttentionUpdateView(LoginRequiredMixin,UpdateViewMixin,UpdateView):
                 
                 atencion.save()
                 
+                # Los medicamentos que ya estaban prescritos conservan el precio con el que se registraron
+                precios = dict(Medicamento.objects.filter(
+                    id__in=[int(medicamento['codigo']) for medicamento in medicamentos]
+                ).values_list('id', 'precio'))
+                precios.update(DetalleAtencion.objects.filter(atencion_id=atencion.id).values_list('medicamento_id', 'precio_unitario'))
+
                 DetalleAtencion.objects.filter(atencion_id=atencion.id).delete()
                 for medicamento in medicamentos:
                     DetalleAtencion.objects.create(
@@ -147,6 +159,7 @@ class AttentionUpdateView(LoginRequiredMixin,UpdateViewMixin,UpdateView):
                         medicamento_id=int(medicamento['codigo']),
                         cantidad=int(medicamento['cantidad']),
                         prescripcion=medicamento['prescripcion'],
+                        precio_unitario=precios.get(int(medicamento['codigo'])),
                     )
                 
                 save_audit(request, atencion, "M")
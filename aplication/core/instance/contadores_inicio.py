@@ -0,0 +1,78 @@
+import datetime
+from django.conf import settings
+from django.core.cache import cache
+from aplication.core.models import Paciente
+from aplication.attention.models import Atencion, CitaMedica
+from doctor.utils import get_ttl_cache, get_version_datos
+
+
+class ContadoresInicio:
+    CLAVE = 'contador_inicio_{}'
+    MODELOS = {
+        'pacientes': Paciente,
+        'citas': CitaMedica,
+        'atenciones': Atencion,
+    }
+
+    @staticmethod
+    def get_clave(nombre):
+        return ContadoresInicio.CLAVE.format(nombre)
+
+    @staticmethod
+    # nombre del contador de un modelo (None si el modelo no se cuenta)
+    def get_nombre(modelo):
+        return next((nombre for nombre, contado in ContadoresInicio.MODELOS.items() if contado is modelo), None)
+
+    @staticmethod
+    # los contadores salen de la caché; solo los que falten se cuentan en la base de datos.
+    # Se guardan con add para no pisar un incremento hecho entre el COUNT y la escritura,
+    # y vencen para volver a contarse (con caché local, cada pocos segundos)
+    def obtener():
+        claves = {ContadoresInicio.get_clave(nombre): nombre for nombre in ContadoresInicio.MODELOS}
+        en_cache = cache.get_many(claves.keys())
+        contadores = {claves[clave]: valor for clave, valor in en_cache.items()}
+        for nombre, modelo in ContadoresInicio.MODELOS.items():
+            if nombre not in contadores:
+                contadores[nombre] = modelo.objects.count()
+                cache.add(ContadoresInicio.get_clave(nombre), contadores[nombre], get_ttl_cache(settings.DASHBOARD_CACHE_TTL))
+        return contadores
+
+    @staticmethod
+    # suma (o resta) al contador en caché; si no está, la próxima lectura lo cuenta de nuevo
+    def incrementar(nombre, delta=1):
+        try:
+            cache.incr(ContadoresInicio.get_clave(nombre), delta)
+        except ValueError:
+            pass
+
+    @staticmethod
+    # vuelve a contar todo y corrige la caché (los cambios masivos, como bulk_create o
+    # QuerySet.delete sin señales, no pasan por incrementar); devuelve las diferencias
+    def reconciliar():
+        claves = {ContadoresInicio.get_clave(nombre): nombre for nombre in ContadoresInicio.MODELOS}
+        en_cache = {claves[clave]: valor for clave, valor in cache.get_many(claves.keys()).items()}
+        contadores = {nombre: modelo.objects.count() for nombre, modelo in ContadoresInicio.MODELOS.items()}
+        cache.set_many({ContadoresInicio.get_clave(nombre): valor for nombre, valor in contadores.items()}, get_ttl_cache(settings.DASHBOARD_CACHE_TTL))
+        return {
+            nombre: valor - en_cache[nombre]
+            for nombre, valor in contadores.items()
+            if nombre in en_cache and en_cache[nombre] != valor
+        }
+
+    @staticmethod
+    # último paciente, última cita, última cita realizada y citas pendientes de hoy; se guardan
+    # en caché con las versiones de datos de citas y pacientes, que cambian con cada modificación
+    def recientes():
+        hoy = datetime.date.today()
+        clave = f"inicio_recientes_{get_version_datos('citas')}_{get_version_datos('pacientes')}_{hoy.isoformat()}"
+        return cache.get_or_set(clave, lambda: ContadoresInicio.consultar_recientes(hoy), get_ttl_cache(settings.DASHBOARD_CACHE_TTL))
+
+    @staticmethod
+    def consultar_recientes(hoy):
+        citas = CitaMedica.objects.select_related('paciente')
+        return {
+            'ultimo_paciente': Paciente.objects.order_by('-id').first(),
+            'proximas_citas': list(citas.filter(fecha=hoy, estado='P').order_by('hora_cita')),
+            'ultima_cita_completada': citas.filter(estado='R').order_by('-fecha', '-hora_cita').first(),
+            'ultima_cita': citas.order_by('-fecha', '-hora_cita').first(),
+        }
@@ -0,0 +1,94 @@
+import datetime
+import math
+from collections import defaultdict
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Case, Count, F, IntegerField, Q, Value, When
+from django.db.models.functions import ExtractYear
+from aplication.core.models import Paciente
+from doctor.utils import get_version_datos
+
+PERCENTILES = (25, 50, 75, 90)
+
+
+class Demografia:
+    @staticmethod
+    # edad exacta en la base de datos: diferencia de años menos uno si el cumpleaños
+    # de ese año todavía no llega (misma regla que doctor.utils.calcular_edad)
+    def expresion_edad(hoy, campo='fecha_nacimiento'):
+        sin_cumplir = Q(**{f'{campo}__month__gt': hoy.month}) | Q(
+            **{f'{campo}__month': hoy.month, f'{campo}__day__gt': hoy.day}
+        )
+        return Value(hoy.year) - ExtractYear(campo) - Case(
+            When(sin_cumplir, then=Value(1)), default=Value(0), output_field=IntegerField()
+        )
+
+    @staticmethod
+    # histograma (sexo, tipo de sangre, edad) -> pacientes con una sola consulta agrupada;
+    # a Python solo llegan las combinaciones distintas, nunca las filas de pacientes
+    def histograma(pacientes=None, hoy=None):
+        hoy = hoy or datetime.date.today()
+        pacientes = pacientes if pacientes is not None else Paciente.objects.all()
+        return list(
+            pacientes.annotate(edad=Demografia.expresion_edad(hoy))
+            .order_by()
+            .values('sexo', 'edad', tipo=F('tipo_sangre__tipo'))
+            .annotate(total=Count('id'))
+        )
+
+    @staticmethod
+    # total, promedio, percentiles y rangos de edad de un histograma {edad: pacientes}
+    def resumir(edades, tamaño_rango=10):
+        total = sum(edades.values())
+        resumen = {'total': total, 'edad_promedio': 0, 'percentiles': {}, 'rangos': []}
+        if not total:
+            return resumen
+        resumen['edad_promedio'] = round(sum(edad * n for edad, n in edades.items()) / total, 1)
+
+        # percentil por rango más cercano recorriendo el acumulado
+        acumulado = 0
+        pendientes = list(PERCENTILES)
+        for edad in sorted(edades):
+            acumulado += edades[edad]
+            while pendientes and acumulado >= math.ceil(pendientes[0] / 100 * total):
+                resumen['percentiles'][f'p{pendientes.pop(0)}'] = edad
+
+        rangos = defaultdict(int)
+        for edad, n in edades.items():
+            rangos[edad // tamaño_rango * tamaño_rango] += n
+        resumen['rangos'] = [
+            {'rango': f'{inicio}-{inicio + tamaño_rango - 1}', 'total': rangos[inicio]} for inicio in sorted(rangos)
+        ]
+        return resumen
+
+    @staticmethod
+    # distribución de edades general, por sexo y por tipo de sangre
+    def calcular(pacientes=None, hoy=None, tamaño_rango=10):
+        general = defaultdict(int)
+        por_sexo = defaultdict(lambda: defaultdict(int))
+        por_tipo = defaultdict(lambda: defaultdict(int))
+        for fila in Demografia.histograma(pacientes, hoy):
+            general[fila['edad']] += fila['total']
+            por_sexo[fila['sexo']][fila['edad']] += fila['total']
+            por_tipo[fila['tipo']][fila['edad']] += fila['total']
+
+        demografia = Demografia.resumir(general, tamaño_rango)
+        demografia['por_sexo'] = [
+            {'sexo': sexo, **Demografia.resumir(edades, tamaño_rango)} for sexo, edades in sorted(por_sexo.items())
+        ]
+        demografia['por_tipo_sangre'] = [
+            {'tipo_sangre': tipo, **Demografia.resumir(edades, tamaño_rango)}
+            for tipo, edades in sorted(por_tipo.items(), key=lambda item: (item[0] is None, item[0] or ''))
+        ]
+        return demografia
+
+    @staticmethod
+    # demografía de todos los pacientes guardada en caché por día y versión de los datos
+    # de pacientes (las señales de estadísticas la incrementan al cambiar un paciente)
+    def obtener():
+        hoy = datetime.date.today()
+        return cache.get_or_set(
+            f"demografia_{get_version_datos('pacientes')}_{hoy.isoformat()}",
+            lambda: Demografia.calcular(hoy=hoy),
+            settings.STATISTICS_API_CACHE_TTL,
+        )
@@ -0,0 +1,95 @@
+import datetime
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import ExtractMonth, ExtractWeekDay, ExtractYear, TruncMonth, TruncWeek
+from aplication.core.models import ResumenCitas
+from aplication.attention.models import CitaMedica
+from doctor.const import CITA_CHOICES
+
+MESES = range(1, 13)
+DIAS_SEMANA = range(1, 8)  # 1 = domingo, como ExtractWeekDay
+GRANULARIDADES = ('dia', 'semana', 'mes')
+
+
+# inicio del periodo al que pertenece una fecha (la semana empieza el lunes, como TruncWeek)
+def inicio_periodo(fecha, granularidad):
+    if granularidad == 'semana':
+        return fecha - datetime.timedelta(days=fecha.weekday())
+    if granularidad == 'mes':
+        return fecha.replace(day=1)
+    return fecha
+
+
+def siguiente_periodo(fecha, granularidad):
+    if granularidad == 'semana':
+        return fecha + datetime.timedelta(days=7)
+    if granularidad == 'mes':
+        return datetime.date(fecha.year + fecha.month // 12, fecha.month % 12 + 1, 1)
+    return fecha + datetime.timedelta(days=1)
+
+
+class EstadisticasCitas:
+    @staticmethod
+    # todas las estadísticas de citas en una sola consulta con agregación condicional:
+    # totales por estado, histograma mensual del año (si se indica) y por día de la semana
+    # (los alias llevan prefijo para no chocar con el campo ResumenCitas.total)
+    def _calcular(queryset, contar, año=None):
+        agregados = {'citas_total': contar(Q())}
+        for estado, _ in CITA_CHOICES:
+            agregados[f'estado_{estado}'] = contar(Q(estado=estado))
+        if año is not None:
+            for mes in MESES:
+                agregados[f'mes_{mes}'] = contar(Q(anio=año, mes=mes))
+        for dia in DIAS_SEMANA:
+            agregados[f'dia_{dia}'] = contar(Q(dia_semana=dia))
+        fila = queryset.aggregate(**agregados)
+
+        total = fila['citas_total'] or 0
+        por_estado = {estado: fila[f'estado_{estado}'] or 0 for estado, _ in CITA_CHOICES}
+        estadisticas = {
+            'total': total,
+            'por_estado': por_estado,
+            'tasa_finalizacion': round(por_estado.get('R', 0) / total * 100, 2) if total else 0,
+            # solo los meses y días con citas, como las consultas agrupadas a las que reemplaza
+            'por_dia': [{'dia': dia, 'total': fila[f'dia_{dia}']} for dia in DIAS_SEMANA if fila[f'dia_{dia}']],
+        }
+        if año is not None:
+            estadisticas['mensuales'] = [{'mes': mes, 'total': fila[f'mes_{mes}']} for mes in MESES if fila[f'mes_{mes}']]
+        return estadisticas
+
+    @staticmethod
+    # desde el resumen precalculado (lo que usa la vista de estadísticas)
+    def desde_resumen(año):
+        return EstadisticasCitas._calcular(
+            ResumenCitas.objects.all(), lambda filtro: Sum('total', filter=filtro), año
+        )
+
+    @staticmethod
+    # directamente sobre las citas (una sola pasada por la tabla); sin año no calcula el histograma mensual
+    def desde_citas(año=None, citas=None):
+        citas = (citas if citas is not None else CitaMedica.objects.all()).alias(
+            anio=ExtractYear('fecha'), mes=ExtractMonth('fecha'), dia_semana=ExtractWeekDay('fecha')
+        )
+        return EstadisticasCitas._calcular(citas, lambda filtro: Count('id', filter=filtro), año)
+
+    @staticmethod
+    # citas por día, semana o mes entre dos fechas (incluidas) con una consulta agrupada;
+    # los periodos sin citas aparecen con total 0
+    def serie(desde, hasta, granularidad='dia', citas=None):
+        citas = (citas if citas is not None else CitaMedica.objects.all()).filter(fecha__gte=desde, fecha__lte=hasta)
+        if granularidad == 'semana':
+            citas = citas.annotate(periodo=TruncWeek('fecha'))
+        elif granularidad == 'mes':
+            citas = citas.annotate(periodo=TruncMonth('fecha'))
+        else:
+            citas = citas.annotate(periodo=F('fecha'))
+        totales = {
+            fila['periodo']: fila['total']
+            for fila in citas.order_by().values('periodo').annotate(total=Count('id'))
+        }
+
+        serie = []
+        periodo = inicio_periodo(desde, granularidad)
+        while periodo <= hasta:
+            serie.append({'periodo': periodo.isoformat(), 'total': totales.get(periodo, 0)})
+            periodo = siguiente_periodo(periodo, granularidad)
+        return serie
@@ -0,0 +1,64 @@
+import datetime
+from django.db.models import Avg, Count, Exists, F, OuterRef, Q, Sum
+from django.utils import timezone
+from aplication.core.models import Paciente
+from aplication.attention.models import CitaMedica, DetalleAtencion
+from aplication.core.instance.demografia import Demografia
+from aplication.core.instance.estadisticas_citas import EstadisticasCitas
+from doctor.const import SEX_CHOICES
+
+
+class EstadisticasRango:
+    @staticmethod
+    # las mismas métricas de la vista de estadísticas, limitadas a un rango de fechas:
+    # citas con fecha en el rango, pacientes con alguna cita en el rango y medicamentos
+    # recetados en atenciones del rango
+    def calcular(desde, hasta, granularidad='mes', limite_medicamentos=10):
+        citas = CitaMedica.objects.filter(fecha__gte=desde, fecha__lte=hasta)
+        estadisticas = EstadisticasCitas.desde_citas(citas=citas)
+        return {
+            'desde': desde.isoformat(),
+            'hasta': hasta.isoformat(),
+            'granularidad': granularidad,
+            'citas': {
+                'total': estadisticas['total'],
+                'por_estado': estadisticas['por_estado'],
+                'tasa_finalizacion': estadisticas['tasa_finalizacion'],
+                'por_dia_semana': estadisticas['por_dia'],
+                'serie': EstadisticasCitas.serie(desde, hasta, granularidad),
+            },
+            'pacientes': EstadisticasRango.pacientes(citas, hasta),
+            'medicamentos_mas_recetados': EstadisticasRango.medicamentos(desde, hasta, limite_medicamentos),
+        }
+
+    @staticmethod
+    # total, género y edad exacta promedio (al final del rango) de los pacientes con citas, en una consulta
+    def pacientes(citas, hasta):
+        agregados = {
+            'pacientes_total': Count('id'),
+            'edad_promedio': Avg(Demografia.expresion_edad(hasta)),
+        }
+        for sexo, _ in SEX_CHOICES:
+            agregados[f'sexo_{sexo}'] = Count('id', filter=Q(sexo=sexo))
+        fila = Paciente.objects.filter(
+            Exists(citas.filter(paciente=OuterRef('pk')))
+        ).aggregate(**agregados)
+        return {
+            'total': fila['pacientes_total'],
+            'por_genero': [
+                {'sexo': sexo, 'total': fila[f'sexo_{sexo}']} for sexo, _ in SEX_CHOICES if fila[f'sexo_{sexo}']
+            ],
+            'edad_promedio': round(fila['edad_promedio'] or 0, 1),
+        }
+
+    @staticmethod
+    def medicamentos(desde, hasta, limite):
+        zona = timezone.get_current_timezone()
+        inicio = timezone.make_aware(datetime.datetime.combine(desde, datetime.time.min), zona)
+        fin = timezone.make_aware(datetime.datetime.combine(hasta + datetime.timedelta(days=1), datetime.time.min), zona)
+        return list(
+            DetalleAtencion.objects.filter(atencion__fecha_atencion__gte=inicio, atencion__fecha_atencion__lt=fin)
+            .values(nombre=F('medicamento__nombre'))
+            .annotate(total_recetado=Sum('cantidad'))
+            .order_by('-total_recetado')[:limite]
+        )
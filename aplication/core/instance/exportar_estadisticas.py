@@ -0,0 +1,136 @@
+import csv
+import datetime
+from django.db.models import Count, DateField, F, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+from aplication.attention.models import CitaMedica, DetalleAtencion
+from aplication.core.instance.demografia import PERCENTILES, Demografia
+from aplication.core.instance.estadisticas_citas import inicio_periodo, siguiente_periodo
+from aplication.core.models import ResumenCitas, ResumenMedicamentos, ResumenPacientes
+from doctor.const import CITA_CHOICES, SEX_CHOICES
+
+DIAS_SEMANA = ['Domingo', 'Lunes', 'Martes', 'Miércoles', 'Jueves', 'Viernes', 'Sábado']  # como ExtractWeekDay
+
+
+# csv.writer escribe cada fila aquí y la recibe de vuelta para enviarla,
+# así no se acumula ningún archivo en memoria
+class _Eco:
+    def write(self, valor):
+        return valor
+
+
+class ExportacionEstadisticas:
+    # filas que se leen de la base de datos en cada viaje del cursor
+    TAMANO_LOTE = 2000
+
+    def __init__(self, metrica, desde=None, hasta=None, granularidad='mes'):
+        self.metrica = metrica
+        self.desde = desde
+        self.hasta = hasta
+        self.granularidad = granularidad
+
+    # metrica -> (encabezados, método que genera las filas)
+    @classmethod
+    def get_metricas(cls):
+        return {
+            'citas_mensuales': (['Año', 'Mes', 'Citas'], cls.citas_mensuales),
+            'citas_por_estado': (['Estado', 'Citas'], cls.citas_por_estado),
+            'citas_por_dia': (['Día', 'Citas'], cls.citas_por_dia),
+            'crecimiento_pacientes': (['Año de nacimiento', 'Mes de nacimiento', 'Pacientes'], cls.crecimiento_pacientes),
+            'pacientes_por_genero': (['Sexo', 'Pacientes'], cls.pacientes_por_genero),
+            'edades': (
+                ['Grupo', 'Valor', 'Pacientes', 'Edad promedio'] + [f'P{p}' for p in PERCENTILES], cls.edades
+            ),
+            'medicamentos_recetados': (['Medicamento', 'Total recetado'], cls.medicamentos_recetados),
+            'serie_citas': (['Periodo', 'Citas'], cls.serie_citas),
+            'serie_recetas': (['Periodo', 'Unidades recetadas'], cls.serie_recetas),
+        }
+
+    def get_nombre_archivo(self):
+        partes = [self.metrica]
+        if self.metrica.startswith('serie_'):
+            partes += [self.desde.isoformat(), self.hasta.isoformat(), self.granularidad]
+        return '_'.join(partes) + '.csv'
+
+    def generar_csv(self):
+        encabezados, filas = self.get_metricas()[self.metrica]
+        escritor = csv.writer(_Eco())
+        # la marca BOM hace que Excel lea las tildes como UTF-8
+        yield '\ufeff' + escritor.writerow(encabezados)
+        for fila in filas(self):
+            yield escritor.writerow(fila)
+
+    def citas_mensuales(self):
+        filas = ResumenCitas.objects.values('anio', 'mes').annotate(citas=Sum('total')).order_by('anio', 'mes')
+        for fila in filas.iterator(chunk_size=self.TAMANO_LOTE):
+            yield fila['anio'], fila['mes'], fila['citas']
+
+    def citas_por_estado(self):
+        estados = dict(CITA_CHOICES)
+        for fila in ResumenCitas.objects.values('estado').annotate(citas=Sum('total')).order_by('estado'):
+            yield estados.get(fila['estado'], fila['estado']), fila['citas']
+
+    def citas_por_dia(self):
+        for fila in ResumenCitas.objects.values('dia_semana').annotate(citas=Sum('total')).order_by('dia_semana'):
+            yield DIAS_SEMANA[fila['dia_semana'] - 1], fila['citas']
+
+    def crecimiento_pacientes(self):
+        filas = ResumenPacientes.objects.values('anio_nacimiento', 'mes_nacimiento').annotate(
+            pacientes=Sum('total')
+        ).order_by('anio_nacimiento', 'mes_nacimiento')
+        for fila in filas.iterator(chunk_size=self.TAMANO_LOTE):
+            yield fila['anio_nacimiento'], fila['mes_nacimiento'], fila['pacientes']
+
+    def pacientes_por_genero(self):
+        sexos = dict(SEX_CHOICES)
+        for fila in ResumenPacientes.objects.values('sexo').annotate(pacientes=Sum('total')).order_by('sexo'):
+            yield sexos.get(fila['sexo'], fila['sexo']), fila['pacientes']
+
+    def edades(self):
+        demografia = Demografia.obtener()
+        sexos = dict(SEX_CHOICES)
+        grupos = [('General', '', demografia)]
+        grupos += [('Sexo', sexos.get(fila['sexo'], fila['sexo']), fila) for fila in demografia['por_sexo']]
+        grupos += [('Tipo de sangre', fila['tipo_sangre'] or 'Sin registro', fila) for fila in demografia['por_tipo_sangre']]
+        for grupo, valor, resumen in grupos:
+            yield [grupo, valor, resumen['total'], resumen['edad_promedio']] + [
+                resumen['percentiles'].get(f'p{p}', '') for p in PERCENTILES
+            ]
+
+    def medicamentos_recetados(self):
+        filas = ResumenMedicamentos.objects.values_list('nombre', 'total_recetado').order_by('-total_recetado', 'nombre')
+        yield from filas.iterator(chunk_size=self.TAMANO_LOTE)
+
+    # recorre los totales agrupados (ordenados por periodo) a la par de los periodos del
+    # rango y completa con 0 los que no tienen datos, sin cargar la serie completa
+    def _completar_serie(self, totales):
+        totales = iter(totales)
+        actual = next(totales, None)
+        periodo = inicio_periodo(self.desde, self.granularidad)
+        while periodo <= self.hasta:
+            while actual is not None and actual['periodo'] < periodo:
+                actual = next(totales, None)
+            total = actual['total'] if actual is not None and actual['periodo'] == periodo else 0
+            yield periodo.isoformat(), total
+            periodo = siguiente_periodo(periodo, self.granularidad)
+
+    def serie_citas(self):
+        truncar = {'semana': TruncWeek('fecha'), 'mes': TruncMonth('fecha')}.get(self.granularidad, F('fecha'))
+        totales = CitaMedica.objects.filter(fecha__gte=self.desde, fecha__lte=self.hasta).annotate(
+            periodo=truncar
+        ).order_by('periodo').values('periodo').annotate(total=Count('id'))
+        yield from self._completar_serie(totales.iterator(chunk_size=self.TAMANO_LOTE))
+
+    def serie_recetas(self):
+        campo = 'atencion__fecha_atencion'
+        truncar = {
+            'semana': TruncWeek(campo, output_field=DateField()),
+            'mes': TruncMonth(campo, output_field=DateField()),
+        }.get(self.granularidad, TruncDate(campo))
+        zona = timezone.get_current_timezone()
+        inicio = timezone.make_aware(datetime.datetime.combine(self.desde, datetime.time.min), zona)
+        fin = timezone.make_aware(datetime.datetime.combine(self.hasta + datetime.timedelta(days=1), datetime.time.min), zona)
+        totales = DetalleAtencion.objects.filter(**{f'{campo}__gte': inicio, f'{campo}__lt': fin}).annotate(
+            periodo=truncar
+        ).order_by('periodo').values('periodo').annotate(total=Sum('cantidad'))
+        yield from self._completar_serie(totales.iterator(chunk_size=self.TAMANO_LOTE))
@@ -0,0 +1,135 @@
+import datetime
+from functools import reduce
+from operator import or_
+from django.db import transaction
+from django.db.models import Count, Max, Q, Sum
+from django.db.models.functions import ExtractMonth, ExtractWeekDay, ExtractYear
+from aplication.core.models import (
+    EstadisticaPendiente,
+    Paciente,
+    ResumenCitas,
+    ResumenMedicamentos,
+    ResumenPacientes
+)
+from aplication.attention.models import CitaMedica, DetalleAtencion
+
+
+# filtro por rangos [primer día del mes, primer día del mes siguiente) para cada (año, mes);
+# los rangos sobre la columna de fecha pueden usar índices, a diferencia de __year/__month
+def _filtro_meses(campo, meses):
+    filtros = []
+    for anio, mes in meses:
+        inicio = datetime.date(anio, mes, 1)
+        fin = datetime.date(anio + mes // 12, mes % 12 + 1, 1)
+        filtros.append(Q(**{f'{campo}__gte': inicio, f'{campo}__lt': fin}))
+    return reduce(or_, filtros)
+
+
+# las fechas asignadas como texto ('AAAA-MM-DD') aún no se han convertido al guardar
+def _a_fecha(valor):
+    return datetime.date.fromisoformat(valor) if isinstance(valor, str) else valor
+
+
+class ResumenEstadisticas:
+    @staticmethod
+    # registra que cambiaron los meses de citas indicados
+    def marcar_citas(fechas):
+        ResumenEstadisticas._marcar('cita', fechas)
+
+    @staticmethod
+    # registra que cambiaron los meses de nacimiento indicados
+    def marcar_pacientes(fechas):
+        ResumenEstadisticas._marcar('paciente', fechas)
+
+    @staticmethod
+    def marcar_medicamentos(medicamento_ids):
+        EstadisticaPendiente.objects.bulk_create([
+            EstadisticaPendiente(tipo='medicamento', referencia=pk) for pk in set(medicamento_ids) if pk
+        ])
+
+    @staticmethod
+    def _marcar(tipo, fechas):
+        meses = {(fecha.year, fecha.month) for fecha in map(_a_fecha, fechas) if fecha}
+        EstadisticaPendiente.objects.bulk_create([
+            EstadisticaPendiente(tipo=tipo, anio=anio, mes=mes) for anio, mes in meses
+        ])
+
+    @staticmethod
+    # filas de ResumenCitas calculadas desde las citas (opcionalmente solo de algunos meses)
+    def calcular_citas(meses=None):
+        citas = CitaMedica.objects.all()
+        if meses is not None:
+            citas = citas.filter(_filtro_meses('fecha', meses))
+        filas = citas.annotate(
+            anio=ExtractYear('fecha'), mes=ExtractMonth('fecha'), dia_semana=ExtractWeekDay('fecha')
+        ).order_by().values('anio', 'mes', 'dia_semana', 'estado').annotate(total=Count('id'))
+        return [ResumenCitas(**fila) for fila in filas]
+
+    @staticmethod
+    def calcular_pacientes(meses=None):
+        pacientes = Paciente.objects.all()
+        if meses is not None:
+            pacientes = pacientes.filter(_filtro_meses('fecha_nacimiento', meses))
+        filas = pacientes.annotate(
+            anio_nacimiento=ExtractYear('fecha_nacimiento'), mes_nacimiento=ExtractMonth('fecha_nacimiento')
+        ).order_by().values('anio_nacimiento', 'mes_nacimiento', 'sexo').annotate(total=Count('id'))
+        return [ResumenPacientes(**fila) for fila in filas]
+
+    @staticmethod
+    def calcular_medicamentos(medicamento_ids=None):
+        detalles = DetalleAtencion.objects.all()
+        if medicamento_ids is not None:
+            detalles = detalles.filter(medicamento_id__in=medicamento_ids)
+        filas = detalles.order_by().values('medicamento_id', 'medicamento__nombre').annotate(total=Sum('cantidad'))
+        return [
+            ResumenMedicamentos(medicamento_id=fila['medicamento_id'], nombre=fila['medicamento__nombre'], total_recetado=fila['total'])
+            for fila in filas if fila['total']
+        ]
+
+    @staticmethod
+    # recalcula todos los resúmenes desde las tablas origen
+    def reconstruir():
+        with transaction.atomic():
+            marca_agua = EstadisticaPendiente.objects.aggregate(maximo=Max('id'))['maximo']
+            ResumenCitas.objects.all().delete()
+            ResumenCitas.objects.bulk_create(ResumenEstadisticas.calcular_citas())
+            ResumenPacientes.objects.all().delete()
+            ResumenPacientes.objects.bulk_create(ResumenEstadisticas.calcular_pacientes())
+            ResumenMedicamentos.objects.all().delete()
+            ResumenMedicamentos.objects.bulk_create(ResumenEstadisticas.calcular_medicamentos())
+            if marca_agua is not None:
+                EstadisticaPendiente.objects.filter(id__lte=marca_agua).delete()
+
+    @staticmethod
+    # recalcula solo lo marcado hasta la marca de agua; devuelve cuántas claves se procesaron
+    def refrescar():
+        with transaction.atomic():
+            marca_agua = EstadisticaPendiente.objects.aggregate(maximo=Max('id'))['maximo']
+            if marca_agua is None:
+                return 0
+            pendientes = EstadisticaPendiente.objects.filter(id__lte=marca_agua)
+            # bloquea las marcas: un refresco simultáneo espera y luego ya no las encuentra
+            list(pendientes.select_for_update().order_by('id').values_list('id', flat=True))
+            claves = set(pendientes.values_list('tipo', 'anio', 'mes', 'referencia').distinct())
+
+            meses_citas = {(anio, mes) for tipo, anio, mes, _ in claves if tipo == 'cita'}
+            if meses_citas:
+                ResumenCitas.objects.filter(
+                    reduce(or_, (Q(anio=anio, mes=mes) for anio, mes in meses_citas))
+                ).delete()
+                ResumenCitas.objects.bulk_create(ResumenEstadisticas.calcular_citas(meses_citas))
+
+            meses_pacientes = {(anio, mes) for tipo, anio, mes, _ in claves if tipo == 'paciente'}
+            if meses_pacientes:
+                ResumenPacientes.objects.filter(
+                    reduce(or_, (Q(anio_nacimiento=anio, mes_nacimiento=mes) for anio, mes in meses_pacientes))
+                ).delete()
+                ResumenPacientes.objects.bulk_create(ResumenEstadisticas.calcular_pacientes(meses_pacientes))
+
+            medicamentos = {referencia for tipo, _, _, referencia in claves if tipo == 'medicamento'}
+            if medicamentos:
+                ResumenMedicamentos.objects.filter(medicamento_id__in=medicamentos).delete()
+                ResumenMedicamentos.objects.bulk_create(ResumenEstadisticas.calcular_medicamentos(medicamentos))
+
+            pendientes.delete()
+        return len(claves)
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from aplication.core.instance.contadores_inicio import ContadoresInicio
+
+
+class Command(BaseCommand):
+    help = "Vuelve a contar pacientes, citas y atenciones y corrige los contadores del inicio en la caché."
+
+    def handle(self, *args, **options):
+        diferencias = ContadoresInicio.reconciliar()
+        if not diferencias:
+            self.stdout.write(self.style.SUCCESS("Contadores del inicio al día."))
+            return
+        for nombre, diferencia in diferencias.items():
+            self.stdout.write(f"{nombre}: {diferencia:+d}")
+        self.stdout.write(self.style.SUCCESS("Contadores del inicio corregidos."))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+from aplication.core.instance.resumen_estadisticas import ResumenEstadisticas
+
+
+class Command(BaseCommand):
+    help = "Actualiza los resúmenes de estadísticas con los cambios pendientes (con --full los reconstruye completos)."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help="Reconstruye todos los resúmenes desde las tablas origen.")
+
+    def handle(self, *args, **options):
+        if options['full']:
+            ResumenEstadisticas.reconstruir()
+            self.stdout.write(self.style.SUCCESS("Resúmenes de estadísticas reconstruidos."))
+            return
+        claves = ResumenEstadisticas.refrescar()
+        self.stdout.write(self.style.SUCCESS(f"Resúmenes de estadísticas actualizados: {claves} grupos recalculados."))
@@ -0,0 +1,102 @@
+# Generated by Django 5.1.3 on 2026-10-18 10:28
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import ExtractMonth, ExtractWeekDay, ExtractYear
+
+
+# Primera carga de los resúmenes desde las tablas origen
+def cargar_resumenes(apps, schema_editor):
+    CitaMedica = apps.get_model('attention', 'CitaMedica')
+    DetalleAtencion = apps.get_model('attention', 'DetalleAtencion')
+    Paciente = apps.get_model('core', 'Paciente')
+    ResumenCitas = apps.get_model('core', 'ResumenCitas')
+    ResumenPacientes = apps.get_model('core', 'ResumenPacientes')
+    ResumenMedicamentos = apps.get_model('core', 'ResumenMedicamentos')
+
+    ResumenCitas.objects.bulk_create([
+        ResumenCitas(**fila) for fila in CitaMedica.objects.annotate(
+            anio=ExtractYear('fecha'), mes=ExtractMonth('fecha'), dia_semana=ExtractWeekDay('fecha')
+        ).order_by().values('anio', 'mes', 'dia_semana', 'estado').annotate(total=Count('id'))
+    ])
+    ResumenPacientes.objects.bulk_create([
+        ResumenPacientes(**fila) for fila in Paciente.objects.annotate(
+            anio_nacimiento=ExtractYear('fecha_nacimiento'), mes_nacimiento=ExtractMonth('fecha_nacimiento')
+        ).order_by().values('anio_nacimiento', 'mes_nacimiento', 'sexo').annotate(total=Count('id'))
+    ])
+    ResumenMedicamentos.objects.bulk_create([
+        ResumenMedicamentos(medicamento_id=fila['medicamento_id'], nombre=fila['medicamento__nombre'], total_recetado=fila['total'])
+        for fila in DetalleAtencion.objects.order_by().values('medicamento_id', 'medicamento__nombre').annotate(total=Sum('cantidad'))
+        if fila['total']
+    ])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0001_initial'),
+        ('attention', '0005_ingresodiario'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EstadisticaPendiente',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('tipo', models.CharField(choices=[('cita', 'Cita'), ('paciente', 'Paciente'), ('medicamento', 'Medicamento')], max_length=20, verbose_name='Tipo')),
+                ('anio', models.IntegerField(blank=True, null=True, verbose_name='Año')),
+                ('mes', models.IntegerField(blank=True, null=True, verbose_name='Mes')),
+                ('referencia', models.BigIntegerField(blank=True, null=True, verbose_name='Referencia')),
+            ],
+            options={
+                'verbose_name': 'Estadística Pendiente',
+                'verbose_name_plural': 'Estadísticas Pendientes',
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumenMedicamentos',
+            fields=[
+                ('medicamento', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='resumen', serialize=False, to='core.medicamento', verbose_name='Medicamento')),
+                ('nombre', models.CharField(max_length=100, verbose_name='Nombre')),
+                ('total_recetado', models.PositiveIntegerField(default=0, verbose_name='Total Recetado')),
+            ],
+            options={
+                'verbose_name': 'Resumen de Medicamentos',
+                'verbose_name_plural': 'Resúmenes de Medicamentos',
+                'ordering': ['-total_recetado'],
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumenCitas',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('anio', models.PositiveIntegerField(verbose_name='Año')),
+                ('mes', models.PositiveSmallIntegerField(verbose_name='Mes')),
+                ('dia_semana', models.PositiveSmallIntegerField(verbose_name='Día de la Semana')),
+                ('estado', models.CharField(max_length=1, verbose_name='Estado')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Total')),
+            ],
+            options={
+                'verbose_name': 'Resumen de Citas',
+                'verbose_name_plural': 'Resúmenes de Citas',
+                'constraints': [models.UniqueConstraint(fields=('anio', 'mes', 'dia_semana', 'estado'), name='resumen_citas_unico')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ResumenPacientes',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('anio_nacimiento', models.PositiveIntegerField(verbose_name='Año de Nacimiento')),
+                ('mes_nacimiento', models.PositiveSmallIntegerField(verbose_name='Mes de Nacimiento')),
+                ('sexo', models.CharField(max_length=1, verbose_name='Sexo')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='Total')),
+            ],
+            options={
+                'verbose_name': 'Resumen de Pacientes',
+                'verbose_name_plural': 'Resúmenes de Pacientes',
+                'constraints': [models.UniqueConstraint(fields=('anio_nacimiento', 'mes_nacimiento', 'sexo'), name='resumen_pacientes_unico')],
+            },
+        ),
+        migrations.RunPython(cargar_resumenes, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,7 @@
-from datetime import date
 from django.db import models
 from doctor.const import CIVIL_CHOICES, SEX_CHOICES
 from django.contrib.auth.models import User
-from doctor.utils import valida_cedula,phone_regex
+from doctor.utils import valida_cedula,phone_regex,calcular_edad
 from django.conf import settings
 
       
@@ -103,8 +102,7 @@ class Paciente(models.Model):
             return '/static/img/usuario_anonimo.png'
 
     def calcular_edad(self):
-        today = date.today()
-        return today.year - self.fecha_nacimiento.year - ((today.month, today.day) < (self.fecha_nacimiento.month, self.fecha_nacimiento.day))
+        return calcular_edad(self.fecha_nacimiento)
 
     @staticmethod
     def cantidad_pacientes():
@@ -185,12 +183,7 @@ class Doctor(models.Model):
         
     @staticmethod
     def calcular_edad(fecha_nacimiento):
-        today = date.today()  # Obtener la fecha actual
-        edad = today.year - fecha_nacimiento.year  # Calcular la diferencia de años
-        # Ajustar la edad si el cumpleaños de este año no ha ocurrido aún
-        if (today.month, today.day) < (fecha_nacimiento.month, fecha_nacimiento.day):
-            edad -= 1  # Restar un año si el cumpleaños no ha pasado
-        return edad  
+        return calcular_edad(fecha_nacimiento)
     
     class Meta:
         # Nombre singular y plural del modelo en la interfaz administrativa
@@ -255,12 +248,7 @@ class Empleado(models.Model):
     
     @staticmethod
     def calcular_edad(fecha_nacimiento):
-        today = date.today()  # Obtener la fecha actual
-        edad = today.year - fecha_nacimiento.year  # Calcular la diferencia de años
-        # Ajustar la edad si el cumpleaños de este año no ha ocurrido aún
-        if (today.month, today.day) < (fecha_nacimiento.month, fecha_nacimiento.day):
-            edad -= 1  # Restar un año si el cumpleaños no ha pasado
-        return edad  
+        return calcular_edad(fecha_nacimiento)
     
     class Meta:
         # Ordena los empleados alfabéticamente por apellido y nombre
@@ -394,3 +382,76 @@ class AuditUser(models.Model):
         verbose_name = 'Auditoria Usuario '
         verbose_name_plural = 'Auditorias Usuarios'
         ordering = ('-fecha', 'hora')
+
+# Resúmenes precalculados para la vista de estadísticas. Los mantiene el comando
+# refresh_statistics a partir de las marcas de EstadisticaPendiente; la vista solo lee estas tablas.
+
+# Citas médicas por mes, día de la semana (1 = domingo, como ExtractWeekDay) y estado
+class ResumenCitas(models.Model):
+    anio = models.PositiveIntegerField(verbose_name="Año")
+    mes = models.PositiveSmallIntegerField(verbose_name="Mes")
+    dia_semana = models.PositiveSmallIntegerField(verbose_name="Día de la Semana")
+    estado = models.CharField(max_length=1, verbose_name="Estado")
+    total = models.PositiveIntegerField(default=0, verbose_name="Total")
+
+    def __str__(self):
+        return f"{self.anio}-{self.mes:02d} {self.dia_semana} {self.estado}: {self.total}"
+
+    class Meta:
+        verbose_name = "Resumen de Citas"
+        verbose_name_plural = "Resúmenes de Citas"
+        constraints = [
+            models.UniqueConstraint(fields=['anio', 'mes', 'dia_semana', 'estado'], name='resumen_citas_unico'),
+        ]
+
+# Pacientes por año y mes de nacimiento y sexo
+class ResumenPacientes(models.Model):
+    anio_nacimiento = models.PositiveIntegerField(verbose_name="Año de Nacimiento")
+    mes_nacimiento = models.PositiveSmallIntegerField(verbose_name="Mes de Nacimiento")
+    sexo = models.CharField(max_length=1, verbose_name="Sexo")
+    total = models.PositiveIntegerField(default=0, verbose_name="Total")
+
+    def __str__(self):
+        return f"{self.anio_nacimiento}-{self.mes_nacimiento:02d} {self.sexo}: {self.total}"
+
+    class Meta:
+        verbose_name = "Resumen de Pacientes"
+        verbose_name_plural = "Resúmenes de Pacientes"
+        constraints = [
+            models.UniqueConstraint(fields=['anio_nacimiento', 'mes_nacimiento', 'sexo'], name='resumen_pacientes_unico'),
+        ]
+
+# Unidades recetadas de cada medicamento
+class ResumenMedicamentos(models.Model):
+    medicamento = models.OneToOneField(Medicamento, on_delete=models.CASCADE, primary_key=True, verbose_name="Medicamento", related_name="resumen")
+    nombre = models.CharField(max_length=100, verbose_name="Nombre")
+    total_recetado = models.PositiveIntegerField(default=0, verbose_name="Total Recetado")
+
+    def __str__(self):
+        return f"{self.nombre}: {self.total_recetado}"
+
+    class Meta:
+        ordering = ['-total_recetado']
+        verbose_name = "Resumen de Medicamentos"
+        verbose_name_plural = "Resúmenes de Medicamentos"
+
+# Marcas de lo que cambió desde el último refresco: un mes de citas, un mes de nacimiento
+# o un medicamento. refresh_statistics procesa las marcas hasta el id máximo que leyó
+# (marca de agua) y borra solo esas, así no pierde las que llegan mientras trabaja.
+class EstadisticaPendiente(models.Model):
+    TIPOS = (
+        ('cita', 'Cita'),
+        ('paciente', 'Paciente'),
+        ('medicamento', 'Medicamento'),
+    )
+    tipo = models.CharField(max_length=20, choices=TIPOS, verbose_name="Tipo")
+    anio = models.IntegerField(null=True, blank=True, verbose_name="Año")
+    mes = models.IntegerField(null=True, blank=True, verbose_name="Mes")
+    referencia = models.BigIntegerField(null=True, blank=True, verbose_name="Referencia")
+
+    def __str__(self):
+        return f"{self.tipo} {self.anio}-{self.mes} {self.referencia}"
+
+    class Meta:
+        verbose_name = "Estadística Pendiente"
+        verbose_name_plural = "Estadísticas Pendientes"
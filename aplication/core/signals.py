@@ -0,0 +1,71 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from aplication.core.models import Medicamento, Paciente
+from aplication.attention.models import CitaMedica, DetalleAtencion
+from aplication.core.instance.contadores_inicio import ContadoresInicio
+from aplication.core.instance.resumen_estadisticas import ResumenEstadisticas
+from doctor.utils import incrementar_version_datos
+
+# campo de cada modelo que determina el resumen de estadisticas al que pertenece
+CAMPOS_ESTADISTICAS = {
+    CitaMedica: 'fecha',
+    Paciente: 'fecha_nacimiento',
+    DetalleAtencion: 'medicamento_id',
+    Medicamento: 'pk',
+}
+
+MARCAR = {
+    CitaMedica: ResumenEstadisticas.marcar_citas,
+    Paciente: ResumenEstadisticas.marcar_pacientes,
+    DetalleAtencion: ResumenEstadisticas.marcar_medicamentos,
+    Medicamento: ResumenEstadisticas.marcar_medicamentos,
+}
+
+# versiones de datos que se incrementan además de la de estadisticas
+# (histogramas de citas del inicio y demografía de pacientes)
+VERSIONES = {
+    CitaMedica: 'citas',
+    Paciente: 'pacientes',
+}
+
+
+# antes de modificar o eliminar se guarda el valor actual, asi se marca tambien
+# el resumen al que pertenecia la fila (por ejemplo, una cita que cambia de mes)
+@receiver(pre_save)
+@receiver(pre_delete)
+def capturar_estadistica_anterior(sender, instance, **kwargs):
+    if sender not in CAMPOS_ESTADISTICAS or kwargs.get('raw'):
+        return
+    campo = CAMPOS_ESTADISTICAS[sender]
+    instance._estadistica_anterior = (
+        sender.objects.filter(pk=instance.pk).values_list(campo, flat=True).first() if instance.pk else None
+    )
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def marcar_estadistica(sender, instance, **kwargs):
+    if sender not in CAMPOS_ESTADISTICAS or kwargs.get('raw'):
+        return
+    campo = CAMPOS_ESTADISTICAS[sender]
+    MARCAR[sender]([getattr(instance, '_estadistica_anterior', None), getattr(instance, campo)])
+    # las respuestas del API de estadisticas calculadas con la version anterior dejan de usarse
+    transaction.on_commit(lambda: incrementar_version_datos('estadisticas'), robust=True)
+    if sender in VERSIONES:
+        transaction.on_commit(lambda: incrementar_version_datos(VERSIONES[sender]), robust=True)
+
+
+# contadores del inicio: +1 al crear y -1 al eliminar, aplicado solo si la transacción se confirma
+@receiver(post_save)
+def contar_creado(sender, instance, created, **kwargs):
+    nombre = ContadoresInicio.get_nombre(sender)
+    if nombre and created and not kwargs.get('raw'):
+        transaction.on_commit(lambda: ContadoresInicio.incrementar(nombre), robust=True)
+
+
+@receiver(post_delete)
+def contar_eliminado(sender, instance, **kwargs):
+    nombre = ContadoresInicio.get_nombre(sender)
+    if nombre:
+        transaction.on_commit(lambda: ContadoresInicio.incrementar(nombre, -1), robust=True)
@@ -0,0 +1,15 @@
+from celery import shared_task
+from aplication.core.instance.contadores_inicio import ContadoresInicio
+from aplication.core.instance.resumen_estadisticas import ResumenEstadisticas
+
+
+# Refresco periódico de los resúmenes de estadísticas (programar con celery beat)
+@shared_task
+def refrescar_estadisticas():
+    return ResumenEstadisticas.refrescar()
+
+
+# Corrección periódica de los contadores del inicio (programar con celery beat)
+@shared_task
+def reconciliar_contadores():
+    return ContadoresInicio.reconciliar()
@@ -1,3 +1,361 @@
+import csv
+import datetime
+import time
+from decimal import Decimal
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from django.test import TestCase
+from django.urls import reverse
+
+from aplication.attention.models import Atencion, CitaMedica, DetalleAtencion
+from aplication.core.instance.contadores_inicio import ContadoresInicio
+from aplication.core.instance.demografia import Demografia
+from aplication.core.instance.estadisticas_citas import EstadisticasCitas
+from aplication.core.instance.resumen_estadisticas import ResumenEstadisticas
+from aplication.core.models import (
+    EstadisticaPendiente,
+    Medicamento,
+    Paciente,
+    ResumenCitas,
+    ResumenMedicamentos,
+    ResumenPacientes,
+    TipoMedicamento,
+    TipoSangre,
+)
+from aplication.core.views.estadistica import VistaEstadisticas
+from aplication.security.models import User
+
+
+def crear_paciente(cedula="1710034065", nombres="Ana", sexo="F"):
+    tipo_sangre, _ = TipoSangre.objects.get_or_create(tipo="O+", defaults={"descripcion": "O positivo"})
+    return Paciente.objects.create(
+        nombres=nombres, apellidos="Pérez", cedula=cedula, fecha_nacimiento=datetime.date(1990, 5, 1),
+        telefono="0999999999", sexo=sexo, estado_civil="S", direccion="Quito", tipo_sangre=tipo_sangre,
+    )
+
+
+class EstadisticasCitasTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.paciente = crear_paciente()
+        cls.año = 2024
+        for i in range(24):
+            CitaMedica.objects.create(
+                paciente=cls.paciente, fecha=datetime.date(cls.año - i % 2, i % 12 + 1, i + 1),
+                hora_cita=datetime.time(8 + i % 8), estado="PCRR"[i % 4],
+            )
+        ResumenEstadisticas.reconstruir()
+
+    def esperado(self):
+        citas = CitaMedica.objects.all()
+        total = citas.count()
+        por_estado = {estado: citas.filter(estado=estado).count() for estado in "PCR"}
+        mensuales = [
+            {"mes": mes, "total": citas.filter(fecha__year=self.año, fecha__month=mes).count()}
+            for mes in range(1, 13)
+        ]
+        por_dia = [{"dia": dia, "total": citas.filter(fecha__week_day=dia).count()} for dia in range(1, 8)]
+        return {
+            "total": total,
+            "por_estado": por_estado,
+            "tasa_finalizacion": round(por_estado["R"] / total * 100, 2),
+            "mensuales": [fila for fila in mensuales if fila["total"]],
+            "por_dia": [fila for fila in por_dia if fila["total"]],
+        }
+
+    def test_desde_citas_en_una_consulta(self):
+        with self.assertNumQueries(1):
+            estadisticas = EstadisticasCitas.desde_citas(self.año)
+        self.assertEqual(estadisticas, self.esperado())
+
+    def test_desde_resumen_en_una_consulta(self):
+        with self.assertNumQueries(1):
+            estadisticas = EstadisticasCitas.desde_resumen(self.año)
+        self.assertEqual(estadisticas, self.esperado())
+
+    def test_vista_estadisticas_consultas(self):
+        vista = VistaEstadisticas()
+        vista.kwargs = {}
+        cache.clear()
+        # citas (1) + pacientes: total, crecimiento, género y demografía sin caché (4) + medicamentos (1)
+        with self.assertNumQueries(6):
+            contexto = vista.get_context_data()
+        self.assertEqual(contexto["total_citas"], 24)
+        self.assertEqual(contexto["comparacion_citas"], self.esperado()["por_estado"])
+
+
+class DemografiaTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.hoy = datetime.date(2024, 6, 15)
+        tipo_sangre = TipoSangre.objects.create(tipo="A+", descripcion="A positivo")
+        # cumpleaños el mismo día, un día después y un día antes de la fecha de referencia
+        for i, nacimiento in enumerate(
+            [datetime.date(1994, 6, 15), datetime.date(1994, 6, 16), datetime.date(2019, 6, 14), datetime.date(1950, 1, 1)]
+        ):
+            Paciente.objects.create(
+                nombres="Paciente", apellidos=str(i), cedula="1710034065", fecha_nacimiento=nacimiento,
+                telefono="0999999999", sexo="MF"[i % 2], estado_civil="S", direccion="Quito",
+                tipo_sangre=tipo_sangre if i < 2 else None,
+            )
+
+    def test_edades_exactas_en_una_consulta(self):
+        with self.assertNumQueries(1):
+            demografia = Demografia.calcular(hoy=self.hoy)
+        self.assertEqual(demografia["total"], 4)
+        # 30, 29, 5 y 74 años
+        self.assertEqual(demografia["edad_promedio"], 34.5)
+        self.assertEqual(demografia["percentiles"], {"p25": 5, "p50": 29, "p75": 30, "p90": 74})
+        self.assertEqual(
+            [(fila["sexo"], fila["total"]) for fila in demografia["por_sexo"]], [("F", 2), ("M", 2)]
+        )
+        self.assertEqual(
+            [(fila["tipo_sangre"], fila["edad_promedio"]) for fila in demografia["por_tipo_sangre"]],
+            [("A+", 29.5), (None, 39.5)],
+        )
+
+
+class ResumenEstadisticasTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.paciente = crear_paciente()
+        cls.citas = [
+            CitaMedica.objects.create(
+                paciente=cls.paciente, fecha=datetime.date(2024, i % 3 + 1, i + 1), hora_cita=datetime.time(8 + i), estado="PCR"[i % 3]
+            )
+            for i in range(6)
+        ]
+        tipo = TipoMedicamento.objects.create(nombre="Analgésico")
+        cls.paracetamol = Medicamento.objects.create(tipo=tipo, nombre="Paracetamol", cantidad=100, precio=Decimal("2.50"))
+        cls.ibuprofeno = Medicamento.objects.create(tipo=tipo, nombre="Ibuprofeno", cantidad=100, precio=Decimal("1.25"))
+        atencion = Atencion.objects.create(paciente=cls.paciente, motivo_consulta="Dolor", sintomas="Fiebre", tratamiento="Reposo")
+        cls.detalle = DetalleAtencion.objects.create(atencion=atencion, medicamento=cls.paracetamol, cantidad=3, prescripcion="c/8h")
+        DetalleAtencion.objects.create(atencion=atencion, medicamento=cls.ibuprofeno, cantidad=2, prescripcion="c/12h")
+        ResumenEstadisticas.reconstruir()
+
+    # filas guardadas en cada resumen frente a las calculadas desde las tablas origen
+    def assertResumenesAlDia(self):
+        campos = {
+            ResumenCitas: ("anio", "mes", "dia_semana", "estado", "total"),
+            ResumenPacientes: ("anio_nacimiento", "mes_nacimiento", "sexo", "total"),
+            ResumenMedicamentos: ("medicamento_id", "nombre", "total_recetado"),
+        }
+        calculados = {
+            ResumenCitas: ResumenEstadisticas.calcular_citas(),
+            ResumenPacientes: ResumenEstadisticas.calcular_pacientes(),
+            ResumenMedicamentos: ResumenEstadisticas.calcular_medicamentos(),
+        }
+        for modelo, nombres in campos.items():
+            guardadas = sorted(modelo.objects.values_list(*nombres))
+            esperadas = sorted(tuple(getattr(fila, nombre) for nombre in nombres) for fila in calculados[modelo])
+            self.assertEqual(guardadas, esperadas, modelo.__name__)
+
+    def modificar_datos(self):
+        CitaMedica.objects.create(paciente=self.paciente, fecha=datetime.date(2024, 7, 1), hora_cita=datetime.time(9), estado="P")
+        self.citas[0].estado = "C"
+        self.citas[0].save()
+        self.citas[1].fecha = datetime.date(2025, 1, 15)
+        self.citas[1].save()
+        self.citas[2].delete()
+        crear_paciente(cedula="0102030405", nombres="Luis", sexo="M")
+        self.detalle.cantidad = 10
+        self.detalle.save()
+        self.ibuprofeno.detalles_atencion.all().delete()
+
+    def test_reconstruir(self):
+        self.assertResumenesAlDia()
+        self.assertFalse(EstadisticaPendiente.objects.exists())
+
+    def test_refrescar_solo_lo_marcado(self):
+        self.modificar_datos()
+        self.assertTrue(EstadisticaPendiente.objects.exists())
+        with self.assertRaises(AssertionError):
+            self.assertResumenesAlDia()
+        self.assertGreater(ResumenEstadisticas.refrescar(), 0)
+        self.assertResumenesAlDia()
+        self.assertFalse(EstadisticaPendiente.objects.exists())
+        self.assertEqual(ResumenEstadisticas.refrescar(), 0)
+
+    def test_refresh_statistics(self):
+        self.modificar_datos()
+        call_command("refresh_statistics", stdout=StringIO())
+        self.assertResumenesAlDia()
+        ResumenCitas.objects.all().delete()
+        call_command("refresh_statistics", "--full", stdout=StringIO())
+        self.assertResumenesAlDia()
+
+
+class EstadisticasApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.paciente = crear_paciente()
+        for dia in (5, 12, 20):
+            CitaMedica.objects.create(paciente=cls.paciente, fecha=datetime.date(2024, 3, dia), hora_cita=datetime.time(9), estado="R")
+        CitaMedica.objects.create(paciente=cls.paciente, fecha=datetime.date(2024, 5, 1), hora_cita=datetime.time(9), estado="P")
+        cls.usuario = User.objects.create_user(username="doctor", email="doctor@test.com", password="clave")
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.usuario)
+        self.url = reverse("core:estadisticas_api")
+
+    def test_requiere_iniciar_sesion(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+
+    def test_valida_el_rango(self):
+        invalidos = [
+            {"desde": "2024-02-30"},
+            {"desde": "2024-05-01", "hasta": "2024-03-01"},
+            {"granularidad": "hora"},
+            {"desde": "2020-01-01", "hasta": "2024-12-31", "granularidad": "dia"},
+        ]
+        for parametros in invalidos:
+            response = self.client.get(self.url, parametros)
+            self.assertEqual(response.status_code, 400, parametros)
+            self.assertIn("error", response.json())
+
+    def test_citas_del_rango(self):
+        response = self.client.get(self.url, {"desde": "2024-03-01", "hasta": "2024-03-31", "granularidad": "semana"})
+        self.assertEqual(response.status_code, 200)
+        datos = response.json()
+        self.assertEqual(datos["citas"]["total"], 3)
+        self.assertEqual(datos["citas"]["por_estado"]["R"], 3)
+        self.assertEqual(sum(fila["total"] for fila in datos["citas"]["serie"]), 3)
+        self.assertEqual(datos["pacientes"]["total"], 1)
+
+    def test_etag_y_304(self):
+        parametros = {"desde": "2024-01-01", "hasta": "2024-12-31"}
+        etag = self.client.get(self.url, parametros)["ETag"]
+        # sesión y usuario; la respuesta no se calcula
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, parametros, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # otro rango tiene otra etiqueta
+        self.assertNotEqual(self.client.get(self.url, {"desde": "2024-03-01", "hasta": "2024-12-31"})["ETag"], etag)
+
+        # al cambiar las citas cambia la versión de los datos y la etiqueta
+        with self.captureOnCommitCallbacks(execute=True):
+            CitaMedica.objects.create(paciente=self.paciente, fecha=datetime.date(2024, 6, 1), hora_cita=datetime.time(9), estado="P")
+        response = self.client.get(self.url, parametros, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["citas"]["total"], 5)
+
+
+class EstadisticasExportarTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.paciente = crear_paciente()
+        for fecha, estado in [(datetime.date(2024, 1, 10), "R"), (datetime.date(2024, 1, 20), "C"), (datetime.date(2024, 3, 5), "R")]:
+            CitaMedica.objects.create(paciente=cls.paciente, fecha=fecha, hora_cita=datetime.time(9), estado=estado)
+        tipo = TipoMedicamento.objects.create(nombre="Analgésico")
+        atencion = Atencion.objects.create(paciente=cls.paciente, motivo_consulta="Dolor", sintomas="Fiebre", tratamiento="Reposo")
+        for nombre, cantidad in [("Paracetamol", 3), ("Ibuprofeno", 5)]:
+            medicamento = Medicamento.objects.create(tipo=tipo, nombre=nombre, cantidad=100, precio=Decimal("1.00"))
+            DetalleAtencion.objects.create(atencion=atencion, medicamento=medicamento, cantidad=cantidad, prescripcion="c/8h")
+        ResumenEstadisticas.reconstruir()
+        cls.usuario = User.objects.create_user(username="doctor", email="doctor@test.com", password="clave")
+
+    def setUp(self):
+        self.client.force_login(self.usuario)
+
+    def exportar(self, metrica, **parametros):
+        response = self.client.get(reverse("core:estadisticas_exportar", args=[metrica]), parametros)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        contenido = b"".join(response.streaming_content).decode("utf-8")
+        self.assertTrue(contenido.startswith("\ufeff"))
+        return response, list(csv.reader(StringIO(contenido[1:])))
+
+    def test_citas_por_estado(self):
+        response, filas = self.exportar("citas_por_estado")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="citas_por_estado.csv"')
+        self.assertEqual(filas, [["Estado", "Citas"], ["Cancelada", "1"], ["Realizada", "2"]])
+
+    def test_medicamentos_recetados(self):
+        _, filas = self.exportar("medicamentos_recetados")
+        self.assertEqual(filas, [["Medicamento", "Total recetado"], ["Ibuprofeno", "5"], ["Paracetamol", "3"]])
+
+    def test_serie_completa_los_periodos_sin_citas(self):
+        response, filas = self.exportar("serie_citas", desde="2024-01-01", hasta="2024-04-30", granularidad="mes")
+        self.assertEqual(response["Content-Disposition"], 'attachment; filename="serie_citas_2024-01-01_2024-04-30_mes.csv"')
+        self.assertEqual(filas, [
+            ["Periodo", "Citas"], ["2024-01-01", "2"], ["2024-02-01", "0"], ["2024-03-01", "1"], ["2024-04-01", "0"],
+        ])
+
+    def test_metrica_desconocida_y_rango_invalido(self):
+        url = reverse("core:estadisticas_exportar", args=["inventada"])
+        self.assertEqual(self.client.get(url).status_code, 404)
+        url = reverse("core:estadisticas_exportar", args=["serie_citas"])
+        self.assertEqual(self.client.get(url, {"desde": "2024-05-01", "hasta": "2024-01-01"}).status_code, 400)
+
+
+class ContadoresInicioTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.paciente = crear_paciente()
+        cls.cita = CitaMedica.objects.create(paciente=cls.paciente, fecha=datetime.date(2024, 3, 5), hora_cita=datetime.time(9), estado="P")
+        Atencion.objects.create(paciente=cls.paciente, motivo_consulta="Dolor", sintomas="Fiebre", tratamiento="Reposo")
+
+    def setUp(self):
+        cache.clear()
+
+    def contar(self):
+        return {nombre: modelo.objects.count() for nombre, modelo in ContadoresInicio.MODELOS.items()}
+
+    def test_cuenta_una_vez_y_luego_lee_la_cache(self):
+        with self.assertNumQueries(3):
+            contadores = ContadoresInicio.obtener()
+        self.assertEqual(contadores, self.contar())
+        with self.assertNumQueries(0):
+            self.assertEqual(ContadoresInicio.obtener(), contadores)
+
+    def test_crear_y_eliminar_actualizan_los_contadores(self):
+        ContadoresInicio.obtener()
+        with self.captureOnCommitCallbacks(execute=True):
+            crear_paciente(cedula="0102030405", nombres="Luis", sexo="M")
+            self.cita.delete()
+        with self.assertNumQueries(0):
+            contadores = ContadoresInicio.obtener()
+        self.assertEqual(contadores, self.contar())
+        self.assertEqual(contadores["pacientes"], 2)
+        self.assertEqual(contadores["citas"], 0)
+
+    def test_una_transaccion_revertida_no_cambia_los_contadores(self):
+        ContadoresInicio.obtener()
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    crear_paciente(cedula="0102030405")
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+        self.assertEqual(ContadoresInicio.obtener(), self.contar())
+
+    def test_reconciliar_corrige_los_cambios_masivos(self):
+        ContadoresInicio.obtener()
+        # bulk_create no envía señales: el contador en caché queda atrasado
+        Paciente.objects.bulk_create([
+            Paciente(
+                nombres="Paciente", apellidos=str(i), cedula="1710034065", fecha_nacimiento=datetime.date(2000, 1, 1),
+                telefono="0999999999", sexo="M", estado_civil="S", direccion="Quito",
+            )
+            for i in range(2)
+        ])
+        self.assertNotEqual(ContadoresInicio.obtener(), self.contar())
+        salida = StringIO()
+        call_command("reconcile_counters", stdout=salida)
+        self.assertIn("pacientes: +2", salida.getvalue())
+        self.assertEqual(ContadoresInicio.obtener(), self.contar())
+        self.assertEqual(ContadoresInicio.reconciliar(), {})
 
-# Create your tests here.
+    def test_con_cache_local_los_contadores_vencen_pronto(self):
+        ContadoresInicio.obtener()
+        clave = ContadoresInicio.get_clave("pacientes")
+        vencimiento = cache._expire_info[cache.make_and_validate_key(clave)]
+        self.assertLessEqual(vencimiento - time.time(), settings.LOCAL_CACHE_MAX_TTL)
@@ -1,5 +1,5 @@
 from django.urls import path
-from aplication.core.views.home import HomeTemplateView
+from aplication.core.views.home import HomeTemplateView, ChartDataView
 from aplication.core.views.patient import PatientCreateView, PatientDeleteView, PatientDetailView, PatientListView, PatientUpdateView
 from aplication.core.views.tipoSangre import TipoSangreListView, TipoSangreCreateView, TipoSangreUpdateView, TipoSangreDeleteView, TipoSangreDetailView
 from aplication.core.views.especialidad import EspecialidadListView, EspecialidadCreateView, EspecialidadUpdateView, EspecialidadDeleteView, EspecialidadDetailView
@@ -11,13 +11,14 @@ from aplication.core.views.marcaMedicamento import MarcaMedicamentoListView, Mar
 from aplication.core.views.medicamento import MedicamentoListView, MedicamentoCreateView, MedicamentoUpdateView, MedicamentoDeleteView, MedicamentoDetailView 
 from aplication.core.views.diagnostico import DiagnosticoListView, DiagnosticoCreateView, DiagnosticoUpdateView, DiagnosticoDeleteView, DiagnosticoDetailView
 from aplication.core.views.auditUser import AuditUserListView
-from aplication.core.views.estadistica import  VistaEstadisticas
+from aplication.core.views.estadistica import  VistaEstadisticas, EstadisticasApiView, EstadisticasExportarView
  
  
 app_name='core' # define un espacio de nombre para la aplicacion
 urlpatterns = [
   # ruta principal
   path('', HomeTemplateView.as_view(),name='home'),
+  path('chart_data/', ChartDataView.as_view(),name='chart_data'),
   
   
   path('patient_list/',PatientListView.as_view() ,name="patient_list"),
@@ -93,4 +94,6 @@ urlpatterns = [
   
   # Estadisticas 
   path("estadisticas/", VistaEstadisticas.as_view(), name="estadisicas"),
+  path("estadisticas/api/", EstadisticasApiView.as_view(), name="estadisticas_api"),
+  path("estadisticas/exportar/<str:metrica>/", EstadisticasExportarView.as_view(), name="estadisticas_exportar"),
 ]
\ No newline at end of file
@@ -1,37 +1,61 @@
-from datetime import datetime
+import hashlib
+from datetime import date, datetime
 
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.db.models import Avg, Count, Sum
-from django.db.models.functions import (ExtractMonth, ExtractWeekDay,
-                                        ExtractYear)
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Sum
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.dateparse import parse_date
+from django.utils.decorators import method_decorator
+from django.views import View
 from django.views.generic import TemplateView
 
-from aplication.attention.models import CitaMedica, DetalleAtencion
-from aplication.core.models import Paciente
+from aplication.core.instance.demografia import Demografia
+from aplication.core.instance.estadisticas_citas import GRANULARIDADES, EstadisticasCitas
+from aplication.core.instance.estadisticas_rango import EstadisticasRango
+from aplication.core.instance.exportar_estadisticas import ExportacionEstadisticas
+from aplication.core.models import ResumenMedicamentos, ResumenPacientes
+from doctor.utils import get_version_datos
 
+# periodos máximos de la serie en una consulta del API
+MAX_PERIODOS = {"dia": 366 * 2, "semana": 53 * 10, "mes": 12 * 50}
 
+
+# Las estadísticas se leen de los resúmenes precalculados (ResumenCitas, ResumenPacientes,
+# ResumenMedicamentos), que mantiene refresh_statistics; nunca se recorren las tablas origen.
+# Las de citas salen de una sola consulta (EstadisticasCitas) y la distribución de edades
+# de la demografía en caché (Demografia).
 class VistaEstadisticas(LoginRequiredMixin, TemplateView):
     template_name = "core/estadisticas/estadisticas.html"
 
     def get_context_data(self, **kwargs):
         contexto = super().get_context_data(**kwargs)
         año_actual = datetime.now().year
-        total_citas = CitaMedica.objects.count()
+        citas = EstadisticasCitas.desde_resumen(año_actual)
+        demografia = Demografia.obtener()
 
         contexto.update(
             {
                 "title": "Estadísticas",
                 "año_actual": año_actual,
-                "total_citas": total_citas,
+                "total_citas": citas["total"],
                 "total_pacientes": self._get_total_pacientes(),
-                "citas_mensuales": list(self._get_citas_mensuales(año_actual)),
-                "citas_por_estado": list(self._get_citas_por_estado()),
-                "tasa_finalizacion": self._calcular_tasa_finalizacion(total_citas),
+                "citas_mensuales": citas["mensuales"],
+                "citas_por_estado": [
+                    {"estado": estado, "total": total}
+                    for estado, total in citas["por_estado"].items()
+                    if total
+                ],
+                "tasa_finalizacion": citas["tasa_finalizacion"],
                 "crecimiento_pacientes": list(self._get_crecimiento_pacientes()),
                 "pacientes_por_genero": list(self._get_pacientes_por_genero()),
-                "edad_promedio": self._get_edad_promedio(),
-                "citas_por_dia": list(self._get_citas_por_dia()),
-                "comparacion_citas": self._get_comparacion_citas(),
+                "edad_promedio": demografia["edad_promedio"],
+                "demografia": demografia,
+                "citas_por_dia": citas["por_dia"],
+                "comparacion_citas": citas["por_estado"],
                 "medicamentos_mas_recetados": list(
                     self._get_medicamentos_mas_recetados()
                 ),
@@ -41,75 +65,96 @@ class VistaEstadisticas(LoginRequiredMixin, TemplateView):
 
     @staticmethod
     def _get_total_pacientes():
-        return Paciente.objects.count()
+        return ResumenPacientes.objects.aggregate(total=Sum("total"))["total"] or 0
 
     @staticmethod
     def _get_medicamentos_mas_recetados(limit=10):
         return (
-            DetalleAtencion.objects.values("medicamento__nombre")
-            .annotate(total_recetado=Sum("cantidad"))
+            ResumenMedicamentos.objects.annotate(medicamento__nombre=F("nombre"))
+            .values("medicamento__nombre", "total_recetado")
             .order_by("-total_recetado")[:limit]
         )
 
-    @staticmethod
-    def _get_citas_mensuales(año):
-        return (
-            CitaMedica.objects.filter(fecha__year=año)
-            .annotate(mes=ExtractMonth("fecha"))
-            .values("mes")
-            .annotate(total=Count("id"))
-            .order_by("mes")
-        )
-
-    @staticmethod
-    def _get_citas_por_estado():
-        return CitaMedica.objects.values("estado").annotate(total=Count("id"))
-
-    @staticmethod
-    def _calcular_tasa_finalizacion(total_citas):
-        if not total_citas:
-            return 0
-        citas_completadas = CitaMedica.objects.filter(estado="R").count()
-        return round((citas_completadas / total_citas * 100), 2)
-
     @staticmethod
     def _get_crecimiento_pacientes():
         return (
-            Paciente.objects.annotate(
-                año=ExtractYear("fecha_nacimiento"),
-                mes=ExtractMonth("fecha_nacimiento"),
+            ResumenPacientes.objects.values(
+                año=F("anio_nacimiento"), mes=F("mes_nacimiento")
             )
-            .values("año", "mes")
-            .annotate(total=Count("id"))
+            .annotate(total=Sum("total"))
             .order_by("año", "mes")
         )
 
     @staticmethod
     def _get_pacientes_por_genero():
-        return Paciente.objects.values("sexo").annotate(total=Count("id"))
-
-    @staticmethod
-    def _get_edad_promedio():
-        return round(
-            Paciente.objects.annotate(
-                edad=ExtractYear(datetime.now()) - ExtractYear("fecha_nacimiento")
-            ).aggregate(promedio=Avg("edad"))["promedio"]
-            or 0,
-            1,
-        )
-
-    @staticmethod
-    def _get_citas_por_dia():
         return (
-            CitaMedica.objects.annotate(dia=ExtractWeekDay("fecha"))
-            .values("dia")
-            .annotate(total=Count("id"))
-            .order_by("dia")
+            ResumenPacientes.objects.values("sexo")
+            .annotate(total=Sum("total"))
+            .order_by("sexo")
         )
 
-    @staticmethod
-    def _get_comparacion_citas():
-        return {
-            estado: CitaMedica.objects.filter(estado=estado).count()
-            for estado in ["R", "C", "P"]
-        }
+
+# ?desde=AAAA-MM-DD&hasta=AAAA-MM-DD&granularidad=dia|semana|mes, por defecto del 1 de enero
+# a hoy por mes; devuelve (desde, hasta, granularidad, mensaje de error o None)
+def leer_rango(request):
+    hoy = date.today()
+    try:
+        desde = parse_date(request.GET.get("desde") or "") or hoy.replace(month=1, day=1)
+        hasta = parse_date(request.GET.get("hasta") or "") or hoy
+    except ValueError:
+        return None, None, None, "Las fechas deben tener el formato AAAA-MM-DD"
+    granularidad = request.GET.get("granularidad") or "mes"
+
+    if granularidad not in GRANULARIDADES:
+        return None, None, None, f"La granularidad debe ser una de: {', '.join(GRANULARIDADES)}"
+    if desde > hasta:
+        return None, None, None, "La fecha inicial no puede ser posterior a la final"
+    return desde, hasta, granularidad, None
+
+
+# API JSON de estadísticas para un rango de fechas (?desde=AAAA-MM-DD&hasta=AAAA-MM-DD&granularidad=dia|semana|mes).
+# La respuesta se guarda en caché con la versión de los datos y se envía con ETag:
+# mientras no cambien citas, pacientes o recetas, repetir la consulta no recalcula nada.
+@method_decorator(transaction.non_atomic_requests, name="dispatch")
+class EstadisticasApiView(LoginRequiredMixin, View):
+    def get(self, request, *args, **kwargs):
+        desde, hasta, granularidad, error = leer_rango(request)
+        if error:
+            return JsonResponse({"error": error}, status=400)
+        dias_por_periodo = {"dia": 1, "semana": 7, "mes": 28}[granularidad]
+        if (hasta - desde).days // dias_por_periodo > MAX_PERIODOS[granularidad]:
+            return JsonResponse({"error": "El rango es demasiado amplio para la granularidad indicada"}, status=400)
+
+        parametros = f"{desde.isoformat()}|{hasta.isoformat()}|{granularidad}"
+        version = get_version_datos("estadisticas")
+        etag = '"{}"'.format(hashlib.sha256(f"{version}|{parametros}".encode()).hexdigest()[:32])
+
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            datos = cache.get_or_set(
+                f"estadisticas_api_{version}_{parametros}",
+                lambda: EstadisticasRango.calcular(desde, hasta, granularidad),
+                settings.STATISTICS_API_CACHE_TTL,
+            )
+            response = JsonResponse(datos)
+            response["ETag"] = etag
+        patch_cache_control(response, private=True, max_age=settings.STATISTICS_API_MAX_AGE)
+        return response
+
+
+# Exportación en CSV de cada métrica de la vista de estadísticas y de las series de citas y
+# recetas (estas con ?desde, ?hasta y ?granularidad). El archivo se envía fila por fila
+# mientras se lee la base de datos, así exportar varios años usa la misma memoria que uno.
+@method_decorator(transaction.non_atomic_requests, name="dispatch")
+class EstadisticasExportarView(LoginRequiredMixin, View):
+    def get(self, request, metrica, *args, **kwargs):
+        if metrica not in ExportacionEstadisticas.get_metricas():
+            return JsonResponse({"error": "Métrica no encontrada"}, status=404)
+        desde, hasta, granularidad, error = leer_rango(request)
+        if error:
+            return JsonResponse({"error": error}, status=400)
+
+        exportacion = ExportacionEstadisticas(metrica, desde, hasta, granularidad)
+        response = StreamingHttpResponse(exportacion.generar_csv(), content_type="text/csv; charset=utf-8")
+        response["Content-Disposition"] = f'attachment; filename="{exportacion.get_nombre_archivo()}"'
+        return response
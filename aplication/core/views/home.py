@@ -1,12 +1,15 @@
+from django.conf import settings
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.core.cache import cache
 from django.http import JsonResponse
 from django.views import View
 from datetime import date, timedelta
 from django.views.generic import TemplateView
-from aplication.core.models import Paciente
-from aplication.attention.models import CitaMedica, Atencion
 from django.utils import timezone
-from django.db.models import Sum
-from aplication.attention.models import Pago  # Adjust the import path as necessary
+from aplication.attention.models import IngresoDiario
+from aplication.core.instance.contadores_inicio import ContadoresInicio
+from aplication.core.instance.estadisticas_citas import EstadisticasCitas
+from doctor.utils import get_version_datos
 
 class HomeTemplateView(TemplateView):
     template_name = 'core/home.html'
@@ -16,35 +19,46 @@ class HomeTemplateView(TemplateView):
         context["title"] = "SaludSync"
         context["title1"] = "Sistema Médico"
         context["title2"] = "Sistema Médico"
-        context["can_paci"] = Paciente.cantidad_pacientes()
-        context["ultimo_paciente"] = Paciente.objects.order_by('-id').first()
-        context["can_cita"] = CitaMedica.cantidad_cita()
-        context["proximas_citas"] = CitaMedica.objects.filter(fecha=date.today(), estado='P').order_by('hora_cita')
-        context["ultima_cita_completada"] = CitaMedica.objects.filter(estado='R').order_by('-fecha', '-hora_cita').first()
-        context["ultima_cita"] = CitaMedica.objects.order_by('-fecha', '-hora_cita').first()
-        context["can_atenciones"] = Atencion.cantidad_atenciones()
+        # contadores y últimos registros desde la caché (ver ContadoresInicio)
+        contadores = ContadoresInicio.obtener()
+        context["can_paci"] = contadores['pacientes']
+        context["can_cita"] = contadores['citas']
+        context["can_atenciones"] = contadores['atenciones']
+        context.update(ContadoresInicio.recientes())
         
-        # Calcular pagos de hoy
-        hoy = timezone.now().date()
-        pagos_hoy = Pago.objects.filter(fecha_pago__date=hoy, pagado=True).aggregate(total=Sum('monto'))['total'] or 0
-        context["pagos_hoy"] = pagos_hoy
+        # Pagos de hoy desde el resumen de ingresos diarios
+        hoy = timezone.localdate()
+        context["pagos_hoy"] = IngresoDiario.total_dia(hoy)
         
         return context
 
 
-class ChartDataView(View):
+# Histograma de citas para los gráficos: ?dias=7|30|365 y opcionalmente ?granularidad=dia|semana.
+# Se calcula con una consulta agrupada y se guarda en caché por ventana; la clave incluye la
+# versión de los datos de citas, así cualquier cambio en una cita descarta los histogramas.
+class ChartDataView(LoginRequiredMixin, View):
+    # días de la ventana y granularidad por defecto
+    VENTANAS = {7: 'dia', 30: 'dia', 365: 'semana'}
+
     def get(self, request, *args, **kwargs):
-        # Ejemplo: Cantidad de citas médicas por día en los últimos 7 días
+        try:
+            dias = int(request.GET.get('dias', 7))
+        except ValueError:
+            dias = None
+        if dias not in self.VENTANAS:
+            return JsonResponse({"error": f"dias debe ser uno de: {', '.join(map(str, self.VENTANAS))}"}, status=400)
+        granularidad = request.GET.get('granularidad') or self.VENTANAS[dias]
+        if granularidad not in ('dia', 'semana'):
+            return JsonResponse({"error": "granularidad debe ser dia o semana"}, status=400)
+
         today = date.today()
-        labels = []
-        data = []
-        for i in range(7):
-            day = today - timedelta(days=i)
-            labels.append(day.strftime('%d/%m'))
-            data.append(CitaMedica.objects.filter(fecha=day).count())
-        
+        clave = f"histograma_citas_{get_version_datos('citas')}_{today.isoformat()}_{dias}_{granularidad}"
+        serie = cache.get_or_set(
+            clave,
+            lambda: EstadisticasCitas.serie(today - timedelta(days=dias - 1), today, granularidad),
+            settings.APPOINTMENT_HISTOGRAM_CACHE_TTL,
+        )
         return JsonResponse({
-            "labels": labels[::-1],  # Invertir el orden para mostrar cronológicamente
-            "data": data[::-1]
+            "labels": [date.fromisoformat(fila['periodo']).strftime('%d/%m') for fila in serie],
+            "data": [fila['total'] for fila in serie],
         })
-
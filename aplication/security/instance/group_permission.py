@@ -1,20 +1,54 @@
-from aplication.security.models import User
+from crum import get_current_request
+from django.conf import settings
+from django.core.cache import cache
+from aplication.security.models import GroupModulePermission, User
 from aplication.security.models import Permission
+from doctor.utils import es_cache_local, get_version_datos
 
 
 class GroupPermission:
 
   @staticmethod
   # obtiene los permisos de cada menu de todos los grupos
-  # distinguiendo si es superusuario o no
-  def get_permission_dict_of_group(user: User):
+  # distinguiendo si es superusuario o no.
+  # El diccionario se guarda en cache por grupo con la version 'permisos' (que cambia al
+  # modificar permisos o asignaciones de modulos) y ademas se memoriza en el request,
+  # asi una pagina lo resuelve una sola vez. Con la cache local de cada proceso no se
+  # guarda entre requests: un permiso revocado en un worker seguiria vigente en los demas
+  def get_permission_dict_of_group(user: User, request=None):
+    request = request or get_current_request()
     if user.is_superuser:
-      permissions = list(Permission.objects.all().values_list('codename', flat=True))
-      permissions = {x: x for x in permissions if x not in (None, '')}
+      key, group_id = 'superuser', None
     else:
-      print("usuario=>", user)
-      group = user.get_group_session()
-      permissions = list(
-        group.groupmodulepermission_set.all().values_list('permissions__codename', flat=True))
-      permissions = {x: x for x in permissions if x not in (None, '')}
+      group_id = request.session.get('group_id') if request is not None else None
+      if group_id is None:
+        group_id = user.get_group_session().id
+      key = f'group_{group_id}'
+
+    memo = getattr(request, '_permission_dict', None)
+    if memo is not None and key in memo:
+      return memo[key]
+
+    if es_cache_local():
+      permissions = GroupPermission._load_permission_dict(group_id)
+    else:
+      permissions = cache.get_or_set(
+        f"permission_dict_{key}_{get_version_datos('permisos')}",
+        lambda: GroupPermission._load_permission_dict(group_id),
+        settings.PERMISSION_CACHE_TTL,
+      )
+    if request is not None:
+      if memo is None:
+        memo = request._permission_dict = {}
+      memo[key] = permissions
     return permissions
+
+  @staticmethod
+  # consulta los codenames: todos para el superusuario (group_id None) o los del grupo
+  def _load_permission_dict(group_id):
+    if group_id is None:
+      permissions = Permission.objects.values_list('codename', flat=True)
+    else:
+      permissions = GroupModulePermission.objects.filter(group_id=group_id).values_list(
+        'permissions__codename', flat=True)
+    return {x: x for x in permissions if x not in (None, '')}
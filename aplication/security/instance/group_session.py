@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.contrib.auth.models import Group
+from django.core.cache import cache
+from doctor.utils import get_ttl_cache, get_version_datos
+
+
+# grupo activo del usuario: en la session solo se guardan 'group_id' y 'group_name';
+# el Group se obtiene de la cache
+class GroupSession:
+
+  @staticmethod
+  # grupo por id desde la cache (la version 'grupos' cambia al modificar o eliminar grupos;
+  # con la cache local solo se guarda unos segundos porque la version no llega a otros procesos)
+  def get_group(group_id):
+    key = f"group_{group_id}_{get_version_datos('grupos')}"
+    group = cache.get(key)
+    if group is None:
+      group = Group.objects.filter(pk=group_id).first()
+      if group is not None:
+        cache.set(key, group, get_ttl_cache(settings.GROUP_CACHE_TTL))
+    return group
+
+  @staticmethod
+  # solo escribe lo que cambia: asignar el mismo valor marca la session como
+  # modificada y SessionMiddleware vuelve a guardar la fila en cada request
+  def set_active(session, group_id, group_name):
+    if session.get('group_id') != group_id:
+      session['group_id'] = group_id
+    if session.get('group_name') != group_name:
+      session['group_name'] = group_name
+
+  @staticmethod
+  # si no hay grupo activo se toma el primero del usuario
+  def ensure(request, user):
+    if 'group' in request.session:
+      # sesiones anteriores que guardaban el Group completo
+      del request.session['group']
+    if 'group_id' not in request.session:
+      group = user.groups.order_by('id').values('id', 'name').first()
+      if group is not None:
+        GroupSession.set_active(request.session, group['id'], group['name'])
+    return request.session.get('group_id')
+
+  @staticmethod
+  # cambia el grupo activo si el usuario pertenece al grupo indicado
+  def change(request, user, group_id):
+    try:
+      group_id = int(group_id)
+    except (TypeError, ValueError):
+      return
+    if group_id == request.session.get('group_id'):
+      return
+    group = user.groups.filter(pk=group_id).values('id', 'name').first()
+    if group is not None:
+      GroupSession.set_active(request.session, group['id'], group['name'])
@@ -33,7 +33,7 @@ class ListViewMixin(object):
 
   def _get_permission_dict_of_group(self):
     print("user:=", self.request.user)
-    return GroupPermission.get_permission_dict_of_group(self.request.user)
+    return GroupPermission.get_permission_dict_of_group(self.request.user, self.request)
 
 
 class CreateViewMixin(object):
@@ -46,7 +46,7 @@ class CreateViewMixin(object):
     return context
 
   def _get_permission_dict_of_group(self):
-    return GroupPermission.get_permission_dict_of_group(self.request.user)
+    return GroupPermission.get_permission_dict_of_group(self.request.user, self.request)
 
 
 class UpdateViewMixin(object):
@@ -61,7 +61,7 @@ class UpdateViewMixin(object):
     return context
 
   def _get_permission_dict_of_group(self):
-    return GroupPermission.get_permission_dict_of_group(self.request.user)
+    return GroupPermission.get_permission_dict_of_group(self.request.user, self.request)
 
 
 class DeleteViewMixin(object):
@@ -74,7 +74,7 @@ class DeleteViewMixin(object):
     return context
 
   def _get_permission_dict_of_group(self):
-    return GroupPermission.get_permission_dict_of_group(self.request.user)
+    return GroupPermission.get_permission_dict_of_group(self.request.user, self.request)
 
 
 # Permisos de urls o modulos
@@ -94,15 +94,14 @@ class PermissionMixin(object):
       if user.is_superuser:
         return super().get(request, *args, **kwargs)
 
-      group = user.get_group_session()
       permissions = self._get_permissions_to_validate()
 
       if not permissions.__len__():
         return super().get(request, *args, **kwargs)
 
-      if not group.groupmodulepermission_set.filter(
-        permissions__codename__in=permissions
-      ).exists():
+      # permisos del grupo desde la cache (el mismo diccionario que usa la plantilla)
+      group_permissions = GroupPermission.get_permission_dict_of_group(user, request)
+      if not any(permission in group_permissions for permission in permissions):
         print("no tengo permiso")
         messages.error(request, 'No tiene permiso para ingresar a este módulo')
         return redirect('home')
@@ -5,6 +5,7 @@ from django.contrib.auth.models import Group
 from django.contrib.auth.models import Permission
 from django.db import models
 from django.forms import model_to_dict
+from aplication.security.instance.group_session import GroupSession
 
 
 # ficha,prestamos,nomina
@@ -188,19 +189,11 @@ class User(AbstractUser):
 
   def get_group_session(self):
     request = get_current_request()
-    print("request==>", request)
-    return Group.objects.get(pk=request.session['group_id'])
+    return GroupSession.get_group(request.session['group_id'])
 
   def set_group_session(self):
     request = get_current_request()
-
-    if 'group' not in request.session:
-
-      groups = request.user.groups.all().order_by('id')
-
-      if groups.exists():
-        request.session['group'] = groups.first()
-        request.session['group_id'] = request.session['group'].id
+    GroupSession.ensure(request, self)
 
   def get_image(self):
     if self.image:
@@ -1,9 +1,11 @@
 from django.contrib.auth.models import Group
-from django.db.models.signals import post_save
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.auth.models import Permission
 from django.db.models.signals import post_migrate
-from aplication.security.models import User
+from aplication.security.models import GroupModulePermission, Menu, Module, User
+from doctor.utils import incrementar_version_datos
 
 
 @receiver(post_save, sender=User)
@@ -17,6 +19,34 @@ def assign_user_group(sender, instance, created, **kwargs):
     #     client_group, created = Group.objects.get_or_create(name='Clientes')
     #     instance.groups.add(client_group)
 
+# cualquier cambio en menus, modulos o sus asignaciones a grupos descarta los
+# arboles de menu guardados en cache (MenuModule)
+@receiver(post_save, sender=Menu)
+@receiver(post_delete, sender=Menu)
+@receiver(post_save, sender=Module)
+@receiver(post_delete, sender=Module)
+@receiver(post_save, sender=GroupModulePermission)
+@receiver(post_delete, sender=GroupModulePermission)
+def invalidate_menu(sender, **kwargs):
+  transaction.on_commit(lambda: incrementar_version_datos('menu'), robust=True)
+
+# grupos guardados en cache para la session (GroupSession)
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def invalidate_groups(sender, **kwargs):
+  transaction.on_commit(lambda: incrementar_version_datos('grupos'), robust=True)
+
+# los diccionarios de permisos guardados en cache (GroupPermission) se descartan al
+# cambiar los permisos de un modulo del grupo, sus asignaciones o los permisos existentes
+@receiver(m2m_changed, sender=GroupModulePermission.permissions.through)
+@receiver(post_save, sender=GroupModulePermission)
+@receiver(post_delete, sender=GroupModulePermission)
+@receiver(post_save, sender=Permission)
+@receiver(post_delete, sender=Permission)
+def invalidate_permissions(sender, **kwargs):
+  if kwargs.get('action', 'post_').startswith('post_'):
+    transaction.on_commit(lambda: incrementar_version_datos('permisos'), robust=True)
+
 # @receiver(post_save, sender=User)
 # def asignar_permisos(sender, instance, created, **kwargs):
 #     if created:
@@ -0,0 +1,4 @@
+# Carga la aplicación de Celery junto con Django para que @shared_task la utilice
+from doctor.celery import app as celery_app
+
+__all__ = ('celery_app',)
@@ -0,0 +1,11 @@
+import os
+from celery import Celery
+
+# Configuración de Celery para las tareas en segundo plano (confirmación de pagos, etc.)
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'doctor.settings')
+
+app = Celery('doctor')
+# Lee la configuración con prefijo CELERY_ desde settings.py
+app.config_from_object('django.conf:settings', namespace='CELERY')
+# Descubre los módulos tasks.py de las aplicaciones instaladas
+app.autodiscover_tasks()
@@ -59,6 +59,7 @@ MIDDLEWARE = [
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'crum.CurrentRequestUserMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -159,19 +160,112 @@ LOGIN_REDIRECT_URL = 'security:modules_list'
 # Si la autenticación se realiza correctamente, usa esta URL para redirigir:
 LOGOUT_REDIRECT_URL = 'core:home'
 
+# Caché: memoria local del proceso por defecto; con CACHE_LOCATION (redis://...) se comparte entre procesos
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get(
+            "CACHE_BACKEND",
+            "django.core.cache.backends.redis.RedisCache" if os.environ.get("CACHE_LOCATION") else "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        'LOCATION': os.environ.get("CACHE_LOCATION", ""),
+    }
+}
+# Con la caché local (LocMemCache) las invalidaciones no llegan a los otros procesos: los datos
+# versionados (menús, permisos, grupos, contadores del inicio) se guardan como máximo estos segundos
+LOCAL_CACHE_MAX_TTL = int(os.environ.get("LOCAL_CACHE_MAX_TTL", "5"))
+# Segundos que se guarda en caché el estado de pago de un paciente
+PAYMENT_STATUS_CACHE_TTL = int(os.environ.get("PAYMENT_STATUS_CACHE_TTL", "30"))
+# API de estadísticas: segundos que el cliente puede reutilizar la respuesta sin revalidar
+# y segundos que se guarda el resultado calculado (se descarta antes si cambian los datos)
+STATISTICS_API_MAX_AGE = int(os.environ.get("STATISTICS_API_MAX_AGE", "60"))
+STATISTICS_API_CACHE_TTL = int(os.environ.get("STATISTICS_API_CACHE_TTL", "3600"))
+# Segundos que se guarda el histograma de citas del inicio (se descarta antes si cambian las citas)
+APPOINTMENT_HISTOGRAM_CACHE_TTL = int(os.environ.get("APPOINTMENT_HISTOGRAM_CACHE_TTL", "3600"))
+
+# Segundos que se guardan los contadores y los últimos registros del inicio (se vuelven a contar al vencer)
+DASHBOARD_CACHE_TTL = int(os.environ.get("DASHBOARD_CACHE_TTL", "3600"))
+
+# Segundos que se guarda el menú de cada grupo (se descarta antes si cambian menús o módulos;
+# con la caché local se limita a LOCAL_CACHE_MAX_TTL)
+MENU_CACHE_TTL = int(os.environ.get("MENU_CACHE_TTL", "86400"))
+# Segundos que se guardan los permisos de cada grupo en la caché compartida (se descartan antes
+# si cambian); con la caché local no se guardan entre requests
+PERMISSION_CACHE_TTL = int(os.environ.get("PERMISSION_CACHE_TTL", "300"))
+# Segundos que se guarda cada grupo leído desde la session (se descarta antes si cambia;
+# con la caché local se limita a LOCAL_CACHE_MAX_TTL)
+GROUP_CACHE_TTL = int(os.environ.get("GROUP_CACHE_TTL", "86400"))
+# Calendario .ics de citas: días hacia atrás y hacia adelante que incluye, segundos que el
+# cliente puede reutilizarlo sin revalidar y segundos que se guarda el texto de cada día
+ICS_FEED_PAST_DAYS = int(os.environ.get("ICS_FEED_PAST_DAYS", "30"))
+ICS_FEED_FUTURE_DAYS = int(os.environ.get("ICS_FEED_FUTURE_DAYS", "180"))
+ICS_FEED_MAX_AGE = int(os.environ.get("ICS_FEED_MAX_AGE", "300"))
+ICS_FEED_CACHE_TTL = int(os.environ.get("ICS_FEED_CACHE_TTL", "86400"))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/4.2/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 # Configuración de envío de correos electrónicos
-EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
+# Para pruebas sin red: EMAIL_BACKEND=django.core.mail.backends.filebased.EmailBackend
+# (con EMAIL_FILE_PATH) o django.core.mail.backends.locmem.EmailBackend
+EMAIL_BACKEND = os.environ.get("EMAIL_BACKEND", "django.core.mail.backends.smtp.EmailBackend")
+EMAIL_FILE_PATH = os.environ.get("EMAIL_FILE_PATH", os.path.join(BASE_DIR, "correos"))
+EMAIL_TIMEOUT = int(os.environ.get("EMAIL_TIMEOUT", "10"))
 EMAIL_HOST = "smtp.gmail.com"
 EMAIL_PORT = 587
 EMAIL_USE_TLS = True
 EMAIL_HOST_USER = os.environ.get("EMAIL_HOST_USER")
 EMAIL_HOST_PASSWORD = os.environ.get("EMAIL_HOST_PASSWORD")
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
+# Bandeja de salida: correos por conexión SMTP, intentos máximos y espera base entre
+# reintentos en segundos (se duplica en cada intento)
+EMAIL_OUTBOX_BATCH_SIZE = int(os.environ.get("EMAIL_OUTBOX_BATCH_SIZE", "50"))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.environ.get("EMAIL_OUTBOX_MAX_ATTEMPTS", "5"))
+EMAIL_OUTBOX_RETRY_SECONDS = int(os.environ.get("EMAIL_OUTBOX_RETRY_SECONDS", "60"))
 
 PAYPAL_CLIENT_ID = os.environ.get("PAYPAL_CLIENT_ID")
-PAYPAL_SECRET = os.environ.get("PAYPAL_SECRET")
\ No newline at end of file
+PAYPAL_SECRET = os.environ.get("PAYPAL_SECRET")
+# Pasarela de pagos: "paypal" usa la API REST de PayPal; "local" simula la pasarela
+# sin salir a la red (desarrollo y pruebas de carga)
+PAYMENT_GATEWAY = os.environ.get("PAYMENT_GATEWAY", "paypal")
+PAYPAL_MODE = os.environ.get("PAYPAL_MODE", "sandbox")  # Cambiar a "live" en producción
+# Tiempos máximos (segundos) de conexión y de respuesta de la pasarela
+PAYMENT_GATEWAY_CONNECT_TIMEOUT = float(os.environ.get("PAYMENT_GATEWAY_CONNECT_TIMEOUT", "3.05"))
+PAYMENT_GATEWAY_READ_TIMEOUT = float(os.environ.get("PAYMENT_GATEWAY_READ_TIMEOUT", "15"))
+# Latencia simulada (segundos) de la pasarela local
+PAYMENT_GATEWAY_LOCAL_LATENCY = float(os.environ.get("PAYMENT_GATEWAY_LOCAL_LATENCY", "0"))
+# Horas durante las que se reintenta confirmar un pago aprobado que quedó sin confirmar
+PAYMENT_CONFIRM_MAX_AGE_HOURS = int(os.environ.get("PAYMENT_CONFIRM_MAX_AGE_HOURS", "24"))
+
+# Procesos que dibujan comprobantes en la exportación masiva (0 = uno por CPU)
+RECEIPT_EXPORT_WORKERS = int(os.environ.get("RECEIPT_EXPORT_WORKERS", "0"))
+
+# Configuración de Celery
+CELERY_BROKER_URL = os.environ.get("CELERY_BROKER_URL", "redis://localhost:6379/0")
+CELERY_RESULT_BACKEND = os.environ.get("CELERY_RESULT_BACKEND", None)
+CELERY_TASK_ALWAYS_EAGER = os.environ.get("CELERY_TASK_ALWAYS_EAGER", "False") == "True"
+CELERY_TIMEZONE = TIME_ZONE
+# Tareas periódicas (celery beat)
+CELERY_BEAT_SCHEDULE = {
+    "refrescar-estadisticas": {
+        "task": "aplication.core.tasks.refrescar_estadisticas",
+        "schedule": float(os.environ.get("STATISTICS_REFRESH_SECONDS", "300")),
+    },
+    "enviar-correos": {
+        "task": "aplication.attention.tasks.enviar_correos",
+        "schedule": float(os.environ.get("EMAIL_OUTBOX_SECONDS", "60")),
+    },
+    "enviar-recordatorios-citas": {
+        "task": "aplication.attention.tasks.enviar_recordatorios_citas",
+        "schedule": float(os.environ.get("APPOINTMENT_REMINDER_SECONDS", "3600")),
+    },
+    "confirmar-pagos-pendientes": {
+        "task": "aplication.attention.tasks.confirmar_pagos_pendientes",
+        "schedule": float(os.environ.get("PAYMENT_CONFIRM_SWEEP_SECONDS", "300")),
+    },
+    "reconciliar-contadores": {
+        "task": "aplication.core.tasks.reconciliar_contadores",
+        "schedule": float(os.environ.get("DASHBOARD_RECONCILE_SECONDS", "3600")),
+    },
+}
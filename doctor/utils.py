@@ -1,5 +1,9 @@
-from datetime import datetime
+import time
+from datetime import date, datetime
 from decimal import Decimal
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
 from django.core.exceptions import ValidationError
 from django.core.validators import RegexValidator
 from django.utils import timezone
@@ -30,6 +34,11 @@ def valida_cedula(value):
     if digito_verificador != int(cedula[9]):
         raise ValidationError('La cédula no es válida.')
       
+# Edad exacta en años cumplidos a la fecha indicada (hoy por defecto)
+def calcular_edad(fecha_nacimiento, hoy=None):
+    hoy = hoy or date.today()
+    return hoy.year - fecha_nacimiento.year - ((hoy.month, hoy.day) < (fecha_nacimiento.month, fecha_nacimiento.day))
+
 def valida_numero_entero_positivo(value):
     if not str(value).isdigit() or int(value) <= 0:
         raise ValidationError('Debe ingresar un número entero positivo válido.')
@@ -74,5 +83,33 @@ def ip_client_address(request):
         # case localhost o 127.0.0.1
         client_address = request.META['REMOTE_ADDR']
 
-    return client_address   
+    return client_address
+
+# Versión de un conjunto de datos (estadísticas, citas...) guardada en la caché.
+# Se usa en las claves de caché y en los ETag: al cambiar los datos se incrementa y todo lo
+# calculado con la versión anterior deja de usarse. Si la clave se pierde, la nueva versión
+# parte de la hora actual, así nunca se repite una versión ya entregada.
+def get_version_datos(nombre):
+    return cache.get_or_set(f'version_datos_{nombre}', time.time_ns, None)
+
+def incrementar_version_datos(nombre):
+    clave = f'version_datos_{nombre}'
+    try:
+        return cache.incr(clave)
+    except ValueError:
+        version = time.time_ns()
+        cache.set(clave, version, None)
+        return version
+
+# True si la caché por defecto es la memoria local de cada proceso (LocMemCache)
+def es_cache_local():
+    return isinstance(caches['default'], LocMemCache)
 
+# Segundos de caché para datos que se descartan con incrementar_version_datos o con
+# contadores en memoria. Con LocMemCache cada proceso tiene su propia caché y la nueva
+# versión solo llega al proceso que hizo el cambio; por eso el tiempo se limita a
+# LOCAL_CACHE_MAX_TTL y los demás procesos vuelven a leer la base de datos enseguida.
+def get_ttl_cache(ttl):
+    if es_cache_local():
+        return settings.LOCAL_CACHE_MAX_TTL if ttl is None else min(ttl, settings.LOCAL_CACHE_MAX_TTL)
+    return ttl